@@ -0,0 +1,216 @@
+import argparse
+import json
+import os.path
+import statistics
+import sys
+import tempfile
+import time
+
+from PIL import Image
+
+from benchmarks import synthetic
+from pycardcon import masking, render, template, util
+
+"""
+Benchmarks the renderer on the synthetic corpus. For every kind of card it times read_card, each draw_* stage on
+its own and render_card_json end to end, reporting the median of several warm runs, plus one cold end to end pass
+over the whole corpus. Text regions and frame layers are cached whole, so the stages that use those caches are
+timed twice: "uncached" empties them before every run, which is what a changed card costs, and "cached" is an
+unchanged card re-rendered. Masking a frame through several masks is timed on both masking backends. Results can be
+saved as a baseline and later runs compared against it:
+
+    python -m benchmarks.bench --save-baseline baseline.json
+    python -m benchmarks.bench --baseline baseline.json
+
+Run from the repository root.
+"""
+
+DEFAULT_REPEAT = 5
+DEFAULT_TOLERANCE = 0.15
+
+
+def time_call(fn, repeat, setup=None):
+    # setup runs before every call, outside the timing.
+    times = []
+    for _ in range(repeat):
+        if setup is not None:
+            setup()
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+    return statistics.median(times)
+
+
+def clear_render_caches():
+    render.TEXT_REGION_CACHE.clear()
+    template.TEMPLATE_CACHE.clear()
+
+
+def blank_card_image(card):
+    return Image.new("RGBA", (card.width, card.height), (0, 0, 0, 0))
+
+
+def bench_card(workspace, resource_dir, card_fn, output_dir, repeat):
+    card_path = os.path.join(workspace, card_fn)
+    card = util.read_card(card_path, resource_dir)
+
+    # Every draw stage gets a canvas with the stages before it already drawn, like in a real render.
+    after_art = render.draw_art(blank_card_image(card), card.art, workspace)
+    after_frames = render.draw_frame_layer(after_art.copy(), card.frames)
+    after_text = render.draw_text(after_frames.copy(), card, resource_dir)
+
+    def frame_layer():
+        return render.draw_frame_layer(after_art.copy(), card.frames)
+
+    def text():
+        return render.draw_text(after_frames.copy(), card, resource_dir)
+
+    def render_json():
+        return render.render_card_json(workspace, card_fn, resource_dir, output_dir)
+
+    return {
+        'read_card': time_call(lambda: util.read_card(card_path, resource_dir), repeat),
+        'draw_art': time_call(lambda: render.draw_art(blank_card_image(card), card.art, workspace), repeat),
+        'draw_frames': time_call(lambda: render.draw_frames(after_art.copy(), card.frames), repeat),
+        'draw_frame_layer/uncached': time_call(frame_layer, repeat, setup=template.TEMPLATE_CACHE.clear),
+        'draw_frame_layer/cached': time_call(frame_layer, repeat),
+        # Building a new template, with the frame groups it shares with other cards already cached.
+        'draw_frame_groups': time_call(lambda: render.draw_frame_groups(blank_card_image(card), card.frames), repeat),
+        'draw_text/uncached': time_call(text, repeat, setup=render.TEXT_REGION_CACHE.clear),
+        'draw_text/cached': time_call(text, repeat),
+        'draw_set_symbol': time_call(lambda: render.draw_set_symbol(after_text.copy(), card, resource_dir), repeat),
+        'draw_bottom_region': time_call(lambda: render.draw_bottom_region(after_text.copy(), card, resource_dir),
+                                        repeat),
+        'render_card_json/uncached': time_call(render_json, repeat, setup=clear_render_caches),
+        'render_card_json/cached': time_call(render_json, repeat)
+    }
+
+
+"""
+Times masking one card sized frame through 1, 2 and 4 masks, with a blend, on Pillow alone and, when numpy is
+installed, on the numpy backend.
+"""
+def bench_masks(repeat):
+    frame = synthetic.frame_image("#2244aa").resize(synthetic.CARD_SIZE)
+    blend = synthetic.gradient_blend().resize(synthetic.CARD_SIZE)
+    backends = ["pillow"] + (["numpy"] if masking.np is not None else [])
+    was_enabled = masking.enabled
+
+    results = {}
+    for count in (1, 2, 4):
+        masks = synthetic.strip_masks(count)
+        for backend in backends:
+            if backend == "numpy":
+                masking.enable()
+            else:
+                masking.disable()
+            results[f"masks/{count}/{backend}"] = time_call(
+                lambda: render.mask_frame_region(frame.copy(), masks, blend), repeat)
+    if was_enabled:
+        masking.enable()
+    else:
+        masking.disable()
+    return results
+
+
+def run_benchmarks(root, font_path=None, italic_font_path=None, copies=1, repeat=DEFAULT_REPEAT):
+    workspace, resource_dir, card_fns = synthetic.generate(root, font_path, italic_font_path, copies)
+    output_dir = os.path.join(root, "output")
+    os.makedirs(output_dir, exist_ok=True)
+
+    results = {}
+
+    # Cold: the first render of every card in a fresh process, caches empty.
+    start = time.perf_counter()
+    for fns in card_fns.values():
+        for card_fn in fns:
+            render.render_card_json(workspace, card_fn, resource_dir, output_dir)
+    results['corpus/cold_render_all'] = time.perf_counter() - start
+
+    for name, fns in card_fns.items():
+        for stage, seconds in bench_card(workspace, resource_dir, fns[0], output_dir, repeat).items():
+            results[f"{name}/{stage}"] = seconds
+    results.update(bench_masks(repeat))
+
+    start = time.perf_counter()
+    for fns in card_fns.values():
+        for card_fn in fns:
+            render.render_card_json(workspace, card_fn, resource_dir, output_dir)
+    results['corpus/warm_render_all'] = time.perf_counter() - start
+    return results
+
+
+"""
+Compares results against a baseline, returning rows of (benchmark, baseline seconds, seconds, ratio, regressed).
+A benchmark regresses when it is slower than its baseline by more than tolerance.
+"""
+def compare(results, baseline, tolerance=DEFAULT_TOLERANCE):
+    rows = []
+    for name, seconds in results.items():
+        base_seconds = baseline.get(name)
+        if base_seconds is None or base_seconds == 0:
+            rows.append((name, base_seconds, seconds, None, False))
+            continue
+        ratio = seconds / base_seconds
+        rows.append((name, base_seconds, seconds, ratio, ratio > 1 + tolerance))
+    return rows
+
+
+def print_results(results, baseline=None, tolerance=DEFAULT_TOLERANCE):
+    if baseline is None:
+        for name, seconds in results.items():
+            print(f"{name:<40}{seconds*1000:>10.2f}ms")
+        return 0
+
+    regressions = 0
+    print(f"{'benchmark':<40}{'baseline':>12}{'now':>12}{'ratio':>9}")
+    for name, base_seconds, seconds, ratio, regressed in compare(results, baseline, tolerance):
+        base_str = f"{base_seconds*1000:.2f}ms" if base_seconds is not None else "-"
+        ratio_str = f"{ratio:.2f}x" if ratio is not None else "-"
+        flag = "  SLOWER" if regressed else ""
+        print(f"{name:<40}{base_str:>12}{seconds*1000:>10.2f}ms{ratio_str:>9}{flag}")
+        regressions += regressed
+    if regressions > 0:
+        print(f"{regressions} benchmarks more than {tolerance:.0%} slower than the baseline.")
+    return regressions
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(prog="python -m benchmarks.bench",
+                                 description="time the renderer on a generated resource pack and card corpus")
+    ap.add_argument('--workdir', type=str, default=None, help="where to generate the corpus, a temp dir by default")
+    ap.add_argument('--font', type=str, default=None, help=".ttf used for every font, found in the system by default")
+    ap.add_argument('--italic-font', type=str, default=None, help=".ttf used for italics, --font by default")
+    ap.add_argument('--copies', type=int, default=1, help="copies of each corpus card in the end to end passes")
+    ap.add_argument('--repeat', type=int, default=DEFAULT_REPEAT, help="runs per benchmark, the median is reported")
+    ap.add_argument('--baseline', type=str, default=None, help="json file of earlier results to compare against")
+    ap.add_argument('--save-baseline', type=str, default=None, help="write the results to this json file")
+    ap.add_argument('--tolerance', type=float, default=DEFAULT_TOLERANCE,
+                    help="fraction slower than the baseline that counts as a regression")
+    args = ap.parse_args(argv)
+
+    if args.workdir is not None:
+        results = run_benchmarks(args.workdir, args.font, args.italic_font, args.copies, args.repeat)
+    else:
+        with tempfile.TemporaryDirectory() as workdir:
+            results = run_benchmarks(workdir, args.font, args.italic_font, args.copies, args.repeat)
+
+    settings = {'copies': args.copies, 'repeat': args.repeat}
+    baseline = None
+    if args.baseline is not None:
+        with open(args.baseline, 'rb') as baseline_f:
+            baseline_file = json.load(baseline_f)
+        baseline = baseline_file['results']
+        if baseline_file.get('settings', settings) != settings:
+            print(f"warning: baseline was run with {baseline_file['settings']}, this run with {settings}.")
+    regressions = print_results(results, baseline, args.tolerance)
+
+    if args.save_baseline is not None:
+        with open(args.save_baseline, 'w') as baseline_f:
+            json.dump({'settings': settings, 'results': results}, baseline_f, indent=1)
+        print(f"saved: {args.save_baseline}")
+    return 1 if regressions > 0 else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,315 @@
+import json
+import os.path
+import shutil
+
+from PIL import Image, ImageDraw, ImageFilter
+
+"""
+Generates a self-contained resource directory and card workspace for benchmarking. Frames, masks and art are flat
+color images drawn here, mana symbols are small svgs and every font is a copy of one system font, so nothing
+outside this file is needed beyond a .ttf.
+
+The corpus covers the shapes of card the renderer handles differently: a vanilla card, long rules text that has
+to shrink, a planeswalker with four abilities, a saga with three chapters, and a card with masked and blended
+frames.
+"""
+
+CARD_SIZE = (750, 1050)
+FRAME_SIZE = (300, 420)
+
+FONT_DIRS = ["/usr/share/fonts", "/usr/local/share/fonts", os.path.expanduser("~/.fonts"), "/Library/Fonts",
+             "/System/Library/Fonts", "C:\\Windows\\Fonts"]
+FONT_PREFERENCE = ["DejaVuSans.ttf", "LiberationSans-Regular.ttf", "Arial.ttf", "arial.ttf", "Helvetica.ttf"]
+FONT_FNS = ["gotham-medium.ttf", "beleren-bsc.ttf", "beleren-b.ttf", "mplantin.ttf", "plantin-semibold.otf"]
+
+SYMBOL_COLORS = {"w": "#f8f6d8", "u": "#0e68ab", "b": "#150b00", "r": "#d3202a", "g": "#00733e", "c": "#ccc2c0",
+                 "t": "#cac5c0", "x": "#cac5c0", "s": "#aaaaaa"}
+
+LONG_TEXT = ("Flying, {cardname} can't be blocked. {T}: Add {W}{U}. When {cardname} enters the battlefield, draw two "
+             "cards, then discard a card.\n{2}{R}, {T}: {cardname} deals 3 damage to any target. {i}This is flavor "
+             "text that rambles on for quite a while, so the rules box has to shrink its font to fit.{/i}")
+
+
+def find_system_font():
+    found = []
+    for font_dir in FONT_DIRS:
+        for dir_path, _, file_names in os.walk(font_dir):
+            found.extend(os.path.join(dir_path, fn) for fn in file_names if fn.lower().endswith(".ttf"))
+    for preferred in FONT_PREFERENCE:
+        for font_path in found:
+            if os.path.basename(font_path) == preferred:
+                return font_path
+    if len(found) == 0:
+        raise FileNotFoundError(f"no .ttf font found in {', '.join(FONT_DIRS)}, pass one in explicitly.")
+    return sorted(found)[0]
+
+
+def save_image(path, img):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    img.save(path)
+
+
+def frame_image(color, window=True):
+    # A solid frame with a transparent art window, like a real card frame.
+    img = Image.new("RGBA", FRAME_SIZE, color)
+    if window:
+        w, h = FRAME_SIZE
+        ImageDraw.Draw(img).rectangle((int(0.07*w), int(0.11*h), int(0.93*w), int(0.53*h)), fill=(0, 0, 0, 0))
+    return img
+
+
+def right_half_mask():
+    img = Image.new("RGBA", FRAME_SIZE, (0, 0, 0, 0))
+    ImageDraw.Draw(img).rectangle((FRAME_SIZE[0]//2, 0, FRAME_SIZE[0], FRAME_SIZE[1]), fill=(255, 255, 255, 255))
+    return img
+
+
+def border_mask():
+    img = Image.new("RGBA", FRAME_SIZE, (0, 0, 0, 0))
+    ImageDraw.Draw(img).rectangle((0, 0, FRAME_SIZE[0]-1, FRAME_SIZE[1]-1), outline=(255, 255, 255, 255), width=30)
+    return img
+
+
+def gradient_blend():
+    img = Image.new("RGBA", FRAME_SIZE, (255, 255, 255, 255))
+    draw = ImageDraw.Draw(img)
+    for x in range(FRAME_SIZE[0]):
+        draw.line((x, 0, x, FRAME_SIZE[1]), fill=(255, 255, 255, int(255*x/FRAME_SIZE[0])))
+    return img
+
+
+def strip_masks(count, size=CARD_SIZE):
+    # count vertical strips across size, each overlapping the next, with antialiased edges like rasterized masks.
+    masks = []
+    strip_w = size[0] // count
+    for i in range(count):
+        alpha = Image.new("L", size, 0)
+        ImageDraw.Draw(alpha).rectangle((i*strip_w - 10, 0, (i+1)*strip_w + 10, size[1]), fill=255)
+        alpha = alpha.filter(ImageFilter.GaussianBlur(2))
+        masks.append(Image.merge("RGBA", (alpha, alpha, alpha, alpha)))
+    return masks
+
+
+def write_json(path, obj):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'w') as json_f:
+        json.dump(obj, json_f, indent=1)
+
+
+def text_fields():
+    return {
+        "display-title": {"x": 0.08, "y": 0.04, "width": 0.8, "height": 0.05, "size": 0.04, "font": "beleren-b.ttf"},
+        "type": {"x": 0.08, "y": 0.56, "width": 0.8, "height": 0.05, "size": 0.035, "font": "beleren-b.ttf"},
+        "rules": {"x": 0.09, "y": 0.63, "width": 0.82, "height": 0.27, "size": 0.04, "font": "mplantin.ttf",
+                  "dropShadows": True},
+        "pt": {"x": 0.8, "y": 0.9, "width": 0.1, "height": 0.04, "size": 0.035, "font": "beleren-b.ttf",
+               "align": "center"}
+    }
+
+
+def card_defaults():
+    return {
+        "defaultSetSymbol": {"x": 0.85, "y": 0.56, "zoom": 0.8},
+        "defaultBottomInfo": {
+            "topLeft": {"x": 0.05, "y": 0.94, "size": 0.018},
+            "midLeft": {"y": 0.96, "size": 0.018, "color": "white"},
+            "bottomLeft": {"y": 0.98, "text": "NOT FOR SALE", "color": "white"}
+        }
+    }
+
+
+def full_bounds():
+    return {"defaultBounds": {"x": 0, "y": 0, "width": 1, "height": 1}}
+
+
+def generate_resources(resource_dir, font_path, italic_font_path=None):
+    for font_fn in FONT_FNS:
+        save_font = os.path.join(resource_dir, "fonts", font_fn)
+        os.makedirs(os.path.dirname(save_font), exist_ok=True)
+        shutil.copy(font_path, save_font)
+    shutil.copy(italic_font_path or font_path, os.path.join(resource_dir, "fonts", "mplantin-i.ttf"))
+
+    symbol_dir = os.path.join(resource_dir, "manaSymbols")
+    os.makedirs(symbol_dir, exist_ok=True)
+    for name in list(SYMBOL_COLORS) + [str(i) for i in range(11)] + ["wu", "artistbrush"]:
+        width = 60 if name == "artistbrush" else 32
+        color = SYMBOL_COLORS.get(name, "#cac5c0")
+        with open(os.path.join(symbol_dir, f"{name}.svg"), 'w') as svg_f:
+            svg_f.write(f'<svg xmlns="http://www.w3.org/2000/svg" width="{width}" height="32" '
+                        f'viewBox="0 0 {width} 32"><ellipse cx="{width/2}" cy="16" rx="{width/2}" ry="16" '
+                        f'fill="{color}"/></svg>')
+
+    save_image(os.path.join(resource_dir, "setSymbols", "BEN", "BEN_common.png"),
+               Image.new("RGBA", (40, 40), (200, 30, 30, 255)))
+
+    # Regular frames, with masks and a blend for split style cards.
+    m15 = os.path.join(resource_dir, "frames", "m15")
+    save_image(os.path.join(m15, "r.png"), frame_image((180, 40, 30, 255)))
+    save_image(os.path.join(m15, "u.png"), frame_image((30, 60, 180, 255)))
+    save_image(os.path.join(m15, "pt.png"), Image.new("RGBA", (60, 30), (200, 200, 200, 255)))
+    save_image(os.path.join(m15, "pinline.png"), border_mask())
+    save_image(os.path.join(m15, "half.png"), right_half_mask())
+    save_image(os.path.join(m15, "grad.png"), gradient_blend())
+    with open(os.path.join(m15, "half.svg"), 'w') as svg_f:
+        svg_f.write(f'<svg xmlns="http://www.w3.org/2000/svg" width="{FRAME_SIZE[0]}" height="{FRAME_SIZE[1]}">'
+                    f'<rect x="{FRAME_SIZE[0]//2}" width="{FRAME_SIZE[0]//2}" height="{FRAME_SIZE[1]}" fill="white"/>'
+                    f'</svg>')
+    write_json(os.path.join(m15, "frame_pack_meta.json"), {
+        "frames": {
+            "Red Frame": {"path": "r.png", "defaultGroup": "main"},
+            "Blue Frame": {"path": "u.png", "defaultGroup": "main"},
+            "Red PT": {"path": "pt.png", "defaultGroup": "pt"}
+        },
+        "masks": {
+            "Pinline": {"path": "pinline.png", "defaultGroup": "fullMask"},
+            "Right Half": {"path": "half.svg", "defaultGroup": "fullMask"},
+            "Right Half PNG": {"path": "half.png", "defaultGroup": "fullMask"}
+        },
+        "defaultGroups": {
+            "main": {**full_bounds(), **card_defaults(), "defaultTextFields": text_fields(),
+                     "defaultComplementary": [{"framePack": "m15", "frame": "Red PT"}]},
+            "pt": {"defaultBounds": {"x": 0.78, "y": 0.89, "width": 0.15, "height": 0.06}},
+            "fullMask": full_bounds()
+        }
+    })
+
+    planeswalker = os.path.join(resource_dir, "frames", "planeswalker")
+    save_image(os.path.join(planeswalker, "pw.png"), frame_image((90, 90, 90, 255)))
+    save_image(os.path.join(planeswalker, "even.png"), Image.new("RGBA", (300, 10), (0, 0, 0, 255)))
+    save_image(os.path.join(planeswalker, "odd.png"), Image.new("RGBA", (300, 10), (255, 255, 255, 255)))
+    save_image(os.path.join(planeswalker, "up.png"), Image.new("RGBA", (105, 51), (230, 230, 230, 255)))
+    save_image(os.path.join(planeswalker, "down.png"), Image.new("RGBA", (105, 51), (40, 40, 40, 255)))
+    write_json(os.path.join(planeswalker, "frame_pack_meta.json"), {
+        "frames": {
+            "PW Frame": {"path": "pw.png", "defaultGroup": "pw"},
+            "Ability Line Even": {"path": "even.png", "defaultGroup": "abilityLines"},
+            "Ability Line Odd": {"path": "odd.png", "defaultGroup": "abilityLines"},
+            "Loyalty Up": {"path": "up.png", "defaultGroup": "loyalty"},
+            "Loyalty Down": {"path": "down.png", "defaultGroup": "loyalty"}
+        },
+        "masks": {},
+        "defaultGroups": {
+            "pw": {**full_bounds(), **card_defaults(), "defaultTextFields": text_fields(),
+                   "defaultPWRegion": {"bounds": {"x": 0.1, "y": 0.62, "width": 0.8, "height": 0.3},
+                                       "textOffsetX": 0.02, "textOffsetY": 0.01, "size": 0.03,
+                                       "font": "mplantin.ttf"}},
+            "abilityLines": {"defaultBounds": {"x": 0, "y": 0, "width": 1, "height": 0.006}},
+            "loyalty": {"defaultBounds": {"x": 0, "y": 0, "width": 0.1, "height": 0.07}}
+        }
+    })
+
+    saga = os.path.join(resource_dir, "frames", "saga")
+    save_image(os.path.join(saga, "saga.png"), frame_image((200, 180, 140, 255)))
+    save_image(os.path.join(saga, "sagaDivider.png"), Image.new("RGBA", (200, 8), (60, 40, 20, 255)))
+    save_image(os.path.join(saga, "sagaChapter.png"), Image.new("RGBA", (40, 44), (20, 20, 20, 255)))
+    save_image(os.path.join(saga, "textarea.png"), right_half_mask())
+    write_json(os.path.join(saga, "frame_pack_meta.json"), {
+        "frames": {"Saga Frame": {"path": "saga.png", "defaultGroup": "saga"}},
+        "masks": {"saga Text Area Full": {"path": "textarea.png", "defaultGroup": "fullMask"}},
+        "defaultGroups": {
+            "saga": {**full_bounds(), **card_defaults(), "defaultTextFields": text_fields(),
+                     "defaultChapterRegion": {"x": 0.55, "y": 0.15, "width": 0.38, "height": 0.7, "size": 0.03,
+                                              "font": "mplantin.ttf", "verticalAlign": "center"}},
+            "sagaBar": {"defaultBounds": {"x": 0.5, "y": 0, "width": 0.45, "height": 0.008}},
+            "sagaChapter": {"defaultBounds": {"x": 0.46, "y": 0, "width": 0.06, "height": 0.06}},
+            "fullMask": full_bounds()
+        }
+    })
+
+
+def base_card(title):
+    return {
+        "card": {"width": CARD_SIZE[0], "height": CARD_SIZE[1]},
+        "art": {"src": "img/art.png", "x": 0.07, "y": 0.11, "zoom": 1.0, "artist": "Bench Artist"},
+        "setSymbol": {},
+        "infoSet": "BEN",
+        "infoRarity": "common",
+        "infoNumber": "001/100",
+        "infoLanguage": "EN",
+        "textRegions": {"display-title": {"text": title}}
+    }
+
+
+def main_frame(frame="Red Frame"):
+    return {"framePack": "frames/m15", "frame": frame, "usingTexts": ["display-title", "type", "rules", "pt"],
+            "usingSetSymbol": True, "usingBottomInfo": True}
+
+
+def corpus(resource_dir):
+    cards = {}
+
+    card = base_card("Vanilla Bear")
+    card["frames"] = [main_frame()]
+    card["textRegions"].update({"type": {"text": "Creature - Bear"}, "rules": {"text": ""}, "pt": {"text": "2/2"}})
+    cards["vanilla"] = card
+
+    card = base_card("Wordy Wizard")
+    card["frames"] = [main_frame()]
+    card["textRegions"].update({"type": {"text": "Creature - Human Wizard"}, "rules": {"text": LONG_TEXT},
+                                "pt": {"text": "1/4"}})
+    cards["long_rules"] = card
+
+    card = base_card("Split Thing")
+    m15 = os.path.join(resource_dir, "frames", "m15")
+    card["frames"] = [
+        main_frame(),
+        {"framePack": "frames/m15", "frame": "Blue Frame",
+         "masks": [{"framePack": "frames/m15", "mask": "Right Half"}, {"framePack": "frames/m15", "mask": "Pinline"}]},
+        {"framePack": "frames/m15", "frame": "Blue Frame", "blend": {"fn": os.path.join(m15, "grad.png")},
+         "masks": [{"framePack": "frames/m15", "mask": "Right Half PNG"}]}
+    ]
+    card["textRegions"].update({"type": {"text": "Instant"}, "pt": {"text": ""},
+                                "rules": {"text": "Counter target spell. {X}{C}{S}{0}{1}{10}{W/U}{B}{G}"}})
+    cards["masked_blended"] = card
+
+    card = base_card("Walker")
+    card["frames"] = [{"framePack": "frames/planeswalker", "frame": "PW Frame", "usingTexts": ["display-title", "type"],
+                       "usingSetSymbol": True, "usingBottomInfo": True, "usingPWTexts": ["a1", "a2", "a3", "a4"],
+                       "pwRegion": {}}]
+    card["textRegions"]["type"] = {"text": "Legendary Planeswalker"}
+    for i, loyalty in enumerate(["Loyalty Up", "Loyalty Down", "none", "Loyalty Up"]):
+        card["textRegions"][f"a{i+1}"] = {"text": f"Ability {i+1}: draw a card. {{T}}", "loyaltySymbol": loyalty,
+                                          "dropShadows": False, "loyaltyText": f"+{i}"}
+    cards["planeswalker"] = card
+
+    card = base_card("Sagaish")
+    card["frames"] = [{"framePack": "frames/saga", "frame": "Saga Frame", "usingTexts": ["display-title", "type"],
+                       "usingSetSymbol": True, "usingBottomInfo": True, "saga": {"chapters": ["c1", "c2", "c3"]}}]
+    card["textRegions"].update({
+        "type": {"text": "Enchantment - Saga"},
+        "c1": {"text": "Create a token.", "chapterSymbols": ["I"]},
+        "c2": {"text": "Draw a card.", "chapterSymbols": ["II", "III"]},
+        "c3": {"text": "Exile it.", "chapterSymbols": []}
+    })
+    cards["saga"] = card
+    return cards
+
+
+"""
+Builds root/resources and root/workspace, the latter holding the art and copies of every corpus card. Returns the
+workspace and resource directories and the card file names, grouped by corpus card.
+"""
+def generate(root, font_path=None, italic_font_path=None, copies=1):
+    shutil.rmtree(root, ignore_errors=True)
+    resource_dir = os.path.join(root, "resources")
+    workspace = os.path.join(root, "workspace")
+    generate_resources(resource_dir, font_path or find_system_font(), italic_font_path)
+
+    art = Image.new("RGB", (600, 440))
+    draw = ImageDraw.Draw(art)
+    for y in range(art.size[1]):
+        draw.line((0, y, art.size[0], y), fill=(y % 256, 100, 200 - y % 200))
+    save_image(os.path.join(workspace, "img", "art.png"), art)
+
+    card_fns = {}
+    for name, card in corpus(resource_dir).items():
+        card_fns[name] = []
+        for copy_idx in range(copies):
+            copy_card = json.loads(json.dumps(card))
+            if copy_idx > 0:
+                title = copy_card["textRegions"]["display-title"]["text"]
+                copy_card["textRegions"]["display-title"]["text"] = f"{title} {copy_idx+1}"
+            card_fn = f"{name}-{copy_idx+1}.json"
+            write_json(os.path.join(workspace, card_fn), {"data": copy_card})
+            card_fns[name].append(card_fn)
+    return workspace, resource_dir, card_fns
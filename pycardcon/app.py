@@ -1,6 +1,26 @@
+import array
 import dearpygui.dearpygui as dpg
 import os
-from pycardcon import util
+from pycardcon import render, util
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# The preview window shows cards at this fraction of their size, so that is the size they are rendered at.
+PREVIEW_SCALE = 0.40
+
+
+def texture_data(card_img):
+    # The card's RGBA channels as floats from 0 to 1, the way dpg takes texture data, converted in bulk rather than a
+    # channel at a time. Without numpy, each band is scaled as a float image and laid into the array by stride.
+    if np is not None:
+        return np.frombuffer(card_img.tobytes(), dtype=np.uint8).astype(np.float32) / 255
+    data = array.array('f', bytes(4 * card_img.width * card_img.height * 4))
+    for band_n, band in enumerate(card_img.split()):
+        data[band_n::4] = array.array('f', band.convert("F").point(lambda v: v * (1 / 255)).tobytes())
+    return data
 
 def run(root_dir, resource_dir, out_dir):
     dpg.create_context()
@@ -8,12 +28,14 @@ def run(root_dir, resource_dir, out_dir):
 
     def card_click_callback(sender, app_data, user_data):
         card_path = f"{root_dir}/{user_data['card_fn']}"
-        card_obj = util.read_card(card_path, resource_dir)['data']
+        card = util.read_card(card_path, resource_dir)
         # card_ui_info = list(reversed(util.read_card_for_gui(card_path, resource_dir)))
         card_ui_info = util.read_card_for_gui(card_path, resource_dir)
-        card_img_path = f"{out_dir}/{card_obj['textRegions']['display-title']['text']}.png"
 
-        width, height, channels, data = dpg.load_image(card_img_path)
+        # Rendered straight into the texture instead of reading the watcher's output back from out_dir.
+        card_img = render.render_card(card, root_dir, resource_dir, scale=PREVIEW_SCALE)
+        width, height = card_img.size
+        data = texture_data(card_img)
 
         # dpg.delete_item("card_img_tag", children_only=False)
         if dpg.does_alias_exist("card_img_tag"):
@@ -21,8 +43,8 @@ def run(root_dir, resource_dir, out_dir):
         with dpg.texture_registry():
             dpg.add_static_texture(width=width, height=height, default_value=data, tag="card_img_tag")
 
-        card_w = int(card_obj['card']['width'] * 0.40)
-        card_h = int(card_obj['card']['height'] * 0.40)
+        card_w = width
+        card_h = height
         card_win_x = int(1200 - card_w * 1.05)
         card_data_w = card_win_x - 200
 
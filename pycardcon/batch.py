@@ -0,0 +1,283 @@
+import argparse
+import cProfile
+import hashlib
+import json
+import os.path
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from pycardcon import instrument, manifest, output, render, svg, template, tiled, util
+
+"""
+Renders every card file found under a workspace root across a pool of worker processes. Output files keep the
+directory layout of the workspace, so cards from different lists in the same root don't overwrite each other.
+"""
+
+# Cards rendered ahead of their background writes in a single process run, see render_all.
+MAX_PENDING_WRITES = 2
+
+
+def is_card_file(path):
+    try:
+        with open(path, 'rb') as card_f:
+            card = json.load(card_f)
+    except (OSError, ValueError):
+        return False
+    return isinstance(card, dict) and isinstance(card.get('data'), dict) and 'frames' in card['data']
+
+
+def find_card_files(root_dir, exclude_dirs=()):
+    excluded = {os.path.abspath(d) for d in exclude_dirs}
+    card_paths = []
+    for dir_path, dir_names, file_names in os.walk(root_dir):
+        dir_names[:] = sorted(d for d in dir_names if os.path.abspath(os.path.join(dir_path, d)) not in excluded)
+        for file_name in sorted(file_names):
+            card_path = os.path.join(dir_path, file_name)
+            if file_name.endswith(".json") and file_name != "frame_pack_meta.json" and is_card_file(card_path):
+                card_paths.append(card_path)
+    return card_paths
+
+
+def init_worker(resource_dir, svg_cache_dir, fp_meta=None, file_digests=None, template_cache_dir=None):
+    # Runs once per worker process. The asset, svg, template and font caches are process wide, so everything decoded
+    # while rendering one card stays warm for the rest of the cards handed to the same worker.
+    if fp_meta is not None:
+        util.seed_fp_meta(fp_meta)
+    if file_digests is not None:
+        manifest.seed_file_digests(file_digests)
+    if svg_cache_dir is not None:
+        svg.enable_disk_cache(svg_cache_dir)
+    if template_cache_dir is not None:
+        template.enable_disk_cache(template_cache_dir)
+
+
+"""
+Renders a single card into the mirror of its directory under output_dir. When previous_hash matches the card's
+current build hash and the output exists, the render is skipped.
+
+With a profile_dir the render is instrumented. The per-stage profile goes into the result and a cProfile dump of
+the card is written to profile_dir. With a band_height the card is rendered band by band (see tiled.py). With a
+writer (output.ImageWriter) the image is encoded and written in the background, the result then holds the write's
+future under 'write' until finish_write waits for it.
+"""
+def render_one(card_path, root_dir, resource_dir, output_dir, previous_hash=None, output_options=output.DEFAULT_OUTPUT,
+               profile_dir=None, band_height=None, writer=None):
+    if profile_dir is not None:
+        profiler = instrument.Profiler()
+        c_profile = cProfile.Profile()
+        with instrument.profiling(profiler):
+            c_profile.enable()
+            result = render_one(card_path, root_dir, resource_dir, output_dir, previous_hash, output_options,
+                                band_height=band_height)
+            c_profile.disable()
+        result['profile'] = profiler.finish()
+
+        card_digest = hashlib.sha1(os.path.abspath(card_path).encode("utf-8")).hexdigest()[:16]
+        result['cprofile'] = os.path.join(profile_dir, f"{card_digest}.prof")
+        c_profile.dump_stats(result['cprofile'])
+        return result
+
+    card_dir = os.path.dirname(card_path)
+    card_out_dir = os.path.join(output_dir, os.path.relpath(card_dir, root_dir))
+    result = {
+        'card': card_path,
+        'output': None,
+        'error': None,
+        'skipped': False,
+        'hash': None,
+        'deps': [],
+        'digests': {}
+    }
+
+    start = time.perf_counter()
+    try:
+        with instrument.stage("read_card"):
+            card = util.read_card(card_path, resource_dir)
+        deps = render.card_dependencies(card, card_dir, resource_dir)
+        output_path = os.path.join(card_out_dir, render.card_output_fn(card, output_options))
+        build_hash = manifest.card_hash(card_path, card, deps, output_options)
+
+        if build_hash != previous_hash or not os.path.exists(output_path):
+            os.makedirs(card_out_dir, exist_ok=True)
+            if band_height is not None:
+                tiled.render_card_tiled(card, card_dir, resource_dir, output_path, output_options, band_height)
+            elif writer is not None:
+                result['write'] = writer.write(render.render_card_image(card, card_dir, resource_dir), output_path,
+                                               output_options)
+            else:
+                output.write_image(render.render_card_image(card, card_dir, resource_dir), output_path, output_options)
+        else:
+            result['skipped'] = True
+
+        result['output'] = output_path
+        result['hash'] = build_hash
+        result['deps'] = deps
+        result['digests'] = {dep: manifest.file_digests[dep] for dep in deps if dep in manifest.file_digests}
+    except Exception as e:
+        result['error'] = f"{type(e).__name__}: {e}"
+    result['seconds'] = time.perf_counter() - start
+    return result
+
+
+def finish_write(result):
+    # Waits for the card's background write, if it has one. A failed write fails the card.
+    write = result.pop('write', None)
+    if write is not None:
+        try:
+            write.result()
+        except Exception as e:
+            result['error'] = f"{type(e).__name__}: {e}"
+    return result
+
+
+def render_all(root_dir, resource_dir, output_dir, jobs=None, svg_cache_dir=None, on_result=None, force=False,
+               template_cache_dir=None, output_options=output.DEFAULT_OUTPUT, profile_dir=None, profile_top=5,
+               band_height=None):
+    card_paths = find_card_files(root_dir, exclude_dirs=[resource_dir, output_dir])
+    results = []
+
+    # Frame pack meta is parsed once here and handed to every worker, instead of once per worker and card.
+    fp_meta = util.preload_fp_meta(resource_dir)
+
+    os.makedirs(output_dir, exist_ok=True)
+    build_manifest = manifest.BuildManifest.for_output_dir(output_dir)
+    previous_hashes = {} if force else build_manifest.hashes_by_card()
+    if profile_dir is not None:
+        os.makedirs(profile_dir, exist_ok=True)
+    init_args = (resource_dir, svg_cache_dir, fp_meta, dict(manifest.file_digests), template_cache_dir)
+
+    def collect(result):
+        results.append(result)
+        if result['error'] is None:
+            manifest.file_digests.update(result['digests'])
+            build_manifest.record(result['output'], result['card'], result['hash'], result['deps'])
+        if on_result is not None:
+            on_result(result)
+
+    def previous_hash(card_path):
+        return previous_hashes.get(os.path.abspath(card_path))
+
+    if jobs == 1:
+        # In one process each card is encoded and written on a background thread while the next one renders. A card
+        # is only collected, and so recorded in the manifest, once its file is written. Profiled runs write inline
+        # so encoding is timed with the card.
+        init_worker(*init_args)
+        writer = output.ImageWriter(workers=1, options=output_options) if profile_dir is None else None
+        writing = deque()
+        try:
+            for card_path in card_paths:
+                writing.append(render_one(card_path, root_dir, resource_dir, output_dir, previous_hash(card_path),
+                                          output_options, profile_dir, band_height, writer))
+                while len(writing) > MAX_PENDING_WRITES:
+                    collect(finish_write(writing.popleft()))
+            while len(writing) > 0:
+                collect(finish_write(writing.popleft()))
+        finally:
+            if writer is not None:
+                # Failed writes were already reported on their cards.
+                writer.close(raise_errors=False)
+    else:
+        with ProcessPoolExecutor(max_workers=jobs, initializer=init_worker, initargs=init_args) as pool:
+            futures = [pool.submit(render_one, card_path, root_dir, resource_dir, output_dir, previous_hash(card_path),
+                                   output_options, profile_dir, band_height)
+                       for card_path in card_paths]
+            for future in as_completed(futures):
+                collect(future.result())
+
+    build_manifest.prune({r['card']: r['output'] for r in results if r['error'] is None})
+    build_manifest.save()
+    if profile_dir is not None:
+        save_profile(results, profile_dir, profile_top)
+    return results
+
+
+"""
+Writes profile.json to profile_dir with every card's profile and the batch aggregate. Only the cProfile dumps of
+the profile_top slowest cards are kept, renamed by rank.
+"""
+def save_profile(results, profile_dir, profile_top):
+    profiled = sorted((r for r in results if 'profile' in r), key=lambda r: r['profile']['wall'], reverse=True)
+    for rank, result in enumerate(profiled):
+        if rank < profile_top:
+            card_name = os.path.splitext(os.path.basename(result['card']))[0]
+            kept_path = os.path.join(profile_dir, f"{rank+1:02d}-{card_name}.prof")
+            os.replace(result['cprofile'], kept_path)
+            result['cprofile'] = kept_path
+        else:
+            os.remove(result['cprofile'])
+            result['cprofile'] = None
+
+    report = {
+        'batch': instrument.aggregate([r['profile'] for r in profiled]),
+        'cards': {r['card']: dict(r['profile'], cprofile=r['cprofile'], skipped=r['skipped'], error=r['error'])
+                  for r in profiled}
+    }
+    report_path = os.path.join(profile_dir, "profile.json")
+    with open(report_path, 'w') as report_f:
+        json.dump(report, report_f, indent=1)
+    return report
+
+
+def print_profile(results, profile_dir):
+    batch_profile = instrument.aggregate([r['profile'] for r in results if 'profile' in r])
+    print("stage                 total      mean       max")
+    for name, entry in sorted(batch_profile['stages'].items(), key=lambda item: item[1]['wall'], reverse=True):
+        print(f"{name:<20}{entry['wall']:>7.2f}s {entry['mean_wall']:>8.3f}s {entry['max_wall']:>8.3f}s")
+    for name, entry in sorted(batch_profile['caches'].items()):
+        print(f"cache {name}: {entry['hit_rate']:.0%} hits ({entry['hits']}/{entry['hits'] + entry['misses']})")
+    print(f"text fitting attempts: {batch_profile['text_fit_attempts']}")
+    print(f"profile: {os.path.join(profile_dir, 'profile.json')}")
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(prog="python -m pycardcon render-all",
+                                 description="render every card json under root_dir")
+    ap.add_argument('root_dir', type=str)
+    ap.add_argument('resource_dir', type=str)
+    ap.add_argument('output_dir', type=str)
+    ap.add_argument('--jobs', '-j', type=int, default=os.cpu_count(), help="number of worker processes")
+    ap.add_argument('--svg-cache', type=str, default=None, help="directory to keep rasterized svg symbols in between runs")
+    ap.add_argument('--template-cache', type=str, default=None,
+                    help="directory to keep composited frame stacks in between runs")
+    output.add_output_arguments(ap)
+    ap.add_argument('--profile', type=str, default=None, metavar="DIR",
+                    help="instrument the run, writing per card and per batch timings to DIR/profile.json")
+    ap.add_argument('--profile-top', type=int, default=5, help="keep cProfile dumps for this many of the slowest cards")
+    ap.add_argument('--band-height', type=int, default=None, metavar="ROWS",
+                    help="render cards ROWS rows at a time, bounding memory for print resolution cards (png only)")
+    ap.add_argument('--force', action='store_true', help="re-render every card, even if its inputs did not change")
+    args = ap.parse_args(argv)
+    output_options = output.options_from_args(args)
+    if args.band_height is not None and output_options.format != "png":
+        ap.error(f"--band-height writes png only, not {output_options.format}")
+
+    def report(result):
+        card_rel = os.path.relpath(result['card'], args.root_dir)
+        if result['error'] is None and result['skipped']:
+            print(f"unchanged: {card_rel} ({result['seconds']:.2f}s)")
+        elif result['error'] is None:
+            print(f"rendered:  {card_rel} ({result['seconds']:.2f}s)")
+        else:
+            print(f"failed:    {card_rel} ({result['seconds']:.2f}s)")
+            print(f"\t{result['error']}")
+
+    start = time.perf_counter()
+    results = render_all(args.root_dir, args.resource_dir, args.output_dir, jobs=args.jobs,
+                         svg_cache_dir=args.svg_cache, on_result=report, force=args.force,
+                         template_cache_dir=args.template_cache, output_options=output_options,
+                         profile_dir=args.profile, profile_top=args.profile_top, band_height=args.band_height)
+    wall = time.perf_counter() - start
+
+    failed = [r for r in results if r['error'] is not None]
+    skipped = [r for r in results if r['skipped']]
+    card_seconds = sum(r['seconds'] for r in results)
+    print(f"{len(results)-len(failed)}/{len(results)} cards up to date ({len(skipped)} unchanged) "
+          f"in {wall:.2f}s with {args.jobs} jobs "
+          f"({len(results)/wall if wall > 0 else 0.0:.1f} cards/s, {card_seconds:.2f}s of render time)")
+    if args.profile is not None:
+        print_profile(results, args.profile)
+    if len(failed) > 0:
+        print(f"{len(failed)} cards failed.")
+        return 1
+    return 0
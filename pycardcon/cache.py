@@ -0,0 +1,186 @@
+import hashlib
+import os.path
+import tempfile
+import threading
+from collections import OrderedDict
+
+from PIL import Image
+
+"""
+Process wide caches for decoded resources. Frame packs are shared by most of the cards in a set, so the
+frames, masks and blends they point to are decoded, converted and resized once and then reused for every
+card rendered at the same size.
+
+Cached images are shared between callers, so they must be treated as read-only.
+"""
+
+ASSET_CACHE_MAX_BYTES = 512 * 1024 * 1024
+ALPHA_BBOX_CACHE_MAX_ENTRIES = 4096
+
+# Every cache created with a name, so their stats can be reported together.
+CACHES = {}
+
+
+def image_nbytes(img):
+    return img.size[0] * img.size[1] * len(img.getbands())
+
+
+class LRUCache:
+    """ Least recently used cache, bounded by the summed size of its entries rather than their count. """
+    def __init__(self, max_bytes, sizeof=image_nbytes, name=None):
+        self.max_bytes = max_bytes
+        self.sizeof = sizeof
+        self.entries = OrderedDict()
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.lock = threading.RLock()
+        if name is not None:
+            CACHES[name] = self
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __contains__(self, key):
+        return key in self.entries
+
+    def get(self, key, default=None):
+        with self.lock:
+            if key in self.entries:
+                self.hits += 1
+                self.entries.move_to_end(key)
+                return self.entries[key][0]
+            self.misses += 1
+            return default
+
+    def put(self, key, value):
+        size = self.sizeof(value)
+        with self.lock:
+            if key in self.entries:
+                self.nbytes -= self.entries.pop(key)[1]
+
+            # Anything bigger than the whole cache is handed back uncached instead of flushing everything else.
+            if size > self.max_bytes:
+                return value
+
+            self.entries[key] = (value, size)
+            self.nbytes += size
+            while self.nbytes > self.max_bytes:
+                _, (_, evicted_size) = self.entries.popitem(last=False)
+                self.nbytes -= evicted_size
+                self.evictions += 1
+        return value
+
+    def get_or_load(self, key, loader):
+        with self.lock:
+            if key in self.entries:
+                self.hits += 1
+                self.entries.move_to_end(key)
+                return self.entries[key][0]
+            self.misses += 1
+
+        # Loading happens outside the lock, two threads racing on the same key just decode it twice.
+        return self.put(key, loader())
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.nbytes = 0
+
+    def stats(self):
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self.entries),
+                'bytes': self.nbytes,
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_rate': self.hits / lookups if lookups > 0 else 0.0
+            }
+
+
+ASSET_CACHE = LRUCache(ASSET_CACHE_MAX_BYTES, name="assets")
+
+
+def file_key(path):
+    # The mtime is part of every key so an edited resource is picked up without clearing anything.
+    return os.path.abspath(path), os.stat(path).st_mtime_ns
+
+
+def open_image(path, size=None):
+    return Image.open(path)
+
+
+"""
+Returns the image at path, decoded by opener, optionally converted to mode and then resized to size, in that
+order. The result is cached on (path, mtime, size, mode).
+
+opener(path, size) can decode straight to size, like an svg rasterized at the size it is drawn at, and then there
+is nothing left to resize. open_image decodes at the file's own size.
+"""
+def load_image_asset(path, size=None, mode=None, opener=open_image):
+    def load():
+        img = opener(path, size)
+        img.load()
+        if mode is not None:
+            img = img.convert(mode)
+        if size is not None and img.size != tuple(size):
+            img = img.resize(size)
+        return img
+
+    return ASSET_CACHE.get_or_load((*file_key(path), size, mode), load)
+
+
+# Entries are counted rather than sized, a bbox is a few ints. None, a fully transparent asset, is cached too.
+ALPHA_BBOX_CACHE = LRUCache(ALPHA_BBOX_CACHE_MAX_ENTRIES, sizeof=lambda bbox: 1, name="alpha_bboxes")
+
+
+"""
+Returns the bounding box of the non-transparent pixels of the asset load_image_asset would return for the same
+arguments, or None if it is fully transparent. Images without an alpha band are opaque everywhere.
+"""
+def load_alpha_bbox(path, size=None, mode=None, opener=open_image):
+    def load():
+        img = load_image_asset(path, size=size, mode=mode, opener=opener)
+        if "A" in img.getbands():
+            return img.getchannel("A").getbbox()
+        return 0, 0, *img.size
+
+    return ALPHA_BBOX_CACHE.get_or_load((*file_key(path), size, mode), load)
+
+
+class DiskImageStore:
+    """ Directory of PNG files keyed by a hash of the cache key, used as a second tier behind an LRUCache. """
+    def __init__(self, directory):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def path_for(self, key):
+        digest = hashlib.sha1(repr(key).encode("utf-8")).hexdigest()
+        return os.path.join(self.directory, f"{digest}.png")
+
+    def get(self, key):
+        path = self.path_for(key)
+        if not os.path.exists(path):
+            return None
+        try:
+            img = Image.open(path)
+            img.load()
+        except OSError:
+            # A truncated or foreign file is treated as a miss and overwritten on the next put.
+            return None
+        return img
+
+    def put(self, key, img):
+        path = self.path_for(key)
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        try:
+            with os.fdopen(fd, 'wb') as tmp_f:
+                img.save(tmp_f, format="PNG")
+            os.replace(tmp_path, path)
+        except OSError:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
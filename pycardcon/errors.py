@@ -8,3 +8,23 @@ class InvalidTextRegion(Exception):
         self.message += "\n\tcheck if you forgot to remove this text region after removing a frame."
         super().__init__(self.message)
 
+
+
+class UnknownSymbol(Exception):
+    """ Raised when text uses a {word} that is neither a command nor a known symbol """
+    def __init__(self, word, symbol_dir):
+        self.word = word
+        self.symbol_dir = symbol_dir
+        self.message = f"unknown symbol '{{{self.word}}}'."
+        self.message += f"\n\tcheck that {self.symbol_dir} has an svg for it, or add it to the symbol manifest."
+        super().__init__(self.message)
+
+
+class UnknownLineBreak(Exception):
+    """ Raised when a text region asks for a lineBreak method that doesn't exist """
+    def __init__(self, method, methods):
+        self.method = method
+        self.methods = methods
+        self.message = f"unknown lineBreak '{self.method}'."
+        self.message += f"\n\tuse one of: {', '.join(self.methods)}."
+        super().__init__(self.message)
@@ -0,0 +1,69 @@
+import os.path
+import threading
+import weakref
+from io import BytesIO
+
+from PIL import ImageFont
+
+from pycardcon.cache import LRUCache, file_key
+
+"""
+Shared font pool. Text fitting loads the same fonts at many sizes for every region and every card, so each font
+file is read from disk once per process and the FreeTypeFont objects built from it are kept, keyed on the file,
+size and variant.
+"""
+
+FONT_POOL_MAX_FONTS = 256
+TEXT_WIDTHS_MAX_PER_FONT = 4096
+
+# Entries are counted rather than sized, FreeType doesn't expose what a face costs.
+FONT_POOL = LRUCache(FONT_POOL_MAX_FONTS, sizeof=lambda font: 1, name="fonts")
+font_files = {}
+font_files_lock = threading.Lock()
+
+
+def font_variant_path(font_path, variant=None):
+    # Italic faces sit next to the regular one, named with an -i suffix.
+    if variant == "italic":
+        font_dir, font_fn = os.path.split(font_path)
+        return os.path.join(font_dir, font_fn.replace(".ttf", "-i.ttf"))
+    return font_path
+
+
+def read_font_file(path):
+    # The bytes are kept per (path, mtime), so an edited font is re-read and the old bytes dropped.
+    key = file_key(path)
+    with font_files_lock:
+        font_bytes = font_files.get(key[0])
+        if font_bytes is not None and font_bytes[0] == key[1]:
+            return font_bytes[1]
+
+    with open(path, 'rb') as font_f:
+        data = font_f.read()
+    with font_files_lock:
+        font_files[key[0]] = (key[1], data)
+    return data
+
+
+def load_font(font_path, size, variant=None):
+    path = font_variant_path(font_path, variant)
+    key = (*file_key(path), size)
+    return FONT_POOL.get_or_load(key, lambda: ImageFont.truetype(BytesIO(read_font_file(path)), size))
+
+# Widths of the strings measured with each font. Fonts are pooled per size, so this is a cache per (font, size),
+# and a font evicted from the pool takes its widths with it.
+text_widths = weakref.WeakKeyDictionary()
+text_widths_lock = threading.Lock()
+
+
+def text_width(font, text):
+    widths = text_widths.get(font)
+    if widths is None:
+        with text_widths_lock:
+            widths = text_widths.setdefault(font, {})
+    width = widths.get(text)
+    if width is None:
+        if len(widths) >= TEXT_WIDTHS_MAX_PER_FONT:
+            widths.clear()
+        width = widths[text] = font.getlength(text)
+    return width
@@ -0,0 +1,140 @@
+import threading
+import time
+from contextlib import contextmanager
+
+from pycardcon.cache import CACHES, image_nbytes
+
+"""
+Opt-in render instrumentation. While a Profiler is active on a thread, the render code reports into it: wall and
+CPU time per stage, text fitting attempts per region, bytes of the large canvases it allocates and the hits and
+misses of every named cache. With no active profiler the hooks do nothing.
+
+Stages nest, an svg rasterized while drawing text counts towards both svg_rasterize and draw_text.
+"""
+
+active = threading.local()
+
+
+def cache_counts():
+    return {name: (cache.hits, cache.misses) for name, cache in CACHES.items()}
+
+
+class Profiler:
+    """ Collects the measurements for one card. """
+    def __init__(self):
+        self.stages = {}
+        self.fit_stats = {}
+        self.canvas_bytes = {}
+        self.caches_before = cache_counts()
+        self.start = time.perf_counter()
+        self.start_cpu = time.thread_time()
+        self.finished = None
+
+    @contextmanager
+    def stage(self, name):
+        wall, cpu = time.perf_counter(), time.thread_time()
+        try:
+            yield
+        finally:
+            entry = self.stages.setdefault(name, {'wall': 0.0, 'cpu': 0.0, 'calls': 0})
+            entry['wall'] += time.perf_counter() - wall
+            entry['cpu'] += time.thread_time() - cpu
+            entry['calls'] += 1
+
+    def canvas(self, name, img):
+        self.canvas_bytes[name] = self.canvas_bytes.get(name, 0) + image_nbytes(img)
+
+    def finish(self):
+        caches_after = cache_counts()
+        caches = {}
+        for name, (hits, misses) in caches_after.items():
+            before_hits, before_misses = self.caches_before.get(name, (0, 0))
+            hits, misses = hits - before_hits, misses - before_misses
+            if hits + misses > 0:
+                caches[name] = {'hits': hits, 'misses': misses, 'hit_rate': hits / (hits + misses)}
+
+        self.finished = {
+            'wall': time.perf_counter() - self.start,
+            'cpu': time.thread_time() - self.start_cpu,
+            'stages': self.stages,
+            'text_fit': self.fit_stats,
+            'canvas_bytes': self.canvas_bytes,
+            'caches': caches
+        }
+        return self.finished
+
+
+def current():
+    return getattr(active, 'profiler', None)
+
+
+@contextmanager
+def profiling(profiler):
+    previous = current()
+    active.profiler = profiler
+    try:
+        yield profiler
+    finally:
+        active.profiler = previous
+
+
+@contextmanager
+def stage(name):
+    profiler = current()
+    if profiler is None:
+        yield
+        return
+    with profiler.stage(name):
+        yield
+
+
+def canvas(name, img):
+    profiler = current()
+    if profiler is not None:
+        profiler.canvas(name, img)
+
+
+def fit_stats():
+    # The dict draw_text records fitting attempts into, or None to skip recording.
+    profiler = current()
+    return profiler.fit_stats if profiler is not None else None
+
+
+"""
+Sums per card profiles (as returned by Profiler.finish) into one report for a batch: total and mean time per stage,
+total fitting attempts, canvas bytes and overall cache hit rates.
+"""
+def aggregate(profiles):
+    stages = {}
+    caches = {}
+    canvas_bytes = {}
+    fit_attempts = 0
+    for profile in profiles:
+        for name, entry in profile['stages'].items():
+            total = stages.setdefault(name, {'wall': 0.0, 'cpu': 0.0, 'calls': 0, 'max_wall': 0.0})
+            total['wall'] += entry['wall']
+            total['cpu'] += entry['cpu']
+            total['calls'] += entry['calls']
+            total['max_wall'] = max(total['max_wall'], entry['wall'])
+        for name, entry in profile['caches'].items():
+            total = caches.setdefault(name, {'hits': 0, 'misses': 0})
+            total['hits'] += entry['hits']
+            total['misses'] += entry['misses']
+        for name, nbytes in profile['canvas_bytes'].items():
+            canvas_bytes[name] = canvas_bytes.get(name, 0) + nbytes
+        fit_attempts += sum(region['attempts'] for region in profile['text_fit'].values())
+
+    for entry in stages.values():
+        entry['mean_wall'] = entry['wall'] / len(profiles)
+    for entry in caches.values():
+        entry['hit_rate'] = entry['hits'] / (entry['hits'] + entry['misses'])
+
+    return {
+        'cards': len(profiles),
+        'wall': sum(profile['wall'] for profile in profiles),
+        'cpu': sum(profile['cpu'] for profile in profiles),
+        'stages': stages,
+        'text_fit_attempts': fit_attempts,
+        'canvas_bytes': canvas_bytes,
+        'caches': caches
+    }
@@ -0,0 +1,76 @@
+from pycardcon.errors import UnknownLineBreak
+
+"""
+Line breaking for text regions, as pure data. A paragraph is a list of measured items, each a dict with the
+'width' it needs to fit on a line and the 'advance' it moves the line on by (a word's width includes its
+trailing whitespace, a symbol's advance includes the gap after it). A breaker splits a paragraph into lines, each
+a list of its items, such that every item fits where it starts: the advances before it plus its width are at most
+the line width. An item wider than the line gets a line of its own.
+
+greedy fills each line before starting the next, which is how regions have always been broken. A first item
+too wide for the line is put after an empty line, as it always has been. balanced is a Knuth-Plass style breaker:
+out of the breakings with the fewest lines, it picks the one with the least squared space left at the end of every
+line but the last, which evens out the rag. That is never more lines than greedy, one fewer when greedy starts
+with an empty line, so the text never gets taller. It is picked per region with "lineBreak": "balanced".
+"""
+
+
+def greedy_lines(items, line_width):
+    lines = [[]]
+    x = 0
+    for item in items:
+        if x + item['width'] > line_width:
+            lines.append([])
+            x = 0
+        lines[-1].append(item)
+        x += item['advance']
+    return lines
+
+
+def balanced_lines(items, line_width):
+    if len(items) == 0:
+        return [[]]
+
+    # best[i] is (lines, badness, start of the last line) for breaking items[:i].
+    best = [None] * (len(items) + 1)
+    best[0] = (0, 0, None)
+    for start in range(len(items)):
+        if best[start] is None:
+            continue
+        line_count, badness, _ = best[start]
+        x = 0
+        for end in range(start, len(items)):
+            if end > start and x + items[end]['width'] > line_width:
+                break
+            x += items[end]['advance']
+            if end + 1 == len(items):
+                cost = (line_count + 1, badness, start)
+            else:
+                cost = (line_count + 1, badness + max(0, line_width - x)**2, start)
+            if best[end + 1] is None or cost < best[end + 1]:
+                best[end + 1] = cost
+
+    starts = []
+    end = len(items)
+    while end > 0:
+        starts.append(best[end][2])
+        end = best[end][2]
+    starts.reverse()
+    return [items[start:end] for start, end in zip(starts, starts[1:] + [len(items)])]
+
+
+LINE_BREAKERS = {
+    "greedy": greedy_lines,
+    "balanced": balanced_lines
+}
+
+
+def line_breaker(method):
+    breaker = LINE_BREAKERS.get(method)
+    if breaker is None:
+        raise UnknownLineBreak(method, tuple(LINE_BREAKERS))
+    return breaker
+
+
+def break_lines(items, line_width, method="greedy"):
+    return line_breaker(method)(items, line_width)
@@ -0,0 +1,120 @@
+import hashlib
+import json
+import os.path
+
+import pycardcon
+
+"""
+Build manifest for incremental rebuilds. For every output image it records a hash over the renderer version, the
+card file, the resolved card and the content of every file the render depends on (see render.card_dependencies).
+A card whose hash matches the one recorded for its existing output doesn't need to be rendered again.
+"""
+
+MANIFEST_FN = ".pycardcon_manifest.json"
+
+# Content digests keyed by absolute path to (mtime_ns, size, digest), so unchanged files are hashed once.
+file_digests = {}
+renderer_digest = None
+
+
+def file_digest(path):
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return "missing"
+
+    cached = file_digests.get(path)
+    if cached is not None and cached[0] == stat.st_mtime_ns and cached[1] == stat.st_size:
+        return cached[2]
+
+    file_hash = hashlib.sha256()
+    with open(path, 'rb') as dep_f:
+        for chunk in iter(lambda: dep_f.read(1 << 20), b""):
+            file_hash.update(chunk)
+    digest = file_hash.hexdigest()
+    file_digests[path] = (stat.st_mtime_ns, stat.st_size, digest)
+    return digest
+
+
+def seed_file_digests(digests):
+    for path, entry in digests.items():
+        if path not in file_digests:
+            file_digests[path] = tuple(entry)
+
+
+def renderer_version():
+    # The package version alone misses local edits to the renderer, so the package source is hashed in as well.
+    global renderer_digest
+    if renderer_digest is None:
+        package_dir = os.path.dirname(os.path.abspath(pycardcon.__file__))
+        source_hash = hashlib.sha256()
+        for source_fn in sorted(os.listdir(package_dir)):
+            if source_fn.endswith(".py"):
+                source_hash.update(source_fn.encode("utf-8"))
+                source_hash.update(file_digest(os.path.join(package_dir, source_fn)).encode("utf-8"))
+        renderer_digest = f"{pycardcon.__version__}+{source_hash.hexdigest()[:16]}"
+    return renderer_digest
+
+
+def card_hash(card_path, card, deps, output_options=None):
+    build_hash = hashlib.sha256()
+    build_hash.update(renderer_version().encode("utf-8"))
+    build_hash.update(repr(output_options).encode("utf-8"))
+    build_hash.update(file_digest(os.path.abspath(card_path)).encode("utf-8"))
+    build_hash.update(repr(card).encode("utf-8"))
+    for dep in sorted(deps):
+        build_hash.update(dep.encode("utf-8"))
+        build_hash.update(file_digest(dep).encode("utf-8"))
+    return build_hash.hexdigest()
+
+
+class BuildManifest:
+    """ The manifest file kept in an output directory, mapping output images to the build hash they came from. """
+    def __init__(self, path):
+        self.path = path
+        self.outputs = {}
+        if os.path.exists(path):
+            try:
+                with open(path, 'rb') as manifest_f:
+                    manifest = json.load(manifest_f)
+                self.outputs = manifest.get('outputs', {})
+                seed_file_digests(manifest.get('files', {}))
+            except ValueError:
+                # A corrupt manifest only costs a full rebuild.
+                self.outputs = {}
+
+    @classmethod
+    def for_output_dir(cls, output_dir):
+        return cls(os.path.join(output_dir, MANIFEST_FN))
+
+    def hashes_by_card(self):
+        return {entry['card']: entry['hash'] for entry in self.outputs.values()}
+
+    def record(self, output_path, card_path, build_hash, deps):
+        self.outputs[os.path.abspath(output_path)] = {
+            'card': os.path.abspath(card_path),
+            'hash': build_hash,
+            'deps': sorted(deps)
+        }
+
+    def prune(self, outputs_by_card):
+        # Drops the entries of deleted cards and outputs, and of outputs a card no longer renders to, e.g. after its
+        # title changed. outputs_by_card maps every card rendered or skipped this run to its output path.
+        outputs_by_card = {os.path.abspath(card): os.path.abspath(path) for card, path in outputs_by_card.items()}
+        for output_path, entry in list(self.outputs.items()):
+            current_output = outputs_by_card.get(entry['card'], output_path)
+            if current_output != output_path or not os.path.exists(entry['card']) or not os.path.exists(output_path):
+                del self.outputs[output_path]
+
+    def save(self):
+        deps = {dep for entry in self.outputs.values() for dep in entry['deps']}
+        deps.update(entry['card'] for entry in self.outputs.values())
+        manifest = {
+            'renderer': renderer_version(),
+            'outputs': self.outputs,
+            'files': {dep: file_digests[dep] for dep in sorted(deps) if dep in file_digests}
+        }
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, 'w') as manifest_f:
+            json.dump(manifest, manifest_f, indent=1)
+        os.replace(tmp_path, self.path)
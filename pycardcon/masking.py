@@ -0,0 +1,103 @@
+from PIL import Image
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+"""
+NumPy backend for masking frames, used by draw_frames whenever numpy is installed.
+
+Pillow pastes a frame through each of its masks in turn, blending every pixel as out*(255-m) + frame*m, divided by
+255 with rounding. A mask of 255 gives the frame pixel and a mask of 0 leaves the pixel alone, so wherever at most
+one mask is partly transparent, pasting through all of them gives the same pixels as pasting once through their
+maximum. Here the masks are combined into that one alpha array, the frame is pasted through it once and the blend
+alpha is scaled by it as array math. Only the pixels where several partial masks overlap, usually a few
+antialiased edges, go through the masks one by one with Pillow's integer math. The result is exactly what pasting
+through every mask gives.
+"""
+
+# Past this share of overlapping partial pixels, the masks are left to Pillow one by one.
+MAX_OVERLAP_FRACTION = 1/8
+
+enabled = np is not None
+
+
+def enable():
+    global enabled
+    if np is None:
+        raise ImportError("the numpy masking backend needs numpy installed")
+    enabled = True
+
+
+def disable():
+    global enabled
+    enabled = False
+
+
+def div255(values):
+    # Pillow's rounding division by 255, in place on a uint16 array.
+    values += 128
+    values += values >> 8
+    values >>= 8
+    return values
+
+
+def paste_through_masks(values, masks):
+    # Pastes values (n, ...) through masks (k, n) one mask at a time onto zeros, like repeated Image.paste.
+    values = values.astype(np.uint16)
+    out = np.zeros_like(values)
+    for mask in masks.astype(np.uint16):
+        if values.ndim > 1:
+            mask = mask[:, None]
+        out *= 255 - mask
+        out += values * mask
+        div255(out)
+    return out.astype(np.uint8)
+
+
+"""
+Masks frame_region (RGBA) by the alpha of every image in mask_regions and, with a blend_region, replaces its alpha
+with the blend's alpha masked the same way. Returns the masked frame, or None when the masks overlap too much for
+the combined mask to pay off.
+"""
+def mask_frame_region(frame_region, mask_regions, blend_region):
+    if blend_region is not None and blend_region.mode != "RGBA":
+        blend_region = blend_region.convert("RGBA")
+    if len(mask_regions) == 0:
+        if blend_region is not None:
+            frame_region.putalpha(blend_region.getchannel("A"))
+        return frame_region
+
+    masks = np.stack([np.asarray(mask_region.getchannel("A")) for mask_region in mask_regions])
+    combined = masks.max(axis=0)
+
+    overlaps = None
+    if len(mask_regions) > 1:
+        # 1 to 254 wrap round to 0 to 253, 0 to 255.
+        partial_counts = ((masks - 1) < 254).sum(axis=0, dtype=np.uint8)
+        overlapping = (partial_counts > 1) & (combined != 255)
+        overlap_count = np.count_nonzero(overlapping)
+        if overlap_count > MAX_OVERLAP_FRACTION * combined.size:
+            return None
+        if overlap_count > 0:
+            overlaps = np.nonzero(overlapping)
+
+    masked_frame = Image.new("RGBA", frame_region.size)
+    masked_frame.paste(frame_region, mask=Image.fromarray(combined))
+    if overlaps is None:
+        if blend_region is not None:
+            blend_alpha = np.asarray(blend_region.getchannel("A"))
+            masked_frame.putalpha(Image.fromarray(div255(blend_alpha * combined.astype(np.uint16)).astype(np.uint8)))
+        return masked_frame
+
+    # The few overlapping pixels are patched in with the masks applied one by one.
+    pixels = np.array(masked_frame)
+    overlap_masks = masks[:, overlaps[0], overlaps[1]]
+    pixels[overlaps] = paste_through_masks(np.asarray(frame_region)[overlaps], overlap_masks)
+    if blend_region is not None:
+        blend_alpha = np.asarray(blend_region.getchannel("A"))
+        alpha = div255(blend_alpha * combined.astype(np.uint16)).astype(np.uint8)
+        alpha[overlaps] = paste_through_masks(blend_alpha[overlaps], overlap_masks)
+        pixels[:, :, 3] = alpha
+    return Image.fromarray(pixels, "RGBA")
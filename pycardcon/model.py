@@ -0,0 +1,199 @@
+from dataclasses import dataclass, replace
+
+"""
+The resolved form of a card, as produced by util.read_card once every default has been copied in from the frame
+pack meta files. Everything here is frozen and built from plain values and tuples, so a resolved card never shares
+state with the cached meta data or with another card, and can be hashed, compared and passed between threads
+and processes freely.
+
+All positions and sizes are fractions of the card's width and height, the same as in the card files.
+"""
+
+
+def as_color(color):
+    # Colors given as json lists become tuples, so regions stay hashable.
+    return tuple(color) if isinstance(color, list) else color
+
+
+@dataclass(frozen=True, slots=True)
+class Bounds:
+    x: float
+    y: float
+    width: float
+    height: float
+
+    @classmethod
+    def from_dict(cls, bounds):
+        return cls(bounds['x'], bounds['y'], bounds['width'], bounds['height'])
+
+
+@dataclass(frozen=True, slots=True)
+class Frame:
+    bounds: Bounds
+    fn: str = None          # Path to the frame image, None for alpha shades.
+    masks: tuple = ()       # Paths to the mask images the frame is pasted through.
+    blend: str = None       # Path to the blend image whose alpha is applied to the frame.
+    shade: tuple = None     # RGBA fill of an alpha shade frame.
+    group: str = None       # Set on frames read_card generates together, like a planeswalker's shades and lines.
+
+    @classmethod
+    def from_dict(cls, frame):
+        bounds = Bounds.from_dict(frame['bounds'])
+        if 'alphaShade' in frame:
+            return cls(bounds, shade=as_color(frame['value']), group=frame.get('group'))
+
+        return cls(bounds,
+                   fn=frame['fn'],
+                   masks=tuple(mask['fn'] for mask in frame.get('masks', [])),
+                   blend=frame['blend']['fn'] if 'blend' in frame else None,
+                   group=frame.get('group'))
+
+
+@dataclass(frozen=True, slots=True)
+class TextRegion:
+    name: str
+    text: str = None
+    font: str = None
+    size: float = None
+    x: float = None
+    y: float = None
+    width: float = None
+    height: float = None
+    color: str = "black"
+    align: str = "left"
+    vertical_align: str = "top"
+    drop_shadows: bool = False
+    line_break: str = "greedy"  # How lines are broken, see linebreak.LINE_BREAKERS.
+
+    # The fields a region can't be rendered without, see errors.InvalidTextRegion.
+    REQUIRED_FIELDS = ('text', 'size', 'width', 'height', 'x', 'y', 'font')
+
+    @classmethod
+    def from_dict(cls, name, text_region):
+        return cls(name,
+                   text=text_region.get('text'),
+                   font=text_region.get('font'),
+                   size=text_region.get('size'),
+                   x=text_region.get('x'),
+                   y=text_region.get('y'),
+                   width=text_region.get('width'),
+                   height=text_region.get('height'),
+                   color=as_color(text_region.get('color', "black")),
+                   align=text_region.get('align', "left"),
+                   vertical_align=text_region.get('verticalAlign', "top"),
+                   drop_shadows=bool(text_region.get('dropShadows', False)),
+                   line_break=text_region.get('lineBreak', "greedy"))
+
+    def missing_field(self):
+        for field in self.REQUIRED_FIELDS:
+            if getattr(self, field) is None:
+                return field
+        return None
+
+
+@dataclass(frozen=True, slots=True)
+class Art:
+    src: str
+    x: float
+    y: float
+    zoom: float
+    artist: str = ""
+
+    @classmethod
+    def from_dict(cls, art):
+        return cls(art['src'], art['x'], art['y'], art['zoom'], art.get('artist', ""))
+
+
+@dataclass(frozen=True, slots=True)
+class SetSymbol:
+    x: float
+    y: float
+    zoom: float
+
+    @classmethod
+    def from_dict(cls, set_symbol):
+        return cls(set_symbol['x'], set_symbol['y'], set_symbol['zoom'])
+
+
+@dataclass(frozen=True, slots=True)
+class InfoLine:
+    x: float = None
+    y: float = None
+    size: float = None
+    color: str = None
+    text: str = None
+
+    @classmethod
+    def from_dict(cls, info_line):
+        return cls(info_line.get('x'), info_line.get('y'), info_line.get('size'), as_color(info_line.get('color')),
+                   info_line.get('text'))
+
+
+@dataclass(frozen=True, slots=True)
+class BottomInfo:
+    top_left: InfoLine
+    mid_left: InfoLine
+    bottom_left: InfoLine
+
+    @classmethod
+    def from_dict(cls, bottom_info):
+        return cls(InfoLine.from_dict(bottom_info['topLeft']),
+                   InfoLine.from_dict(bottom_info['midLeft']),
+                   InfoLine.from_dict(bottom_info['bottomLeft']))
+
+
+@dataclass(frozen=True, slots=True)
+class ResolvedCard:
+    width: int
+    height: int
+    art: Art
+    frames: tuple
+    text_regions: tuple
+    set_symbol: SetSymbol = None
+    bottom_info: BottomInfo = None
+    info_set: str = None
+    info_rarity: str = None
+    info_number: str = None
+    info_language: str = None
+    sources: tuple = ()     # The frame pack meta files the card was resolved from.
+    scale: float = 1.0      # Resolution the card is rendered at, relative to the size given in its card file.
+
+    @classmethod
+    def from_dict(cls, card_data, sources=()):
+        set_symbol = card_data.get('setSymbol')
+        bottom_info = card_data.get('bottomInfo')
+        return cls(width=card_data['card']['width'],
+                   height=card_data['card']['height'],
+                   art=Art.from_dict(card_data['art']),
+                   frames=tuple(Frame.from_dict(frame) for frame in card_data['frames']),
+                   text_regions=tuple(TextRegion.from_dict(name, text_region)
+                                      for name, text_region in card_data['textRegions'].items()),
+                   set_symbol=SetSymbol.from_dict(set_symbol) if set_symbol else None,
+                   bottom_info=BottomInfo.from_dict(bottom_info) if bottom_info else None,
+                   info_set=card_data.get('infoSet'),
+                   info_rarity=card_data.get('infoRarity'),
+                   info_number=card_data.get('infoNumber'),
+                   info_language=card_data.get('infoLanguage'),
+                   sources=tuple(sources))
+
+    def scaled(self, scale):
+        # Bounds are fractions of the card already, only the card size and the zooms, which are relative to the
+        # art and set symbol images' own pixels, have to follow the scale.
+        if scale == 1.0:
+            return self
+        return replace(self,
+                       width=max(1, round(self.width*scale)),
+                       height=max(1, round(self.height*scale)),
+                       art=replace(self.art, zoom=self.art.zoom*scale),
+                       set_symbol=replace(self.set_symbol, zoom=self.set_symbol.zoom*scale) if self.set_symbol else None,
+                       scale=self.scale*scale)
+
+    def text_region(self, name):
+        for text_region in self.text_regions:
+            if text_region.name == name:
+                return text_region
+        raise KeyError(name)
+
+    @property
+    def title(self):
+        return self.text_region('display-title').text
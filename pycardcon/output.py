@@ -0,0 +1,222 @@
+import os.path
+import struct
+import tempfile
+import threading
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, replace
+from io import BytesIO
+
+from PIL import Image, ImageChops
+
+from pycardcon import instrument
+
+"""
+Encoding and writing of rendered cards. OutputOptions picks the format and its settings, encode_image turns a card
+image into file bytes, and write_atomic puts them on disk through a temp file and a rename, so the watcher, the
+gui or anything else reading the output directory never sees a half-written image. ImageWriter does the encode
+and write on a pool of background threads.
+"""
+
+FORMAT_EXTENSIONS = {
+    'png': ".png",
+    'webp': ".webp",
+    'jpeg': ".jpg"
+}
+
+# JPEG has no alpha, so cards are flattened onto this first.
+JPEG_BACKGROUND = (255, 255, 255)
+
+# mkstemp creates files only their owner can read. Files renamed into place get the mode a plain open() would have
+# given them instead. The umask can only be read by setting it, so that is done once, here.
+UMASK = os.umask(0)
+os.umask(UMASK)
+OUTPUT_FILE_MODE = 0o666 & ~UMASK
+
+
+@dataclass(frozen=True, slots=True)
+class OutputOptions:
+    format: str = "png"
+    compress_level: int = 6     # PNG zlib level, 0 (none) to 9. 6 is Pillow's default.
+    optimize: bool = False      # PNG extra compression pass, slow.
+    quality: int = 90           # WebP and JPEG quality.
+    lossless: bool = False      # WebP lossless.
+    method: int = 4             # WebP effort, 0 (fast) to 6.
+
+    @property
+    def extension(self):
+        return FORMAT_EXTENSIONS[self.format]
+
+
+DEFAULT_OUTPUT = OutputOptions()
+
+# Named settings for the command line. 'fast' stays lossless but spends as little time compressing as possible.
+PRESETS = {
+    'default': DEFAULT_OUTPUT,
+    'fast': OutputOptions(compress_level=1),
+    'small': OutputOptions(compress_level=9, optimize=True),
+    'proof': OutputOptions(format="jpeg", quality=85),
+    'webp': OutputOptions(format="webp", quality=90, method=4),
+    'webp-lossless': OutputOptions(format="webp", lossless=True, method=0)
+}
+
+
+def encode_image(img, options=DEFAULT_OUTPUT):
+    encoded = BytesIO()
+    if options.format == "png":
+        img.save(encoded, format="PNG", compress_level=options.compress_level, optimize=options.optimize)
+    elif options.format == "webp":
+        img.save(encoded, format="WEBP", quality=options.quality, lossless=options.lossless, method=options.method)
+    elif options.format == "jpeg":
+        flat = Image.new("RGB", img.size, JPEG_BACKGROUND)
+        flat.paste(img, mask=img.getchannel("A") if "A" in img.getbands() else None)
+        flat.save(encoded, format="JPEG", quality=options.quality)
+    else:
+        raise ValueError(f"unknown output format '{options.format}', expected one of {', '.join(FORMAT_EXTENSIONS)}")
+    return encoded.getvalue()
+
+
+"""
+Creates a hidden temp file in path's directory, to be renamed over path once it is written, and returns its fd and
+name. It is readable like any other output file, rather than by its owner only as mkstemp leaves it.
+"""
+def temp_file_beside(path, suffix=".tmp"):
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path) or ".", prefix=".", suffix=suffix)
+    os.chmod(tmp_path, OUTPUT_FILE_MODE)
+    return fd, tmp_path
+
+
+def write_atomic(path, data):
+    fd, tmp_path = temp_file_beside(path)
+    try:
+        with os.fdopen(fd, 'wb') as tmp_f:
+            tmp_f.write(data)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def write_image(img, path, options=DEFAULT_OUTPUT):
+    with instrument.stage("encode"):
+        data = encode_image(img, options)
+    with instrument.stage("write"):
+        write_atomic(path, data)
+    return path
+
+
+PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+PNG_FILTER_UP = b"\x02"
+
+
+def png_chunk(chunk_type, data):
+    return struct.pack(">I", len(data)) + chunk_type + data + struct.pack(">I", zlib.crc32(chunk_type + data))
+
+
+class PngBandWriter:
+    """
+    Writes an RGBA PNG a band of rows at a time, for images too large to hold whole. Every row is stored with the
+    Up filter, which ImageChops computes for a whole band at once, and deflated into the file as it comes. Like
+    write_atomic, the file is written under a temp name and only renamed into place by close().
+    """
+    def __init__(self, path, size, compress_level=6):
+        self.path = path
+        self.size = tuple(size)
+        self.rows = 0
+        self.last_row = Image.new("RGBA", (self.size[0], 1), (0, 0, 0, 0))
+        self.deflate = zlib.compressobj(compress_level)
+        fd, self.tmp_path = temp_file_beside(path)
+        self.png_f = os.fdopen(fd, 'wb')
+        self.png_f.write(PNG_SIGNATURE)
+        # 8 bits per channel, color type 6 (RGBA), default compression and filtering, no interlacing.
+        self.png_f.write(png_chunk(b"IHDR", struct.pack(">IIBBBBB", *self.size, 8, 6, 0, 0, 0)))
+
+    def write_band(self, band):
+        band_w, band_h = band.size
+        if band_w != self.size[0] or self.rows + band_h > self.size[1]:
+            raise ValueError(f"band of {band_w}x{band_h} doesn't fit at row {self.rows} of a {self.size} png")
+
+        # The Up filter stores every byte less the one above it, the row above the band's first is the last one of
+        # the band before.
+        above = Image.new("RGBA", band.size)
+        above.paste(self.last_row, (0, 0))
+        above.paste(band.crop((0, 0, band_w, band_h - 1)), (0, 1))
+        filtered = ImageChops.subtract_modulo(band, above).tobytes()
+
+        stride = band_w * 4
+        rows = b"".join(PNG_FILTER_UP + filtered[i:i + stride] for i in range(0, len(filtered), stride))
+        self.write_idat(self.deflate.compress(rows))
+        self.last_row = band.crop((0, band_h - 1, band_w, band_h))
+        self.rows += band_h
+
+    def write_idat(self, data):
+        if len(data) > 0:
+            self.png_f.write(png_chunk(b"IDAT", data))
+
+    def close(self):
+        try:
+            if self.rows != self.size[1]:
+                raise ValueError(f"png closed after {self.rows} of its {self.size[1]} rows")
+            self.write_idat(self.deflate.flush())
+            self.png_f.write(png_chunk(b"IEND", b""))
+            self.png_f.close()
+        except BaseException:
+            self.abort()
+            raise
+        os.replace(self.tmp_path, self.path)
+        return self.path
+
+    def abort(self):
+        self.png_f.close()
+        if os.path.exists(self.tmp_path):
+            os.remove(self.tmp_path)
+
+
+class ImageWriter:
+    """
+    Encodes and writes card images on background threads, so the caller can start on the next card. zlib and the
+    other encoders release the GIL while they work. write() returns a future for the output path, close() waits
+    for everything submitted and raises the first failed write, unless the caller has handled the futures itself.
+    With one worker the writes happen in the order they were submitted.
+    """
+    def __init__(self, workers=2, options=DEFAULT_OUTPUT):
+        self.options = options
+        self.pool = ThreadPoolExecutor(max_workers=workers)
+        self.pending = []
+        self.lock = threading.Lock()
+
+    def write(self, img, path, options=None):
+        future = self.pool.submit(write_image, img, path, options or self.options)
+        with self.lock:
+            self.pending = [f for f in self.pending if not f.done() or f.exception() is not None]
+            self.pending.append(future)
+        return future
+
+    def close(self, raise_errors=True):
+        self.pool.shutdown(wait=True)
+        with self.lock:
+            pending, self.pending = self.pending, []
+        if raise_errors:
+            for future in pending:
+                future.result()
+
+
+def add_output_arguments(ap):
+    ap.add_argument('--preset', choices=sorted(PRESETS), default='default',
+                    help="output settings: fast is lossless with light compression, proof is jpeg")
+    ap.add_argument('--format', choices=sorted(FORMAT_EXTENSIONS), default=None, help="output image format")
+    ap.add_argument('--compress-level', type=int, default=None, help="png compression level, 0-9")
+    ap.add_argument('--quality', type=int, default=None, help="webp/jpeg quality, 1-100")
+
+
+def options_from_args(args):
+    options = PRESETS[args.preset]
+    overrides = {}
+    if args.format is not None:
+        overrides['format'] = args.format
+    if args.compress_level is not None:
+        overrides['compress_level'] = args.compress_level
+    if args.quality is not None:
+        overrides['quality'] = args.quality
+    return replace(options, **overrides)
@@ -0,0 +1,147 @@
+import os.path
+import queue
+import threading
+import time
+
+from pycardcon import output, render, util
+
+"""
+Streaming render pipeline. Cards flow through resolve -> composite -> text -> encode -> write stages, each running
+on its own thread, with a bounded queue between every pair of stages. At most queue_size cards wait between two
+stages, so memory stays capped however many cards are fed in, and file reads, encoding and disk writes overlap
+with compositing.
+
+    for result in pipeline.render_stream(card_paths, resource_dir, output_dir):
+        print(result['output'] or result['error'])
+"""
+
+STAGES = ("resolve", "composite", "text", "encode", "write")
+QUEUE_SIZE = 4
+
+# Sentinel passed down the stages once the input runs out.
+END = object()
+
+
+class Pipeline:
+
+    def __init__(self, resource_dir, output_dir, root_dir=None, queue_size=QUEUE_SIZE,
+                 output_options=output.DEFAULT_OUTPUT, scale=1.0):
+        self.resource_dir = resource_dir
+        self.output_dir = output_dir
+        self.root_dir = root_dir
+        self.output_options = output_options
+        self.scale = scale
+        self.queues = [queue.Queue(maxsize=queue_size) for _ in range(len(STAGES) + 1)]
+        self.stopped = threading.Event()
+        self.threads = []
+
+    def output_path_for(self, card_path, card):
+        out_dir = self.output_dir
+        if self.root_dir is not None:
+            out_dir = os.path.join(self.output_dir, os.path.relpath(os.path.dirname(card_path), self.root_dir))
+        return os.path.normpath(os.path.join(out_dir, render.card_output_fn(card, self.output_options)))
+
+    ## Stages. Each takes the job dict for one card and fills in what the next stage needs. ##
+    def resolve(self, job):
+        job['card'] = util.read_card(job['card_path'], self.resource_dir).scaled(self.scale)
+        job['output'] = self.output_path_for(job['card_path'], job['card'])
+
+    def composite(self, job):
+        job['image'] = render.composite_card(job['card'], os.path.dirname(job['card_path']))
+
+    def text(self, job):
+        job['image'] = render.draw_card_text(job['image'], job['card'], self.resource_dir)
+
+    def encode(self, job):
+        job['data'] = output.encode_image(job.pop('image'), self.output_options)
+
+    def write(self, job):
+        os.makedirs(os.path.dirname(job['output']), exist_ok=True)
+        output.write_atomic(job['output'], job.pop('data'))
+
+    def put(self, stage_queue, item):
+        # Blocks while the next stage is behind, but gives up once the pipeline is closed.
+        while not self.stopped.is_set():
+            try:
+                stage_queue.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def get(self, stage_queue):
+        while not self.stopped.is_set():
+            try:
+                return stage_queue.get(timeout=0.1)
+            except queue.Empty:
+                continue
+        return END
+
+    def run_stage(self, stage_fn, in_queue, out_queue):
+        while True:
+            job = self.get(in_queue)
+            if job is END:
+                self.put(out_queue, END)
+                return
+
+            # A failed card skips the remaining stages but still comes out the end with its error.
+            if job['error'] is None:
+                start = time.perf_counter()
+                try:
+                    stage_fn(job)
+                except Exception as e:
+                    job['error'] = f"{type(e).__name__}: {e}"
+                    job.pop('image', None)
+                    job.pop('data', None)
+                job['seconds'][stage_fn.__name__] = time.perf_counter() - start
+
+            if not self.put(out_queue, job):
+                return
+
+    def feed(self, card_paths):
+        for card_path in card_paths:
+            job = {'card_path': card_path, 'card': None, 'output': None, 'error': None, 'seconds': {}}
+            if not self.put(self.queues[0], job):
+                return
+        self.put(self.queues[0], END)
+
+    def start(self, card_paths):
+        self.threads.append(threading.Thread(target=self.feed, args=(card_paths,), daemon=True))
+        for i, stage in enumerate(STAGES):
+            self.threads.append(threading.Thread(target=self.run_stage, daemon=True,
+                                                 args=(getattr(self, stage), self.queues[i], self.queues[i+1])))
+        for thread in self.threads:
+            thread.start()
+
+    def results(self):
+        while True:
+            job = self.get(self.queues[-1])
+            if job is END:
+                return
+            yield {
+                'card': job['card_path'],
+                'output': job['output'] if job['error'] is None else None,
+                'error': job['error'],
+                'seconds': job['seconds']
+            }
+
+    def close(self):
+        self.stopped.set()
+        for thread in self.threads:
+            thread.join()
+
+
+"""
+Renders card_paths and yields one result dict per card, in input order, once its image is on disk. Outputs go to
+output_dir, mirroring each card's directory under root_dir when it is given. A scale other than 1 renders previews,
+like the watcher's --scale. Closing the generator early stops the pipeline.
+"""
+def render_stream(card_paths, resource_dir, output_dir, root_dir=None, queue_size=QUEUE_SIZE,
+                  output_options=output.DEFAULT_OUTPUT, scale=1.0):
+    pipeline = Pipeline(resource_dir, output_dir, root_dir=root_dir, queue_size=queue_size,
+                        output_options=output_options, scale=scale)
+    pipeline.start(card_paths)
+    try:
+        yield from pipeline.results()
+    finally:
+        pipeline.close()
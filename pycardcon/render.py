@@ -1,56 +1,102 @@
+import itertools
 import os.path
-
-from PIL import Image, ImageDraw, ImageFont
-from cairosvg import svg2png
-from io import BytesIO
-
-from pycardcon.text import parse
-from pycardcon.util import read_card
+from dataclasses import replace
+
+from PIL import Image, ImageDraw
+
+from pycardcon import instrument, masking
+from pycardcon.cache import LRUCache, file_key, image_nbytes, load_alpha_bbox, load_image_asset, open_image
+from pycardcon.fonts import font_variant_path, load_font, text_width
+from pycardcon.model import ResolvedCard
+from pycardcon.output import DEFAULT_OUTPUT, encode_image, write_image
+from pycardcon.svg import rasterize_svg, svg_size
+from pycardcon.template import load_frame_group, load_frame_layer
+from pycardcon.text import SYMBOL_MANIFEST_FN, parse
+from pycardcon.util import read_card, resolve_card
 from pycardcon.errors import InvalidTextRegion
+from pycardcon.linebreak import line_breaker
 
 SYMBOL_RATIO = 0.865
 DROP_SHADOW_RATIO = 0.1
 LINE_MARGIN_RATIO = 0.02
 NEWLINE_MARGIN = 0.5
 DESCENDER_ADJUSTMENT_RATIO = 0.1
-FONT_REDUCTION_ON_FAIL_RATIO = 0.9
 
 ## Helper Methods ##
 def scale_art_bounds(art_obj, art_img, card_size):
-    art_x = int(art_obj['x']*card_size[0])
-    art_y = int(art_obj['y']*card_size[1])
-    art_w = int(art_img.size[0]*art_obj['zoom'])
-    art_h = int(art_img.size[1]*art_obj['zoom'])
+    art_x = int(art_obj.x*card_size[0])
+    art_y = int(art_obj.y*card_size[1])
+    art_w = int(art_img.size[0]*art_obj.zoom)
+    art_h = int(art_img.size[1]*art_obj.zoom)
     return art_x, art_y, art_w, art_h
 
 
 def scale_bounds(bounds, size):
-    x = bounds['x'] * size[0]
-    y = bounds['y'] * size[1]
-    w = bounds['width'] * size[0]
-    h = bounds['height'] * size[1]
+    x = bounds.x * size[0]
+    y = bounds.y * size[1]
+    w = bounds.width * size[0]
+    h = bounds.height * size[1]
     return int(x), int(y), int(w), int(h)
 
 
+def box_size(box):
+    return box[2] - box[0], box[3] - box[1]
+
+
+def intersect_boxes(box_a, box_b):
+    if box_a is None or box_b is None:
+        return None
+    box = max(box_a[0], box_b[0]), max(box_a[1], box_b[1]), min(box_a[2], box_b[2]), min(box_a[3], box_b[3])
+    if box[0] >= box[2] or box[1] >= box[3]:
+        return None
+    return box
+
+
+def union_boxes(box_a, box_b):
+    if box_a is None:
+        return box_b
+    if box_b is None:
+        return box_a
+    return min(box_a[0], box_b[0]), min(box_a[1], box_b[1]), max(box_a[2], box_b[2]), max(box_a[3], box_b[3])
+
+
+def offset_box(box, dx, dy):
+    return box[0] + dx, box[1] + dy, box[2] + dx, box[3] + dy
+
+
+def alpha_composite_clipped(base, img, dest):
+    # Image.alpha_composite only takes destinations inside base, this also takes ones above or left of it.
+    x, y = dest
+    if x >= base.width or y >= base.height or -x >= img.width or -y >= img.height:
+        return base
+    base.alpha_composite(img, dest=(max(0, x), max(0, y)), source=(max(0, -x), max(0, -y)))
+    return base
+
+
 """
-Handles the case's where it's a svg and needs to be converted. 
+Handles the case's where it's a svg and needs to be converted. An svg is rasterized straight at size, when given.
 """
-def read_maybe_svg_file(mask_fn):
+def read_maybe_svg_file(mask_fn, size=None):
     if ".svg" in mask_fn:
-        with open(mask_fn, 'rb') as mask_f:
-            mask_svg = svg2png(mask_f.read())
-        return Image.open(BytesIO(mask_svg))
+        return rasterize_svg(mask_fn, size)
     else:
         return Image.open(mask_fn)
 
 
+def load_asset_part(path, size, box, mode=None, opener=open_image):
+    img = load_image_asset(path, size=size, mode=mode, opener=opener)
+    if box == (0, 0, *img.size):
+        # The cached image itself, so it must not be drawn on.
+        return img
+    return img.crop(box)
+
+
 ## Per-Card-Component Draw Methods. ##
 def draw_art(card_img, art_obj, img_root):
-    if art_obj['src'] == '':
+    if art_obj.src == '':
         return card_img
 
-    # art_fn = f"{img_root}/{art_obj['src']}"
-    art_path = os.path.join(img_root, art_obj['src'])
+    art_path = os.path.join(img_root, art_obj.src)
     art_img = Image.open(art_path)
 
     art_x, art_y, art_w, art_h = scale_art_bounds(art_obj, art_img, card_img.size)
@@ -58,274 +104,587 @@ def draw_art(card_img, art_obj, img_root):
     return card_img
 
 
-def draw_frames(card_img, frames):
+"""
+Frames are composited one at a time, each only over the part of the card it can change. That region is the
+frame's box, grown to the opaque part of its blend (a blend also darkens outside the box) and shrunk to the
+opaque part of its masks, all clipped to the card. Every step is per pixel, so working on the region alone gives
+the same result as working on a padded card-size canvas.
+
+For the same reason card_img can be just a part of a card of card_size, with its top left corner at origin on the
+card, and only that part is drawn. load_part(path, size, box, mode, opener) returns the box of an image resized to
+size and load_bbox(path, size, mode, opener) the box of its opaque pixels at that size, a box that is too large only
+costs time.
+"""
+def draw_frames(card_img, frames, card_size=None, origin=(0, 0), load_part=load_asset_part,
+                load_bbox=load_alpha_bbox):
+    if card_size is None:
+        card_size = card_img.size
+    o_x, o_y = origin
+    card_box = intersect_boxes((0, 0, *card_size), (o_x, o_y, o_x + card_img.width, o_y + card_img.height))
     for frame in frames:
-        frame_padded = Image.new("RGBA", card_img.size, (0, 0, 0, 0))
-        f_x, f_y, f_w, f_h = scale_bounds(frame['bounds'], card_img.size)
-
-        if 'alphaShade' in frame:
-            shade_img = Image.new("RGBA", (f_w, f_h), frame['value'])
-            frame_padded.paste(shade_img, (f_x, f_y))
-        else:
-            frame_img = Image.open(os.path.join(frame['fn']))
-            frame_img = frame_img.resize((f_w, f_h))
-            frame_padded.paste(frame_img, (f_x, f_y))
-
-            blending = False
-            if 'blend' in frame:
-                blending = True
-                blend_img = Image.open(os.path.join(frame['blend']['fn']))
-                blend_img = blend_img.resize(frame_padded.size)
-                masked_blend = blend_img  # Done to get rid of another 'blending?' check later.
-
-            if 'masks' in frame:
-                masked_blend = Image.new("RGBA", frame_padded.size)
-                masked_frame = Image.new("RGBA", frame_padded.size)
-                for mask in frame['masks']:
-                    mask_img = read_maybe_svg_file(os.path.join(mask['fn']))
-                    mask_img = mask_img.convert("RGBA")
-                    mask_img = mask_img.resize(frame_padded.size)
-                    masked_frame.paste(frame_padded, mask=mask_img)
-
-                    if blending:
-                        masked_blend.paste(blend_img, mask=mask_img)
-
-                frame_padded = masked_frame
-
-            if blending:
-                # If blending w.o masking, this would result in a 'blank' alpha w.o the commented line above.
-                frame_padded.putalpha(masked_blend.getchannel("A"))
-
-        card_img.alpha_composite(frame_padded)
+        f_x, f_y, f_w, f_h = scale_bounds(frame.bounds, card_size)
+        frame_box = (f_x, f_y, f_x + f_w, f_y + f_h)
+        region = intersect_boxes(card_box, frame_box)
+
+        if frame.shade is not None:
+            if region is not None:
+                card_img.alpha_composite(Image.new("RGBA", box_size(region), frame.shade),
+                                         dest=(region[0] - o_x, region[1] - o_y))
+            continue
+
+        if frame.blend is not None:
+            region = union_boxes(region, intersect_boxes(card_box, load_bbox(frame.blend, size=card_size)))
+        if len(frame.masks) > 0:
+            mask_box = None
+            for mask_fn in frame.masks:
+                mask_box = union_boxes(mask_box, load_bbox(mask_fn, size=card_size, mode="RGBA",
+                                                           opener=read_maybe_svg_file))
+            region = intersect_boxes(region, mask_box)
+        if region is None:
+            continue
+
+        frame_region = Image.new("RGBA", box_size(region), (0, 0, 0, 0))
+        frame_part_box = intersect_boxes(region, frame_box)
+        if frame_part_box is not None:
+            frame_part = load_part(frame.fn, (f_w, f_h), offset_box(frame_part_box, -f_x, -f_y))
+            frame_region.paste(frame_part, (frame_part_box[0] - region[0], frame_part_box[1] - region[1]))
+
+        blend_region = None
+        if frame.blend is not None:
+            blend_region = load_part(frame.blend, card_size, region)
+        mask_regions = [load_part(mask_fn, card_size, region, "RGBA", read_maybe_svg_file) for mask_fn in frame.masks]
+        frame_region = mask_frame_region(frame_region, mask_regions, blend_region)
+
+        card_img.alpha_composite(frame_region, dest=(region[0] - o_x, region[1] - o_y))
     return card_img
 
 
-def draw_text(card_img, card, resource_root):
-    for text_region in card['textRegions']:
-        render_text_region(card_img, card, text_region, card['textRegions'][text_region], resource_root)
+"""
+Pastes frame_region through each of mask_regions in turn and, with a blend_region, gives it the blend's alpha masked
+the same way. Uses the numpy backend in masking.py when it's enabled, which gives the same pixels.
+"""
+def mask_frame_region(frame_region, mask_regions, blend_region):
+    if masking.enabled:
+        masked_region = masking.mask_frame_region(frame_region, mask_regions, blend_region)
+        if masked_region is not None:
+            return masked_region
+
+    masked_blend = blend_region  # Done to get rid of another 'blending?' check later.
+    if len(mask_regions) > 0:
+        masked_blend = Image.new("RGBA", frame_region.size)
+        masked_frame = Image.new("RGBA", frame_region.size)
+        for mask_region in mask_regions:
+            masked_frame.paste(frame_region, mask=mask_region)
+            if blend_region is not None:
+                masked_blend.paste(blend_region, mask=mask_region)
+        frame_region = masked_frame
+
+    if blend_region is not None:
+        # If blending w.o masking, this would result in a 'blank' alpha w.o the commented line above.
+        frame_region.putalpha(masked_blend.getchannel("A"))
+    return frame_region
+
+
+def draw_text(card_img, card, resource_root, fit_stats=None):
+    for text_region in card.text_regions:
+        render_text_region(card_img, card, text_region, resource_root, fit_stats)
     return card_img
 
 
-def render_text_region(img, card_obj, text_region_name, text_region, resource_root):
+"""
+Measures the tokens of a text region at a single font size, without painting anything. Returns the paragraphs of
+the text, each a list of items for a linebreak breaker: words with the font they are set in, and symbols. Word
+widths come from the font's width cache, so the words every card shares are measured once per size.
+"""
+def measure_text_items(tokens, card_obj, text_region, fontsize, resource_root):
+    text_font_path = os.path.join(resource_root, "fonts", text_region.font)
+    text_font = load_font(text_font_path, fontsize)
+    paragraphs = [[]]
+
+    def add_str(token_str):
+        token_width = text_width(text_font, token_str)
+        paragraphs[-1].append({'kind': 'str', 'text': token_str, 'font': text_font, 'width': token_width,
+                               'advance': int(token_width)})
+
+    for token in tokens:
+        if token.token_type == 'newline':
+            paragraphs.append([])
+
+        if token.token_type == 'str':
+            add_str(f"{token.content}{token.whitespace}")
+
+        if token.token_type == 'symbol':
+            symbol_size = int(fontsize*SYMBOL_RATIO)
+            if token.whitespace != "":
+                gap = int(text_width(text_font, token.whitespace))
+            else:
+                gap = int(0.1*symbol_size)
+            paragraphs[-1].append({
+                'kind': 'symbol',
+                'y': int((fontsize-symbol_size)*0.5),
+                'size': symbol_size,
+                'path_to_img': token.path_to_img,
+                'width': symbol_size,
+                'advance': symbol_size + gap
+            })
+
+        if token.token_type == 'card_meta':
+            if token.content == "display-title":
+                add_str(f"{card_obj.title}{token.whitespace}")
+
+        if token.token_type == 'font_change':
+            if token.value == 0:
+                text_font = load_font(text_font_path, fontsize)
+            else:
+                text_font = load_font(text_font_path, fontsize, variant="italic")
+    return paragraphs
 
-    for field in ['text', 'size', 'width', 'height', 'x', 'y']:
-        if field not in text_region:
-            raise InvalidTextRegion(text_region_name, field)
 
-    tokens   = parse(text_region['text'], resource_root)
-    fontsize = int(text_region['size']*img.size[1])
-    tr_w     = int(text_region['width']*img.size[0])
+"""
+Lays out the tokens of a text region at a single font size: measures them, breaks each paragraph into lines with
+the region's line_break method and places the lines top down. Returns whether the text fits in tr_h, the y of the
+last line, and the lines for paint_text_lines, each with its items, width and y. Text that doesn't fit is cut after
+the first line that runs past tr_h.
+"""
+def layout_text_tokens(tokens, card_obj, text_region, fontsize, tr_w, tr_h, resource_root):
+    # Looked up first, so a region with a bad lineBreak fails even while its text is empty.
+    breaker = line_breaker(text_region.line_break)
+    if len(tokens) == 0:
+        return True, 0, [{'items': [], 'width': 0, 'y': 0}]
+
+    lines = []
+    cur_y_tr = 0
+    for paragraph in measure_text_items(tokens, card_obj, text_region, fontsize, resource_root):
+        if len(lines) > 0:
+            cur_y_tr += int(fontsize*(1+NEWLINE_MARGIN))
+        for line_n, line_items in enumerate(breaker(paragraph, tr_w)):
+            if line_n > 0:
+                cur_y_tr += int(fontsize * (1 + 3 * LINE_MARGIN_RATIO))
+            cur_x = 0
+            for item in line_items:
+                item['x'] = cur_x
+                cur_x += item['advance']
+            lines.append({'items': line_items, 'width': cur_x, 'y': cur_y_tr})
+            if cur_y_tr+fontsize > tr_h:
+                return False, cur_y_tr, lines
+    return True, cur_y_tr, lines
 
-    if 'color' in text_region:
-        tr_color = text_region['color']
-    else:
-        tr_color = "black"
-
-    if 'align' not in text_region:
-        text_region['align'] = 'left'
-    if 'verticalAlign' not in text_region:
-        text_region['verticalAlign'] = 'top'
-
-    def attempt_render(text_image):
-        text_font_path = os.path.join(resource_root, "fonts", text_region['font'])
-        text_font = ImageFont.truetype(text_font_path, fontsize)
-        cur_line_img  = Image.new("RGBA", (tr_w, int(fontsize*(1+DESCENDER_ADJUSTMENT_RATIO))), (0, 0, 0, 0))
-        cur_line_draw = ImageDraw.Draw(cur_line_img)
-        cur_x, cur_y_tr = 0, 0
-
-        def paint_cur_line(cl_img, c_x, c_y):
-            if text_region['align'] == "left":
-                text_image.alpha_composite(cl_img, dest=(0, c_y))
-            elif text_region['align'] == 'right':
-                dx = tr_w - c_x
-                text_image.alpha_composite(cl_img, dest=(dx, c_y))
-            else:  # Center Aligned
-                dx = int(0.5*(tr_w - c_x))
-                text_image.alpha_composite(cl_img, dest=(dx, c_y))
-
-        for token in tokens:
-            if token['token_type'] == 'newline':
-                paint_cur_line(cur_line_img, cur_x, cur_y_tr)
-                cur_x = 0
-                cur_y_tr += int(fontsize*(1+NEWLINE_MARGIN))
-
-                cur_line_img  = Image.new("RGBA", (tr_w, int(fontsize*(1+DESCENDER_ADJUSTMENT_RATIO))), (0, 0, 0, 0))
-                cur_line_draw = ImageDraw.Draw(cur_line_img)
-
-            if token['token_type'] == 'str':
-                token_str   = f"{token['content']}{token['whitespace']}"
-                token_width = cur_line_draw.textlength(token_str, text_font)
-
-                if cur_x+token_width > tr_w:
-                    paint_cur_line(cur_line_img, cur_x, cur_y_tr)
-                    cur_x = 0
-                    cur_y_tr += int(fontsize * (1 + 3 * LINE_MARGIN_RATIO))
-                    cur_line_img = Image.new("RGBA", (tr_w, int(fontsize*(1+DESCENDER_ADJUSTMENT_RATIO))), (0, 0, 0, 0))
-                    cur_line_draw = ImageDraw.Draw(cur_line_img)
-
-                # cur_line_draw.text((cur_x, 0), token_str, font=text_font, fill="black")
-                cur_line_draw.text((cur_x, fontsize*(1+DESCENDER_ADJUSTMENT_RATIO)), token_str, font=text_font, fill=tr_color, anchor='ld')
-                cur_x += int(token_width)
-
-            if token['token_type'] == 'symbol':
-                with open(os.path.join(token['path_to_img']), 'rb') as mask_f:
-                    mana_svg = svg2png(mask_f.read())
-
-                symbol_size = int(fontsize*SYMBOL_RATIO)
-                mana_y = int((fontsize-symbol_size)*0.5)
-
-                if cur_x+symbol_size > tr_w:
-                    paint_cur_line(cur_line_img, cur_x, cur_y_tr)
-                    cur_x = 0
-                    cur_y_tr += int(fontsize * (1 + 3 * LINE_MARGIN_RATIO))
-                    cur_line_img = Image.new("RGBA", (tr_w, int(fontsize*(1+DESCENDER_ADJUSTMENT_RATIO))), (0, 0, 0, 0))
-                    cur_line_draw = ImageDraw.Draw(cur_line_img)
-
-                mana_img = Image.open(BytesIO(mana_svg))
-                mana_img = mana_img.resize((symbol_size, symbol_size))
-
-                # Drop shadow
-                if text_region['dropShadows']:
-                    ds_x0, ds_y0 = cur_x, mana_y+DROP_SHADOW_RATIO*symbol_size
-                    ds_x1, ds_y1 = cur_x+symbol_size, mana_y + (DROP_SHADOW_RATIO+1)*symbol_size
-                    cur_line_draw.ellipse((ds_x0, ds_y0, ds_x1, ds_y1), fill='black')
-
-                cur_line_img.alpha_composite(mana_img, (cur_x, mana_y))
-
-                cur_x += symbol_size
-                if token['whitespace'] != "":
-                    cur_x += int(cur_line_draw.textlength(token['whitespace'], text_font))
-                else:
-                    cur_x += int(0.1*symbol_size)
-
-            if token['token_type'] == 'card_meta':
-                if token['card_field'] == "display-title":
-                    token_str = f"{card_obj['textRegions']['display-title']['text']}{token['whitespace']}"
-                    token_width = cur_line_draw.textlength(token_str, text_font)
-
-                    if cur_x + token_width > tr_w:
-                        paint_cur_line(cur_line_img, cur_x, cur_y_tr)
-                        cur_x = 0
-                        cur_y_tr += int(fontsize * (1 + 3 * LINE_MARGIN_RATIO))
-                        cur_line_img = Image.new("RGBA", (tr_w, int(fontsize*(1+DESCENDER_ADJUSTMENT_RATIO))), (0, 0, 0, 0))
-                        cur_line_draw = ImageDraw.Draw(cur_line_img)
-
-                    # cur_line_draw.text((cur_x, 0), token_str, font=text_font, fill="black")
-                    cur_line_draw.text((cur_x, fontsize * (1 + DESCENDER_ADJUSTMENT_RATIO)), token_str, font=text_font,
-                                       fill=tr_color, anchor='ld')
-                    cur_x += int(token_width)
-
-            if token['token_type'] == 'font_change':
-                if token['val'] == 0:
-                    font_path = os.path.join(resource_root, "fonts", text_region['font'])
-                else:
-                    font_str = text_region['font'].replace(".ttf", "-i.ttf")
-                    font_path = os.path.join(resource_root, "fonts", font_str)
-                text_font = ImageFont.truetype(font_path, fontsize)
-
-            if cur_y_tr+fontsize > text_region['height']*img.size[1]:
-                return False, 0
-
-        paint_cur_line(cur_line_img, cur_x, cur_y_tr)
-        return True, cur_y_tr
-
-    tr_size = (int(text_region['width']*img.size[0]), int(text_region['height']*img.size[1]))
-    t_img = Image.new("RGBA", tr_size, (0, 0, 0, 0))
-
-    done, last_text_y = attempt_render(t_img)
-    while not done:
-        fontsize = int(fontsize*FONT_REDUCTION_ON_FAIL_RATIO)
-        t_img = Image.new("RGBA", tr_size, (0, 0, 0, 0))
-        done, last_text_y = attempt_render(t_img)
-
-    if text_region['verticalAlign'] == "top":
-        tr_loc = (int(text_region['x']*img.size[0]), int(text_region['y']*img.size[1]))
-    elif text_region['verticalAlign'] == "center":
-        dy = text_region['height']*img.size[1]-(last_text_y+fontsize)
-        tr_loc = (int(text_region['x']*img.size[0]), int(text_region['y']*img.size[1]+0.5*dy))
-    else:  # Bottom Vertical Align
-        dy = text_region['height']*img.size[1]-(last_text_y+fontsize)
-        tr_loc = (int(text_region['x']*img.size[0]), int(text_region['y']*img.size[1]+dy))
-
-    img.alpha_composite(t_img, tr_loc)
+
+"""
+Finds the largest integer font size, up to max_fontsize, at which the tokens fit the region. The first attempt
+is at max_fontsize, since most regions fit as written, after that it is a binary search over the smaller sizes.
+Returns the size, the layout at that size, and how many sizes were laid out to find it.
+"""
+def fit_text_tokens(tokens, card_obj, text_region, max_fontsize, tr_w, tr_h, resource_root):
+    attempts = 0
+
+    def attempt(fontsize):
+        nonlocal attempts
+        attempts += 1
+        return layout_text_tokens(tokens, card_obj, text_region, fontsize, tr_w, tr_h, resource_root)
+
+    fits, last_text_y, lines = attempt(max_fontsize)
+    if fits:
+        return max_fontsize, last_text_y, lines, attempts
+
+    # If nothing fits even at size 1 the truncated layout at size 1 is used, rather than shrinking forever.
+    best = (1, last_text_y, lines) if max_fontsize == 1 else None
+    lo, hi = 1, max_fontsize-1
+    while lo <= hi:
+        mid = (lo+hi)//2
+        fits, last_text_y, lines = attempt(mid)
+        if fits:
+            best = (mid, last_text_y, lines)
+            lo = mid+1
+        else:
+            if mid == 1:
+                best = (mid, last_text_y, lines)
+            hi = mid-1
+
+    fontsize, last_text_y, lines = best
+    return fontsize, last_text_y, lines, attempts
+
+
+"""
+Paints laid out lines onto text_image, which holds the rows of the text region from top down. Each line is drawn
+on its own line image, which clips it like it always has, its words as runs of text: one draw call per run of words
+that can be set together without moving any of them (see text_runs).
+"""
+def paint_text_lines(text_image, lines, fontsize, align, tr_color, drop_shadows, top=0):
+    tr_w = text_image.size[0]
+    line_h = int(fontsize*(1+DESCENDER_ADJUSTMENT_RATIO))
+    for line in lines:
+        if len(line['items']) == 0:
+            continue
+        if line['y'] + line_h <= top or line['y'] >= top + text_image.size[1]:
+            continue
+
+        line_img = Image.new("RGBA", (tr_w, line_h), (0, 0, 0, 0))
+        line_draw = ImageDraw.Draw(line_img)
+        for run in text_runs(line['items']):
+            if run['kind'] == 'str':
+                line_draw.text((run['x'], fontsize*(1+DESCENDER_ADJUSTMENT_RATIO)), run['text'], font=run['font'],
+                               fill=tr_color, anchor='ld')
+            else:
+                symbol_size = run['size']
+                if drop_shadows:
+                    ds_x0, ds_y0 = run['x'], run['y']+DROP_SHADOW_RATIO*symbol_size
+                    ds_x1, ds_y1 = run['x']+symbol_size, run['y'] + (DROP_SHADOW_RATIO+1)*symbol_size
+                    line_draw.ellipse((ds_x0, ds_y0, ds_x1, ds_y1), fill='black')
+
+                mana_img = rasterize_svg(os.path.join(run['path_to_img']), (symbol_size, symbol_size))
+                line_img.alpha_composite(mana_img, (run['x'], run['y']))
+
+        if align == "left":
+            dx = 0
+        elif align == 'right':
+            dx = tr_w - line['width']
+        else:  # Center Aligned
+            dx = int(0.5*(tr_w - line['width']))
+        if line['y'] >= top:
+            text_image.alpha_composite(line_img, dest=(dx, line['y'] - top))
+        else:
+            text_image.alpha_composite(line_img, dest=(dx, 0), source=(0, top - line['y']))
+    return text_image
+
+
+def text_runs(items):
+    # Consecutive words in the same font are joined into one run, symbols are runs of their own. Words are laid out
+    # at whole pixel x, so a word only joins the run before it when the run's text ends exactly at that x and the
+    # joined text adds up, nothing kerned across the join. Any other word starts a run of its own, drawn where it
+    # was laid out.
+    runs = []
+    for item in items:
+        if item['kind'] == 'str' and len(runs) > 0 and runs[-1]['kind'] == 'str' and runs[-1]['font'] is item['font']:
+            run = runs[-1]
+            run_width = text_width(item['font'], run['text'])
+            joined_width = text_width(item['font'], run['text'] + item['text'])
+            if run['x'] + run_width == item['x'] and joined_width == run_width + item['width']:
+                runs[-1] = dict(run, text=run['text'] + item['text'])
+                continue
+        runs.append(item)
+    return runs
+
+
+"""
+Rendered text regions, keyed on everything that shapes their pixels: the region itself (less its position), the
+card size, the card title when the text uses it, and the files of the fonts and symbols it draws. A watcher edit
+that leaves a region alone reuses its bitmap instead of fitting and painting it again.
+"""
+TEXT_REGION_CACHE_MAX_BYTES = 64 * 1024 * 1024
+
+TEXT_REGION_CACHE = LRUCache(TEXT_REGION_CACHE_MAX_BYTES, sizeof=lambda entry: image_nbytes(entry[0]),
+                             name="text_regions")
+
+
+def text_region_key(card_obj, text_region, tokens, card_size, resource_root):
+    font_path = os.path.join(resource_root, "fonts", text_region.font)
+    files = [file_key(font_path)]
+    title = None
+    for token in tokens:
+        if token.token_type == 'symbol':
+            files.append(file_key(token.path_to_img))
+        elif token.token_type == 'font_change' and token.value != 0:
+            files.append(file_key(font_variant_path(font_path, "italic")))
+        elif token.token_type == 'card_meta':
+            title = card_obj.title
+    return replace(text_region, name=None, x=0, y=0), tuple(card_size), title, tuple(dict.fromkeys(files))
+
+
+def fit_text_region(card_obj, text_region, card_size, resource_root, tokens=None):
+    if tokens is None:
+        tokens = parse(text_region.text, resource_root)
+    fontsize = max(1, int(text_region.size*card_size[1]))
+    tr_w     = int(text_region.width*card_size[0])
+    return fit_text_tokens(tokens, card_obj, text_region, fontsize, tr_w, text_region.height*card_size[1],
+                           resource_root)
+
+
+def text_region_size(text_region, card_size):
+    return int(text_region.width*card_size[0]), int(text_region.height*card_size[1])
+
+
+def text_region_location(text_region, card_size, fontsize, last_text_y):
+    if text_region.vertical_align == "top":
+        return int(text_region.x*card_size[0]), int(text_region.y*card_size[1])
+    dy = text_region.height*card_size[1]-(last_text_y+fontsize)
+    if text_region.vertical_align == "center":
+        return int(text_region.x*card_size[0]), int(text_region.y*card_size[1]+0.5*dy)
+    # Bottom Vertical Align
+    return int(text_region.x*card_size[0]), int(text_region.y*card_size[1]+dy)
+
+
+"""
+Fits and paints a text region onto its own transparent image. Returns the image with the chosen font size, the y
+of the last line and the number of fitting attempts, which are all render_text_region needs to place it.
+"""
+def render_text_bitmap(card_obj, text_region, card_size, resource_root, tokens=None):
+    # Layout is measured at candidate sizes first, the region is then painted once at the size that fits.
+    fontsize, last_text_y, lines, attempts = fit_text_region(card_obj, text_region, card_size, resource_root, tokens)
+
+    t_img = Image.new("RGBA", text_region_size(text_region, card_size), (0, 0, 0, 0))
+    paint_text_lines(t_img, lines, fontsize, text_region.align, text_region.color, text_region.drop_shadows)
+    return t_img, fontsize, last_text_y, attempts
+
+
+def render_text_region(img, card_obj, text_region, resource_root, fit_stats=None):
+    missing_field = text_region.missing_field()
+    if missing_field is not None:
+        raise InvalidTextRegion(text_region.name, missing_field)
+
+    tokens = parse(text_region.text, resource_root)
+    key = text_region_key(card_obj, text_region, tokens, img.size, resource_root)
+    cached = TEXT_REGION_CACHE.get(key)
+    hit = cached is not None
+    if not hit:
+        cached = TEXT_REGION_CACHE.put(key, render_text_bitmap(card_obj, text_region, img.size, resource_root, tokens))
+        instrument.canvas("text_regions", cached[0])
+    t_img, fontsize, last_text_y, attempts = cached
+
+    if fit_stats is not None:
+        # A cached bitmap wasn't fitted again, so it cost no attempts.
+        fit_stats[text_region.name] = {'size': fontsize, 'attempts': 0 if hit else attempts, 'cached': hit}
+
+    img.alpha_composite(t_img, text_region_location(text_region, img.size, fontsize, last_text_y))
     return img
 
 
 def draw_set_symbol(img, card, resource_root):
-    symbol_fn = f"{card['infoSet']}_{card['infoRarity']}.png"
-    symbol_path = os.path.join(resource_root, "setSymbols", card['infoSet'], symbol_fn)
+    if card.set_symbol is None:
+        return img
+
+    symbol_fn = f"{card.info_set}_{card.info_rarity}.png"
+    symbol_path = os.path.join(resource_root, "setSymbols", card.info_set, symbol_fn)
 
     ss_img = Image.open(symbol_path)
-    set_symbol_meta = card['setSymbol']
-    ss_x, ss_y, ss_w, ss_h = scale_art_bounds(set_symbol_meta, ss_img, img.size)
+    ss_x, ss_y, ss_w, ss_h = scale_art_bounds(card.set_symbol, ss_img, img.size)
     img.alpha_composite(ss_img.resize((ss_w, ss_h)), (ss_x, ss_y))
     return img
 
 
-def draw_bottom_region(img, card_obj, resource_root):
+"""
+Draws the collector info at the bottom of the card. Like draw_frames, img can be just the part of a card of
+card_size with its top left corner at origin.
+"""
+def draw_bottom_region(img, card_obj, resource_root, card_size=None, origin=(0, 0)):
+    if card_obj.bottom_info is None:
+        return img
+    if card_size is None:
+        card_size = img.size
+    o_x, o_y = origin
+
     card_draw = ImageDraw.Draw(img)
 
     # Top Left
-    tl_obj = card_obj['bottomInfo']['topLeft']
-    tl_fontsize = int(tl_obj['size']*img.size[1])
+    tl_obj = card_obj.bottom_info.top_left
+    tl_fontsize = int(tl_obj.size*card_size[1])
     font_path = os.path.join(resource_root, "fonts", "gotham-medium.ttf")
-    set_font = ImageFont.truetype(font_path, tl_fontsize)
-    tl_x = int(tl_obj['x']*img.size[0])
-    tl_y = int(tl_obj['y']*img.size[1])
-    tl_str = f"{card_obj['infoNumber']:<16}{card_obj['infoRarity']}"
-    card_draw.text((tl_x, tl_y), tl_str, font=set_font)
+    set_font = load_font(font_path, tl_fontsize)
+    tl_x = int(tl_obj.x*card_size[0])
+    tl_y = int(tl_obj.y*card_size[1])
+    tl_str = f"{card_obj.info_number:<16}{card_obj.info_rarity}"
+    card_draw.text((tl_x - o_x, tl_y - o_y), tl_str, font=set_font)
 
     # Mid-Left
     # <SET * LANG (set_font)><BRUSH IMG><ARTIST STR (same font as title?)>
-    ml_obj = card_obj['bottomInfo']['midLeft']
+    ml_obj = card_obj.bottom_info.mid_left
     ml_x = tl_x
-    ml_y = int(ml_obj['y']*img.size[1])
+    ml_y = int(ml_obj.y*card_size[1])
 
     # set info
-    ml_set_str = f"{card_obj['infoSet']}*{card_obj['infoLanguage']} "
-    card_draw.text((ml_x, ml_y), ml_set_str, font=set_font)
+    ml_set_str = f"{card_obj.info_set}*{card_obj.info_language} "
+    card_draw.text((ml_x - o_x, ml_y - o_y), ml_set_str, font=set_font)
     ml_x += int(card_draw.textlength(ml_set_str, font=set_font))
 
     # artist brush
     brush_path = os.path.join(resource_root, "manaSymbols", "artistbrush.svg")
-    with open(brush_path, 'rb') as brush_f:
-        brush_svg = svg2png(brush_f.read())
-    brush_img = Image.open(BytesIO(brush_svg))
-    brush_zoom = (tl_fontsize/brush_img.size[1])*0.8
-    brush_img = brush_img.resize((int(brush_img.size[0]*brush_zoom), int(brush_img.size[1]*brush_zoom)))
-    img.alpha_composite(brush_img, (ml_x, ml_y))
+    brush_native_size = svg_size(brush_path)
+    brush_zoom = (tl_fontsize/brush_native_size[1])*0.8
+    brush_img = rasterize_svg(brush_path, (int(brush_native_size[0]*brush_zoom), int(brush_native_size[1]*brush_zoom)))
+    alpha_composite_clipped(img, brush_img, (ml_x - o_x, ml_y - o_y))
     ml_x += brush_img.size[0]
     ml_x += card_draw.textlength(" ", font=set_font)
 
     # artist line
-    artist_fontsize = int(card_obj['bottomInfo']['midLeft']['size']*img.size[1])
+    artist_fontsize = int(ml_obj.size*card_size[1])
     art_font_path = os.path.join(resource_root, "fonts", "beleren-bsc.ttf")
-    artist_font = ImageFont.truetype(art_font_path, artist_fontsize)
+    artist_font = load_font(art_font_path, artist_fontsize)
     # TODO - fix this hack. without it the artist line sinks below flush. might be an issue with anchor choice?
-    ml_y -= 12
-    card_draw.text((ml_x, ml_y), card_obj['art']['artist'], font=artist_font, fill=card_obj['bottomInfo']['midLeft']['color'])
+    ml_y -= int(12*card_obj.scale)
+    card_draw.text((ml_x - o_x, ml_y - o_y), card_obj.art.artist, font=artist_font, fill=ml_obj.color)
 
     # bottom left - NOTE FOR SALE
+    bl_obj = card_obj.bottom_info.bottom_left
     bl_x = tl_x
-    bl_y = int(card_obj['bottomInfo']['bottomLeft']['y']*img.size[1])
-    nfs_font_path = os.path.join(resource_root, "fonts", "gotham-medium.ttf")
-    nfs_font = ImageFont.truetype(nfs_font_path, int(0.8*tl_fontsize))
-    card_draw.text((bl_x, bl_y),
-                   card_obj['bottomInfo']['bottomLeft']['text'],
-                   font=nfs_font,
-                   fill=card_obj['bottomInfo']['bottomLeft']['color'])
+    bl_y = int(bl_obj.y*card_size[1])
+    nfs_font = load_font(font_path, int(0.8*tl_fontsize))
+    card_draw.text((bl_x - o_x, bl_y - o_y), bl_obj.text, font=nfs_font, fill=bl_obj.color)
     return img
 
 
-def render_card_json(card_dir, card_fn, resource_path, output_dir):
-    card_obj = read_card(os.path.join(card_dir, card_fn), resource_path)['data']
-    card_img = Image.new("RGBA", (card_obj['card']['width'], card_obj['card']['height']), (0, 0, 0, 0))
+"""
+Lists every file that rendering the card reads, beyond the card file itself: the frame pack meta it was resolved
+from, frame, mask and blend images, fonts, symbols, the set symbol and the art. Used to decide when a rendered
+card is out of date.
+"""
+def card_dependencies(card, card_dir, resource_root):
+    deps = list(card.sources)
+    if card.art.src != '':
+        deps.append(os.path.join(card_dir, card.art.src))
+
+    for frame in card.frames:
+        if frame.fn is not None:
+            deps.append(frame.fn)
+        deps.extend(frame.masks)
+        if frame.blend is not None:
+            deps.append(frame.blend)
+
+    if len(card.text_regions) > 0:
+        # Listed even when it doesn't exist, adding one can change which svg a symbol maps to.
+        deps.append(os.path.join(resource_root, SYMBOL_MANIFEST_FN))
+    for text_region in card.text_regions:
+        if text_region.font is None or text_region.text is None:
+            continue
+        deps.append(os.path.join(resource_root, "fonts", text_region.font))
+        for token in parse(text_region.text, resource_root):
+            if token.token_type == 'symbol':
+                deps.append(token.path_to_img)
+            if token.token_type == 'font_change' and token.value == 1:
+                deps.append(font_variant_path(os.path.join(resource_root, "fonts", text_region.font), "italic"))
+
+    if card.set_symbol is not None:
+        deps.append(os.path.join(resource_root, "setSymbols", card.info_set, f"{card.info_set}_{card.info_rarity}.png"))
+
+    if card.bottom_info is not None:
+        deps.append(os.path.join(resource_root, "fonts", "gotham-medium.ttf"))
+        deps.append(os.path.join(resource_root, "fonts", "beleren-bsc.ttf"))
+        deps.append(os.path.join(resource_root, "manaSymbols", "artistbrush.svg"))
+
+    return list(dict.fromkeys(os.path.abspath(dep) for dep in deps))
+
+
+"""
+A card rendered at a scale other than 1 is a preview, named "<title>@<scale>x" so it never takes the place of the
+full size output render-all writes and records in its manifest.
+"""
+def card_output_fn(card, output_options=DEFAULT_OUTPUT):
+    if card.scale != 1.0:
+        return f"{card.title}@{card.scale:g}x{output_options.extension}"
+    return f"{card.title}{output_options.extension}"
+
+
+"""
+Draws frames onto a transparent card_img like draw_frames, but each run of frames read_card generated as a group
+(see model.Frame.group) goes on as one cached layer over the run's box. A planeswalker's shades, ability lines and
+loyalty symbols only change with its region bounds, vertical shares and symbols, so they are shared by every
+planeswalker laid out the same way, whatever else is in its stack.
+
+Compositing the run's layer gives the same pixels as compositing the frames one by one only where no two of them
+overlap, or when nothing is under them yet, so other runs are drawn frame by frame.
+"""
+def draw_frame_groups(card_img, frames):
+    card_size = card_img.size
+    drawn = 0
+    for group, run in itertools.groupby(frames, key=lambda frame: frame.group):
+        run = tuple(run)
+        boxes = [intersect_boxes((0, 0, *card_size), frame_bounds_box(frame, card_size)) for frame in run]
+        if group is None or len(run) < 2 or any(frame.masks or frame.blend is not None for frame in run) or \
+                (drawn > 0 and not boxes_disjoint(boxes)):
+            draw_frames(card_img, run)
+        else:
+            run_box = None
+            for box in boxes:
+                run_box = union_boxes(run_box, box)
+            if run_box is not None:
+                card_img.alpha_composite(load_frame_group(run, card_size, run_box, draw_frames), dest=run_box[:2])
+        drawn += len(run)
+    return card_img
+
+
+def frame_bounds_box(frame, card_size):
+    f_x, f_y, f_w, f_h = scale_bounds(frame.bounds, card_size)
+    return f_x, f_y, f_x + f_w, f_y + f_h
+
+
+def boxes_disjoint(boxes):
+    boxes = [box for box in boxes if box is not None]
+    return all(intersect_boxes(box_a, box_b) is None for i, box_a in enumerate(boxes) for box_b in boxes[i + 1:])
+
+
+"""
+Draws the card's frames as one layer from the template cache. The layer is built by draw_frame_groups on a
+transparent image, so cards sharing a frame stack only composite it once.
+"""
+def draw_frame_layer(card_img, frames):
+    if len(frames) == 0:
+        return card_img
+    card_img.alpha_composite(load_frame_layer(frames, card_img.size, draw_frame_groups))
+    return card_img
+
+
+"""
+A card is rendered in two steps, which the streaming pipeline runs as stages of their own: composite_card draws
+the art and frame layer onto a new card image, draw_card_text draws the text regions, set symbol and bottom info
+over them.
+"""
+def composite_card(card, card_dir):
+    card_img = Image.new("RGBA", (card.width, card.height), (0, 0, 0, 0))
+    instrument.canvas("card", card_img)
+
+    with instrument.stage("draw_art"):
+        card_img = draw_art(card_img, card.art, card_dir)
+    with instrument.stage("draw_frames"):
+        card_img = draw_frame_layer(card_img, card.frames)
+    return card_img
+
+
+def draw_card_text(card_img, card, resource_path):
+    with instrument.stage("draw_text"):
+        card_img = draw_text(card_img, card, resource_path, fit_stats=instrument.fit_stats())
+    with instrument.stage("draw_set_symbol"):
+        card_img = draw_set_symbol(card_img, card, resource_path)
+    with instrument.stage("draw_bottom_region"):
+        card_img = draw_bottom_region(card_img, card, resource_path)
+    return card_img
+
 
-    card_img = draw_art(card_img, card_obj['art'], card_dir)
-    card_img = draw_frames(card_img, card_obj['frames'])
-    card_img = draw_text(card_img, card_obj, resource_path)
-    card_img = draw_set_symbol(card_img, card_obj, resource_path)
-    card_img = draw_bottom_region(card_img, card_obj, resource_path)
+def render_card_image(card, card_dir, resource_path):
+    return draw_card_text(composite_card(card, card_dir), card, resource_path)
 
-    output_path = os.path.join(output_dir, f"{card_obj['textRegions']['display-title']['text']}.png")
-    card_img.save(output_path)
+
+"""
+In-memory rendering. card is a card dict as loaded from a card file, or an already resolved card. card_dir is the
+directory the card's art paths are relative to. Nothing is written to disk.
+"""
+def render_card(card, card_dir, resource_path, scale=1.0):
+    if not isinstance(card, ResolvedCard):
+        card = resolve_card(card, resource_path)
+    return render_card_image(card.scaled(scale), card_dir, resource_path)
+
+
+def render_card_rgba(card, card_dir, resource_path, scale=1.0):
+    # Raw, row major RGBA8 pixels, ready for a texture upload.
+    card_img = render_card(card, card_dir, resource_path, scale)
+    return card_img.width, card_img.height, card_img.tobytes()
+
+
+def render_card_bytes(card, card_dir, resource_path, scale=1.0, output_options=DEFAULT_OUTPUT):
+    return encode_image(render_card(card, card_dir, resource_path, scale), output_options)
+
+
+"""
+Renders a card file into output_dir and returns the output path. A scale below 1 renders a smaller preview of
+the whole card, fonts and symbols included. With a writer (output.ImageWriter) the encode and
+write happen in the background and the path is returned straight away, the file appears once writer finishes it.
+"""
+def render_card_json(card_dir, card_fn, resource_path, output_dir, output_options=DEFAULT_OUTPUT, writer=None,
+                     scale=1.0):
+    card = read_card(os.path.join(card_dir, card_fn), resource_path).scaled(scale)
+    card_img = render_card_image(card, card_dir, resource_path)
+
+    output_path = os.path.join(output_dir, card_output_fn(card, output_options))
+    if writer is not None:
+        writer.write(card_img, output_path, output_options)
+    else:
+        write_image(card_img, output_path, output_options)
+    return output_path
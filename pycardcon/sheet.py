@@ -0,0 +1,388 @@
+import argparse
+import os.path
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+
+from PIL import Image, ImageDraw
+from PIL.TiffImagePlugin import AppendingTiffWriter
+
+from pycardcon import batch, manifest, output, render, util
+
+"""
+Print sheets. Cards are imposed N×M to a page with optional bleed and crop marks, at a fixed DPI, and the pages
+are written to one multi-page PDF or TIFF. Each page is built by a worker process that renders its cards (or loads
+them from an earlier render-all output, when that is still up to date) one at a time straight into the page
+canvas, and finished pages are appended to the file in order as they arrive. Only the pages in flight are ever in
+memory, however many cards go in.
+"""
+
+# Page sizes in inches.
+PAGE_SIZES = {
+    'letter': (8.5, 11.0),
+    'legal': (8.5, 14.0),
+    'tabloid': (11.0, 17.0),
+    'a4': (8.27, 11.69),
+    'a3': (11.69, 16.54)
+}
+
+SHEET_FORMATS = {
+    '.pdf': "pdf",
+    '.tif': "tiff",
+    '.tiff': "tiff"
+}
+
+PAGE_BACKGROUND = (255, 255, 255)
+CROP_MARK_COLOR = (0, 0, 0)
+
+
+@dataclass(frozen=True, slots=True)
+class SheetLayout:
+    page_size: tuple = PAGE_SIZES['letter']  # inches
+    card_size: tuple = (2.5, 3.5)            # trimmed card, inches
+    columns: int = 3
+    rows: int = 3
+    dpi: int = 300
+    bleed: float = 0.0          # inches added around each card, filled by extending its edges
+    gutter: float = 0.0         # inches between neighbouring cards, outside their bleed
+    crop_marks: bool = True
+    mark_length: float = 0.125  # inches
+    mark_offset: float = 0.0625  # gap between the cards and the start of their marks, inches
+
+    def px(self, inches):
+        return round(inches * self.dpi)
+
+    @property
+    def cards_per_page(self):
+        return self.columns * self.rows
+
+    @property
+    def page_px(self):
+        return self.px(self.page_size[0]), self.px(self.page_size[1])
+
+    @property
+    def trim_px(self):
+        return self.px(self.card_size[0]), self.px(self.card_size[1])
+
+    @property
+    def cell_px(self):
+        trim_w, trim_h = self.trim_px
+        bleed = self.px(self.bleed)
+        return trim_w + 2*bleed, trim_h + 2*bleed
+
+    @property
+    def grid_px(self):
+        cell_w, cell_h = self.cell_px
+        gutter = self.px(self.gutter)
+        return self.columns*cell_w + (self.columns-1)*gutter, self.rows*cell_h + (self.rows-1)*gutter
+
+    @property
+    def grid_origin(self):
+        # The grid is centered on the page.
+        (page_w, page_h), (grid_w, grid_h) = self.page_px, self.grid_px
+        return (page_w - grid_w) // 2, (page_h - grid_h) // 2
+
+    def trim_box(self, index):
+        # Box of the trimmed card in cell index, counted row by row from the top left.
+        cell_w, cell_h = self.cell_px
+        gutter, bleed = self.px(self.gutter), self.px(self.bleed)
+        grid_x, grid_y = self.grid_origin
+        x = grid_x + (index % self.columns)*(cell_w + gutter) + bleed
+        y = grid_y + (index // self.columns)*(cell_h + gutter) + bleed
+        trim_w, trim_h = self.trim_px
+        return x, y, x + trim_w, y + trim_h
+
+
+DEFAULT_LAYOUT = SheetLayout()
+
+
+def check_layout(layout):
+    (page_w, page_h), (grid_w, grid_h) = layout.page_px, layout.grid_px
+    if layout.columns < 1 or layout.rows < 1:
+        raise ValueError(f"a sheet needs at least one column and row, got {layout.columns}x{layout.rows}")
+    if grid_w > page_w or grid_h > page_h:
+        raise ValueError(f"{layout.columns}x{layout.rows} cards of {layout.card_size[0]}x{layout.card_size[1]}in "
+                         f"with {layout.bleed}in bleed don't fit a "
+                         f"{layout.page_size[0]}x{layout.page_size[1]}in page")
+
+
+def add_bleed(card_img, bleed):
+    # Extends the outermost row or column of pixels on every side outwards by bleed.
+    if bleed <= 0:
+        return card_img
+    w, h = card_img.size
+    bled = Image.new(card_img.mode, (w + 2*bleed, h + 2*bleed))
+    bled.paste(card_img, (bleed, bleed))
+    bled.paste(card_img.crop((0, 0, w, 1)).resize((w, bleed)), (bleed, 0))
+    bled.paste(card_img.crop((0, h-1, w, h)).resize((w, bleed)), (bleed, h + bleed))
+    # The sides take the columns of the image with the top and bottom already bled, which fills the corners too.
+    bled.paste(bled.crop((bleed, 0, bleed+1, h + 2*bleed)).resize((bleed, h + 2*bleed)), (0, 0))
+    bled.paste(bled.crop((w+bleed-1, 0, w+bleed, h + 2*bleed)).resize((bleed, h + 2*bleed)), (w + bleed, 0))
+    return bled
+
+
+def draw_crop_marks(page, layout):
+    draw = ImageDraw.Draw(page)
+    width = max(1, layout.dpi // 300)
+    length, offset = layout.px(layout.mark_length), layout.px(layout.mark_offset)
+    left, top = layout.grid_origin
+    grid_w, grid_h = layout.grid_px
+    right, bottom = left + grid_w, top + grid_h
+
+    # Marks sit outside the grid, bleed included, lined up with the trim lines of every column and row.
+    trim_xs = set()
+    trim_ys = set()
+    for index in range(layout.cards_per_page):
+        x0, y0, x1, y1 = layout.trim_box(index)
+        trim_xs.update((x0, x1 - 1))
+        trim_ys.update((y0, y1 - 1))
+    for x in sorted(trim_xs):
+        draw.line([(x, top - offset - length), (x, top - offset)], fill=CROP_MARK_COLOR, width=width)
+        draw.line([(x, bottom + offset), (x, bottom + offset + length)], fill=CROP_MARK_COLOR, width=width)
+    for y in sorted(trim_ys):
+        draw.line([(left - offset - length, y), (left - offset, y)], fill=CROP_MARK_COLOR, width=width)
+        draw.line([(right + offset, y), (right + offset + length, y)], fill=CROP_MARK_COLOR, width=width)
+
+
+"""
+Returns the card image at the layout's trim size, and whether it was loaded from an earlier render. cached is the
+(output path, build hash) recorded for the card in a render-all manifest, or None. The cached image is used when the
+card still hashes the same with rendered_options, otherwise the card is rendered in memory, straight at the scale
+that makes it the trim size.
+"""
+def sheet_card_image(card_path, resource_dir, layout, cached=None, rendered_options=output.DEFAULT_OUTPUT):
+    card_dir = os.path.dirname(card_path)
+    card = util.read_card(card_path, resource_dir)
+    trim_w, trim_h = layout.trim_px
+    # Landscape cards are turned to fit the portrait cells, and the other way around.
+    turned = (card.width > card.height) != (trim_w > trim_h)
+
+    card_img = None
+    if cached is not None:
+        output_path, cached_hash = cached
+        deps = render.card_dependencies(card, card_dir, resource_dir)
+        if cached_hash == manifest.card_hash(card_path, card, deps, rendered_options) and os.path.exists(output_path):
+            card_img = Image.open(output_path).convert("RGBA")
+    reused = card_img is not None
+    if card_img is None:
+        card_img = render.render_card(card, card_dir, resource_dir, scale=(trim_h if turned else trim_w) / card.width)
+
+    if turned:
+        card_img = card_img.transpose(Image.Transpose.ROTATE_90)
+    if card_img.size != (trim_w, trim_h):
+        card_img = card_img.resize((trim_w, trim_h), Image.Resampling.LANCZOS)
+    return card_img, reused
+
+
+"""
+Builds one page from the cards in cards, a list of (card path, cached output or None). Cards are drawn into the page
+one at a time and dropped straight after. A card that fails leaves its cell empty and its error in the result.
+"""
+def build_page(page_number, cards, resource_dir, layout=DEFAULT_LAYOUT, rendered_options=output.DEFAULT_OUTPUT):
+    start = time.perf_counter()
+    page = Image.new("RGB", layout.page_px, PAGE_BACKGROUND)
+    bleed = layout.px(layout.bleed)
+    result = {
+        'page': page_number,
+        'image': None,
+        'cards': [card_path for card_path, _ in cards],
+        'reused': 0,
+        'errors': {}
+    }
+
+    for index, (card_path, cached) in enumerate(cards):
+        try:
+            card_img, reused = sheet_card_image(card_path, resource_dir, layout, cached, rendered_options)
+        except Exception as e:
+            result['errors'][card_path] = f"{type(e).__name__}: {e}"
+            continue
+        card_img = add_bleed(card_img, bleed)
+        x0, y0, _, _ = layout.trim_box(index)
+        page.paste(card_img, (x0 - bleed, y0 - bleed), mask=card_img.getchannel("A"))
+        result['reused'] += reused
+
+    if layout.crop_marks:
+        draw_crop_marks(page, layout)
+    result['image'] = page
+    result['seconds'] = time.perf_counter() - start
+    return result
+
+
+class PdfSheetWriter:
+    """ Appends pages to a PDF as they come. Pages are embedded as JPEGs at quality. """
+    def __init__(self, path, dpi, quality=95):
+        self.path = path
+        self.dpi = dpi
+        self.quality = quality
+        self.pages = 0
+        fd, self.tmp_path = output.temp_file_beside(path, suffix=".pdf.tmp")
+        os.close(fd)
+
+    def add_page(self, page):
+        page.save(self.tmp_path, format="PDF", append=self.pages > 0, resolution=self.dpi, quality=self.quality)
+        self.pages += 1
+
+    def close(self):
+        os.replace(self.tmp_path, self.path)
+
+    def abort(self):
+        os.remove(self.tmp_path)
+
+
+class TiffSheetWriter:
+    """ Appends pages to a multi-page, deflate compressed TIFF as they come. """
+    def __init__(self, path, dpi):
+        self.path = path
+        self.dpi = dpi
+        self.pages = 0
+        fd, self.tmp_path = output.temp_file_beside(path, suffix=".tiff.tmp")
+        os.close(fd)
+        self.tiff = AppendingTiffWriter(self.tmp_path, new=True)
+
+    def add_page(self, page):
+        page.save(self.tiff, format="TIFF", compression="tiff_deflate", dpi=(self.dpi, self.dpi))
+        self.tiff.newFrame()
+        self.pages += 1
+
+    def close(self):
+        self.tiff.close()
+        os.replace(self.tmp_path, self.path)
+
+    def abort(self):
+        self.tiff.close()
+        os.remove(self.tmp_path)
+
+
+def sheet_writer(path, layout, quality=95):
+    sheet_format = SHEET_FORMATS.get(os.path.splitext(path)[1].lower())
+    if sheet_format == "pdf":
+        return PdfSheetWriter(path, layout.dpi, quality)
+    if sheet_format == "tiff":
+        return TiffSheetWriter(path, layout.dpi)
+    raise ValueError(f"unknown sheet format for '{path}', expected one of {', '.join(SHEET_FORMATS)}")
+
+
+def build_pages(page_args, jobs, init_args, layout, rendered_options):
+    # Yields built pages in page order. At most two pages per worker are submitted ahead of the one being written.
+    if jobs == 1:
+        batch.init_worker(*init_args)
+        for page_number, cards, resource_dir in page_args:
+            yield build_page(page_number, cards, resource_dir, layout, rendered_options)
+        return
+
+    with ProcessPoolExecutor(max_workers=jobs, initializer=batch.init_worker, initargs=init_args) as pool:
+        in_flight = deque()
+        for page_number, cards, resource_dir in page_args:
+            in_flight.append(pool.submit(build_page, page_number, cards, resource_dir, layout, rendered_options))
+            if len(in_flight) >= 2*(jobs or os.cpu_count()):
+                yield in_flight.popleft().result()
+        while len(in_flight) > 0:
+            yield in_flight.popleft().result()
+
+
+"""
+Imposes the cards at card_paths, in order, onto pages written to sheet_path (.pdf, .tif or .tiff) and returns a
+result per page. With a rendered_dir holding the output of an earlier render-all (run with rendered_options), up to
+date card images are taken from there instead of being rendered again.
+"""
+def build_sheets(card_paths, resource_dir, sheet_path, layout=DEFAULT_LAYOUT, jobs=None, rendered_dir=None,
+                 rendered_options=output.DEFAULT_OUTPUT, svg_cache_dir=None, template_cache_dir=None, quality=95,
+                 on_page=None):
+    check_layout(layout)
+
+    cached_outputs = {}
+    if rendered_dir is not None:
+        build_manifest = manifest.BuildManifest.for_output_dir(rendered_dir)
+        cached_outputs = {entry['card']: (output_path, entry['hash'])
+                          for output_path, entry in build_manifest.outputs.items()}
+
+    fp_meta = util.preload_fp_meta(resource_dir)
+    init_args = (resource_dir, svg_cache_dir, fp_meta, dict(manifest.file_digests), template_cache_dir)
+    per_page = layout.cards_per_page
+    page_args = ((page_start // per_page + 1,
+                  [(card_path, cached_outputs.get(os.path.abspath(card_path)))
+                   for card_path in card_paths[page_start:page_start + per_page]],
+                  resource_dir)
+                 for page_start in range(0, len(card_paths), per_page))
+
+    writer = sheet_writer(sheet_path, layout, quality)
+    results = []
+    try:
+        for result in build_pages(page_args, jobs, init_args, layout, rendered_options):
+            writer.add_page(result.pop('image'))
+            results.append(result)
+            if on_page is not None:
+                on_page(result)
+    except BaseException:
+        writer.abort()
+        raise
+    if writer.pages == 0:
+        writer.abort()
+    else:
+        writer.close()
+    return results
+
+
+def parse_inches(size_str):
+    size = PAGE_SIZES.get(size_str.lower())
+    if size is not None:
+        return size
+    try:
+        w, h = (float(part) for part in size_str.lower().split("x"))
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"expected WxH in inches or one of {', '.join(PAGE_SIZES)}, got '{size_str}'")
+    return w, h
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(prog="python -m pycardcon sheets",
+                                 description="impose every card json under root_dir onto print sheets")
+    ap.add_argument('root_dir', type=str)
+    ap.add_argument('resource_dir', type=str)
+    ap.add_argument('sheet_path', type=str, help="output file, .pdf or .tif/.tiff")
+    ap.add_argument('--page', type=parse_inches, default=DEFAULT_LAYOUT.page_size,
+                    help=f"page size, WxH in inches or one of {', '.join(PAGE_SIZES)}")
+    ap.add_argument('--card-size', type=parse_inches, default=DEFAULT_LAYOUT.card_size,
+                    help="trimmed card size, WxH in inches")
+    ap.add_argument('--columns', type=int, default=DEFAULT_LAYOUT.columns)
+    ap.add_argument('--rows', type=int, default=DEFAULT_LAYOUT.rows)
+    ap.add_argument('--dpi', type=int, default=DEFAULT_LAYOUT.dpi)
+    ap.add_argument('--bleed', type=float, default=DEFAULT_LAYOUT.bleed, help="bleed around each card, inches")
+    ap.add_argument('--gutter', type=float, default=DEFAULT_LAYOUT.gutter, help="space between cards, inches")
+    ap.add_argument('--no-crop-marks', action='store_true')
+    ap.add_argument('--quality', type=int, default=95, help="jpeg quality of the pages in a pdf")
+    ap.add_argument('--jobs', '-j', type=int, default=os.cpu_count(), help="number of worker processes")
+    ap.add_argument('--rendered', type=str, default=None, metavar="OUTPUT_DIR",
+                    help="render-all output to take up to date card images from")
+    ap.add_argument('--rendered-preset', choices=sorted(output.PRESETS), default='default',
+                    help="the --preset render-all wrote OUTPUT_DIR with")
+    ap.add_argument('--svg-cache', type=str, default=None, help="directory to keep rasterized svg symbols in between runs")
+    ap.add_argument('--template-cache', type=str, default=None,
+                    help="directory to keep composited frame stacks in between runs")
+    args = ap.parse_args(argv)
+
+    layout = SheetLayout(page_size=args.page, card_size=args.card_size, columns=args.columns, rows=args.rows,
+                         dpi=args.dpi, bleed=args.bleed, gutter=args.gutter, crop_marks=not args.no_crop_marks)
+    exclude_dirs = [args.resource_dir] + ([args.rendered] if args.rendered is not None else [])
+    card_paths = batch.find_card_files(args.root_dir, exclude_dirs=exclude_dirs)
+
+    def report(result):
+        print(f"page {result['page']}: {len(result['cards'])} cards, {result['reused']} reused "
+              f"({result['seconds']:.2f}s)")
+        for card_path, error in result['errors'].items():
+            print(f"\tfailed: {os.path.relpath(card_path, args.root_dir)}")
+            print(f"\t\t{error}")
+
+    start = time.perf_counter()
+    results = build_sheets(card_paths, args.resource_dir, args.sheet_path, layout, jobs=args.jobs,
+                           rendered_dir=args.rendered, rendered_options=output.PRESETS[args.rendered_preset],
+                           svg_cache_dir=args.svg_cache, template_cache_dir=args.template_cache,
+                           quality=args.quality, on_page=report)
+    failed = sum(len(result['errors']) for result in results)
+    print(f"wrote: {args.sheet_path} ({len(results)} pages, {len(card_paths)} cards) "
+          f"in {time.perf_counter() - start:.2f}s with {args.jobs} jobs")
+    if failed > 0:
+        print(f"{failed} cards failed.")
+        return 1
+    return 0
@@ -0,0 +1,96 @@
+import re
+from io import BytesIO
+from xml.etree import ElementTree
+
+from PIL import Image
+from cairosvg import svg2png
+
+from pycardcon import instrument
+from pycardcon.cache import LRUCache, DiskImageStore, file_key
+
+"""
+Rasterizes svg files (mana symbols, svg masks, the artist brush) straight to the pixel size they are drawn at,
+and keeps the results so the same symbol at the same size only goes through cairo once per process. An optional
+on-disk tier keeps the rasters between runs.
+"""
+
+SVG_CACHE_MAX_BYTES = 64 * 1024 * 1024
+
+SVG_CACHE = LRUCache(SVG_CACHE_MAX_BYTES, name="svg")
+SVG_SIZES = LRUCache(1024, sizeof=lambda size: 1)
+
+# CSS pixels per unit, at the 96 dpi cairosvg renders at.
+SVG_UNITS = {"": 1, "px": 1, "in": 96, "cm": 96/2.54, "mm": 96/25.4, "pt": 96/72, "pc": 96/6}
+svg_disk_store = None
+
+
+def enable_disk_cache(cache_dir):
+    global svg_disk_store
+    svg_disk_store = DiskImageStore(cache_dir)
+
+
+def disable_disk_cache():
+    global svg_disk_store
+    svg_disk_store = None
+
+
+"""
+Returns the svg at path as an RGBA image. With size=None it is rendered at the size given in the svg itself,
+otherwise it is rendered directly at size=(width, height) instead of being resized afterwards.
+"""
+def rasterize_svg(path, size=None):
+    key = (*file_key(path), size)
+
+    def load():
+        disk_store = svg_disk_store
+        if disk_store is not None:
+            img = disk_store.get(key)
+            if img is not None:
+                return img
+
+        with instrument.stage("svg_rasterize"):
+            with open(path, 'rb') as svg_f:
+                svg_bytes = svg_f.read()
+            if size is None:
+                png_bytes = svg2png(bytestring=svg_bytes)
+            else:
+                png_bytes = svg2png(bytestring=svg_bytes, output_width=size[0], output_height=size[1])
+            img = Image.open(BytesIO(png_bytes))
+            img.load()
+
+        if disk_store is not None:
+            disk_store.put(key, img)
+        return img
+
+    return SVG_CACHE.get_or_load(key, load)
+
+
+def svg_length(value):
+    # A width or height attribute in pixels, None when it is missing or relative to something else, like "100%".
+    match = re.fullmatch(r"\s*([-+]?[0-9.]+(?:e[-+]?[0-9]+)?)\s*([a-z]*)\s*", value or "")
+    if match is None or match.group(2) not in SVG_UNITS:
+        return None
+    return float(match.group(1)) * SVG_UNITS[match.group(2)]
+
+
+"""
+Returns the (width, height) rasterize_svg(path) renders the svg at, read from its width, height and viewBox
+attributes, so the svg's own size can be had without rasterizing it.
+"""
+def svg_size(path):
+    def load():
+        root = ElementTree.parse(path).getroot()
+        width, height = svg_length(root.get("width")), svg_length(root.get("height"))
+        if root.get("viewBox") is not None and (width is None or height is None):
+            vb_w, vb_h = [float(v) for v in re.split(r"[\s,]+", root.get("viewBox").strip())][2:4]
+            if width is None and height is None:
+                width, height = vb_w, vb_h
+            elif width is None:
+                width = height * vb_w / vb_h
+            else:
+                height = width * vb_h / vb_w
+        if width is None or height is None:
+            raise ValueError(f"{path} has no width, height or viewBox to size it by")
+        return int(width), int(height)
+
+    return SVG_SIZES.get_or_load(file_key(path), load)
@@ -0,0 +1,84 @@
+from PIL import Image
+
+from pycardcon import instrument
+from pycardcon.cache import LRUCache, DiskImageStore, file_key
+
+"""
+Frame stack templates. Most cards in a set use the same frames, masks and blends and differ only in art and text,
+so the frames of a resolved card are composited once onto a transparent layer and that layer is reused by every
+card with the same stack at the same size. An optional on-disk tier keeps the layers between runs.
+
+Laying the layer over the art is the same 'over' as compositing the frames onto the art one by one, grouped
+differently. Where a stack is only partly opaque, as on split cards, pixels can round one level differently from
+compositing frame by frame.
+"""
+
+TEMPLATE_CACHE_MAX_BYTES = 256 * 1024 * 1024
+
+TEMPLATE_CACHE = LRUCache(TEMPLATE_CACHE_MAX_BYTES, name="templates")
+template_disk_store = None
+
+
+def enable_disk_cache(cache_dir):
+    global template_disk_store
+    template_disk_store = DiskImageStore(cache_dir)
+
+
+def disable_disk_cache():
+    global template_disk_store
+    template_disk_store = None
+
+
+def frame_files(frames):
+    for frame in frames:
+        if frame.fn is not None:
+            yield frame.fn
+        yield from frame.masks
+        if frame.blend is not None:
+            yield frame.blend
+
+
+def template_key(frames, size):
+    # The frames are frozen, so they hash and repr canonically. The file keys make an edited frame, mask or blend
+    # file a different template.
+    return tuple(frames), tuple(size), tuple(file_key(path) for path in frame_files(frames))
+
+
+"""
+Returns the layer of frames composited by composite(layer, frames) onto a transparent image of size. Layers are
+shared between cards, so they must be treated as read-only.
+"""
+def load_frame_layer(frames, size, composite):
+    key = template_key(frames, size)
+
+    def load():
+        disk_store = template_disk_store
+        if disk_store is not None:
+            layer = disk_store.get(key)
+            if layer is not None:
+                return layer
+
+        layer = Image.new("RGBA", tuple(size), (0, 0, 0, 0))
+        instrument.canvas("frame_layer", layer)
+        layer = composite(layer, frames)
+        if disk_store is not None:
+            disk_store.put(key, layer)
+        return layer
+
+    return TEMPLATE_CACHE.get_or_load(key, load)
+
+
+"""
+Returns the layer of a group of frames, like the shades and ability lines of a planeswalker region, composited by
+composite(layer, frames, size, origin) onto a transparent image covering box of a card of size. Groups are cached
+alongside the templates, so cards whose frame stacks differ elsewhere still share them. Shared, so read-only too.
+"""
+def load_frame_group(frames, size, box, composite):
+    key = ("group",) + template_key(frames, size)
+
+    def load():
+        layer = Image.new("RGBA", (box[2] - box[0], box[3] - box[1]), (0, 0, 0, 0))
+        instrument.canvas("frame_group", layer)
+        return composite(layer, frames, size, (box[0], box[1]))
+
+    return TEMPLATE_CACHE.get_or_load(key, load)
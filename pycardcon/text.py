@@ -1,3 +1,12 @@
+import json
+import os.path
+import re
+import threading
+from functools import lru_cache
+from typing import NamedTuple
+
+from pycardcon.cache import LRUCache
+from pycardcon.errors import UnknownSymbol
 
 """
 Resolves the body of text into an ordered collection of token objects. These will contain either a
@@ -7,179 +16,173 @@ symbols).
 Ideally this collection will be passed to the line-break algorithm, but it could also be used
 in a similar manner to the cardconjurer script.
 
-TODO - Have this handle references to various symbols in a different way. I'd like to isolate the image files more.
+Symbols are looked up in a symbol table built once per resource directory, from DEFAULT_SYMBOLS plus an optional
+SYMBOL_MANIFEST_FN next to manaSymbols/. Generic numbers like {10} and hybrids like {W/U} need no entry, they map
+to 10.svg and wu.svg, and so does any other word that has an svg of its name in manaSymbols/.
 """
-def parse(text, resource_root):
-    text_tokens_raw = text.split(" ")
-    token_objects = []
-    for raw_token in text_tokens_raw:
+
+SYMBOL_MANIFEST_FN = "symbols.json"
+
+"""
+Symbols known without a manifest. Each entry is the svg in manaSymbols/, the symbol's sub type and its value
+(the mana color or numeral value).
+
+The manifest uses the same fields, keyed by the word between the braces, plus an optional list of aliases:
+    {"E": {"file": "e.svg", "sub_type": "energy"}, "Q": {"file": "q.svg", "sub_type": "untap", "aliases": ["q"]}}
+"""
+DEFAULT_SYMBOLS = {
+    "W": {"file": "w.svg", "sub_type": "mana", "value": "W"},
+    "B": {"file": "b.svg", "sub_type": "mana", "value": "B"},
+    "U": {"file": "u.svg", "sub_type": "mana", "value": "U"},
+    "R": {"file": "r.svg", "sub_type": "mana", "value": "R"},
+    "G": {"file": "g.svg", "sub_type": "mana", "value": "G"},
+    "C": {"file": "c.svg", "sub_type": "mana", "value": "C"},
+    "T": {"file": "t.svg", "sub_type": "tap", "aliases": ["t"]},
+    "X": {"file": "x.svg", "sub_type": "numeral", "value": 0},
+    "S": {"file": "s.svg", "sub_type": "numeral", "value": 1, "aliases": ["s", "snow"]}
+}
+
+
+class Token(NamedTuple):
+    """
+    One parsed token. content is the text of a str token, the symbol word of a symbol token, the card field of a
+    card_meta token and the style of a font_change token. value is a symbol's value, or 1/0 for a font change
+    starting/ending italics. whitespace is what follows the token on its line.
+    """
+    token_type: str
+    content: str = ""
+    whitespace: str = ""
+    sub_type: str = None
+    value: object = None
+    path_to_img: str = None
+
+
+NEWLINE = Token("newline")
+COMMANDS = {
+    "cardname": Token("card_meta", content="display-title"),
+    "i": Token("font_change", content="italics", value=1),
+    "/i": Token("font_change", content="italics", value=0)
+}
+
+INTERNED_TOKENS_MAX = 65536
+
+# Tokens are interned, so a symbol or word used across a whole set is one object. Entries are counted, and a token
+# evicted from the pool is only interned again the next time it is parsed.
+INTERNED_TOKENS = LRUCache(INTERNED_TOKENS_MAX, sizeof=lambda token: 1)
+
+
+def intern_token(token):
+    return INTERNED_TOKENS.get_or_load(token, lambda: token)
+
+
+class SymbolTable:
+    """ The symbols of one resource directory, by the word used between braces. """
+    def __init__(self, resource_root, entries):
+        self.resource_root = resource_root
+        self.symbol_dir = f"{resource_root}/manaSymbols"
+        self.entries = {}
+        for word, entry in entries.items():
+            self.entries[word] = entry
+            for alias in entry.get('aliases', ()):
+                self.entries[alias] = entry
+
+    def path_for(self, file_name):
+        return f"{self.symbol_dir}/{file_name}"
+
+    def lookup(self, word):
+        entry = self.entries.get(word)
+        if entry is not None:
+            return Token("symbol", content=word, sub_type=entry.get('sub_type', "mana"), value=entry.get('value'),
+                         path_to_img=self.path_for(entry['file']))
+
+        if word.isdigit():
+            return Token("symbol", content=word, sub_type="numeral", value=int(word),
+                         path_to_img=self.path_for(f"{int(word)}.svg"))
+
+        if "/" in word and all(word.split("/")):
+            return Token("symbol", content=word, sub_type="hybrid", value=word.upper(),
+                         path_to_img=self.path_for(f"{word.replace('/', '').lower()}.svg"))
+
+        svg_path = self.path_for(f"{word.lower()}.svg")
+        if word != "" and os.path.exists(svg_path):
+            return Token("symbol", content=word, sub_type="mana", value=word.upper(), path_to_img=svg_path)
+        return None
+
+
+symbol_tables = {}
+symbol_tables_lock = threading.Lock()
+
+
+def load_symbol_table(resource_root):
+    # Rebuilt only when the manifest appears, disappears or changes, so a watcher picks up new symbols.
+    manifest_path = os.path.join(resource_root, SYMBOL_MANIFEST_FN)
+    try:
+        manifest_mtime = os.stat(manifest_path).st_mtime_ns
+    except OSError:
+        manifest_mtime = None
+
+    with symbol_tables_lock:
+        cached = symbol_tables.get(resource_root)
+        if cached is not None and cached[0] == manifest_mtime:
+            return cached[1]
+
+    entries = dict(DEFAULT_SYMBOLS)
+    if manifest_mtime is not None:
+        with open(manifest_path, 'rb') as manifest_f:
+            entries.update(json.load(manifest_f))
+    table = SymbolTable(resource_root, entries)
+
+    with symbol_tables_lock:
+        symbol_tables[resource_root] = (manifest_mtime, table)
+    return table
+
+
+# Splits a space separated word into runs of plain text and the single characters that end them.
+PIECE_RE = re.compile(r"[^\n{}]+|[\n{}]")
+
+
+@lru_cache(maxsize=4096)
+def parse_text(text, table):
+    tokens = []
+    for raw_token in text.split(" "):
         cur_str = ""
-        for c_idx, c in enumerate(raw_token):
-            if c == "\n":
+        pieces = PIECE_RE.findall(raw_token)
+        for p_idx, piece in enumerate(pieces):
+            if piece == "\n":
                 if cur_str != "":
-                    token_objects.append({
-                        "token_type": "str",
-                        "content": cur_str,
-                        "whitespace": ""
-                    })
-                token_objects.append({"token_type": "newline"})
+                    tokens.append(Token("str", content=cur_str))
+                tokens.append(NEWLINE)
                 cur_str = ""
-            elif c == "{":
+            elif piece == "{":
                 if cur_str != "":
-                    token_objects.append({
-                        "token_type": "str",
-                        "content": cur_str,
-                        "whitespace": ""
-                    })
+                    tokens.append(Token("str", content=cur_str))
                     cur_str = ""
-            elif c == "}":
-                cmd_obj = parse_cmd_word(cur_str, resource_root)
-                if c_idx < len(raw_token)-1:
-                    cmd_obj["whitespace"] = ""
-                else:
-                    cmd_obj["whitespace"] = " "
-                token_objects.append(cmd_obj)
+            elif piece == "}":
+                cmd_token = parse_cmd_word(cur_str, table)
+                whitespace = "" if p_idx < len(pieces)-1 else " "
+                tokens.append(cmd_token._replace(whitespace=whitespace))
                 cur_str = ""
             else:
-                cur_str += c
+                cur_str += piece
 
         if cur_str != "":
-            token_objects.append({
-                        "token_type": "str",
-                        "content": cur_str,
-                        "whitespace": " "
-                    })
-    return token_objects
-
-def parse_cmd_word(word, resource_root):
-    match word:
-        case "W":
-            return {
-                "token_type": "symbol",
-                "sub_type": "mana",
-                "color": "W",
-                "path_to_img": f"{resource_root}/manaSymbols/w.svg"
-            }
-        case "B":
-            return {
-                "token_type": "symbol",
-                "sub_type": "mana",
-                "color": "B",
-                "path_to_img": f"{resource_root}/manaSymbols/b.svg"
-             }
-        case "U":
-            return {
-                "token_type": "symbol",
-                "sub_type": "mana",
-                "color": "U",
-                "path_to_img": f"{resource_root}/manaSymbols/u.svg"
-             }
-        case "R":
-            return {
-                "token_type": "symbol",
-                "sub_type": "mana",
-                "color": "R",
-                "path_to_img": f"{resource_root}/manaSymbols/r.svg"
-             }
-        case "G":
-            return {
-                "token_type": "symbol",
-                "sub_type": "mana",
-                "color": "G",
-                "path_to_img": f"{resource_root}/manaSymbols/g.svg"
-             }
-        case "C":
-            return {
-                "token_type": "symbol",
-                "sub_type": "mana",
-                "color": "C",
-                "path_to_img": f"{resource_root}/manaSymbols/c.svg"
-             }
-        case "t" | "T":
-            return {
-                "token_type": "symbol",
-                "sub_type": "tap",
-                "path_to_img": f"{resource_root}/manaSymbols/t.svg"
-            }
-        case "0":
-            return {
-                "token_type": "symbol",
-                "sub_type": "numeral",
-                "value": 0,
-                "path_to_img": f"{resource_root}/manaSymbols/0.svg"
-            }
-        case "1":
-            return {
-                "token_type": "symbol",
-                "sub_type": "numeral",
-                "value": 1,
-                "path_to_img": f"{resource_root}/manaSymbols/1.svg"
-            }
-        case "2":
-            return {
-                "token_type": "symbol",
-                "sub_type": "numeral",
-                "value": 2,
-                "path_to_img": f"{resource_root}/manaSymbols/2.svg"
-            }
-        case "3":
-            return {
-                "token_type": "symbol",
-                "sub_type": "numeral",
-                "value": 3,
-                "path_to_img": f"{resource_root}/manaSymbols/3.svg"
-            }
-        case "4":
-            return {
-                "token_type": "symbol",
-                "sub_type": "numeral",
-                "value": 4,
-                "path_to_img": f"{resource_root}/manaSymbols/4.svg"
-            }
-        case "5":
-            return {
-                "token_type": "symbol",
-                "sub_type": "numeral",
-                "value": 5,
-                "path_to_img": f"{resource_root}/manaSymbols/5.svg"
-            }
-        case "6":
-            return {
-                "token_type": "symbol",
-                "sub_type": "numeral",
-                "value": 6,
-                "path_to_img": f"{resource_root}/manaSymbols/6.svg"
-            }
-        case "X":
-            return {
-                "token_type": "symbol",
-                "sub_type": "numeral",
-                "value": 0,
-                "path_to_img": f"{resource_root}/manaSymbols/x.svg"
-            }
-        case "S" | "s" | "snow":
-            return {
-                "token_type": "symbol",
-                "sub_type": "numeral",
-                "value": 1,
-                "path_to_img": f"{resource_root}/manaSymbols/s.svg"
-            }
-        case "cardname":
-            return {
-                "token_type": "card_meta",
-                "card_field": "display-title"
-            }
-
-        case "i":
-            return {
-                "token_type": "font_change",
-                "type": "italics",
-                "val": 1
-            }
-
-        case "/i":
-            return {
-                "token_type": "font_change",
-                "type": "italics",
-                "val": 0
-            }
+            tokens.append(Token("str", content=cur_str, whitespace=" "))
+    return tuple(intern_token(token) for token in tokens)
+
+
+"""
+Returns the tokens of text as a tuple. Results are memoized per text and symbol table, and shared, so they must not
+be modified.
+"""
+def parse(text, resource_root):
+    return parse_text(text, load_symbol_table(resource_root))
+
+
+def parse_cmd_word(word, table):
+    if word in COMMANDS:
+        return COMMANDS[word]
+
+    token = table.lookup(word)
+    if token is None:
+        raise UnknownSymbol(word, table.symbol_dir)
+    return token
@@ -0,0 +1,171 @@
+import math
+import os.path
+
+from PIL import Image
+
+from pycardcon import instrument
+from pycardcon.cache import load_alpha_bbox, load_image_asset, open_image
+from pycardcon.errors import InvalidTextRegion
+from pycardcon.output import DEFAULT_OUTPUT, PngBandWriter
+from pycardcon.render import (alpha_composite_clipped, box_size, draw_bottom_region, draw_frames, fit_text_region,
+                              intersect_boxes, offset_box, paint_text_lines, scale_art_bounds, text_region_location,
+                              text_region_size)
+from pycardcon.text import parse
+
+"""
+Tiled rendering for print resolution cards. The card is composited one horizontal band at a time, art, frames,
+text regions, set symbol and bottom info all drawn into the band alone, and each finished band goes straight to
+the PNG encoder. Resources are decoded at their own size and only the rows a band needs are resized, so nothing
+card sized is ever allocated and a worker's peak memory depends on the band height, not the card's resolution.
+svg masks are the exception, they are rasterized once at card size, the same as in a full render.
+
+Every drawing step is per pixel, so the bands add up to the same card render_card_image draws. The one difference
+is that resizing part of an image can round a few pixels one level off from resizing all of it.
+"""
+
+DEFAULT_BAND_HEIGHT = 256
+
+
+def scaled_part(img, size, box):
+    # The box of img as if it had been resized to size, resizing only the source rows under the box. Whole rows are
+    # resized so the columns come out exactly as they do from resizing the whole image.
+    if img.size == tuple(size):
+        return img.crop(box)
+    y_ratio = img.size[1] / size[1]
+    rows = img.resize((size[0], box[3] - box[1]), box=(0, box[1]*y_ratio, img.size[0], box[3]*y_ratio))
+    return rows.crop((box[0], 0, box[2], rows.size[1]))
+
+
+def load_scaled_part(path, size, box, mode=None, opener=open_image):
+    if ".svg" in path:
+        # svg masks are rasterized straight at size, as render_card_image does, so there are no source rows to pick.
+        return load_image_asset(path, size=size, mode=mode, opener=opener).crop(box)
+    return scaled_part(load_image_asset(path, mode=mode, opener=opener), size, box)
+
+
+def load_scaled_alpha_bbox(path, size=None, mode=None, opener=open_image):
+    if ".svg" in path:
+        return load_alpha_bbox(path, size=size, mode=mode, opener=opener)
+    # The opaque box at the image's own size, scaled up to size. It is grown by the reach of the resize filter on
+    # both scales, so it never misses a pixel the full resize would make opaque.
+    bbox = load_alpha_bbox(path, mode=mode, opener=opener)
+    if bbox is None or size is None:
+        return bbox
+    img_w, img_h = load_image_asset(path, mode=mode, opener=opener).size
+    x_ratio, y_ratio = size[0] / img_w, size[1] / img_h
+    return (max(0, math.floor((bbox[0] - 2)*x_ratio) - 2), max(0, math.floor((bbox[1] - 2)*y_ratio) - 2),
+            min(size[0], math.ceil((bbox[2] + 2)*x_ratio) + 2), min(size[1], math.ceil((bbox[3] + 2)*y_ratio) + 2))
+
+
+def draw_art_band(band, art_img, art_obj, card_size, band_y):
+    art_x, art_y, art_w, art_h = scale_art_bounds(art_obj, art_img, card_size)
+    # Zoomed art can reach well past the card, only the part over the band is resized.
+    part = intersect_boxes((0, band_y, card_size[0], band_y + band.height),
+                           (art_x, art_y, art_x + art_w, art_y + art_h))
+    if part is None:
+        return band
+    band.paste(scaled_part(art_img, (art_w, art_h), offset_box(part, -art_x, -art_y)), (part[0], part[1] - band_y))
+    return band
+
+
+def draw_text_band(band, card, text_layouts, card_size, band_y):
+    for text_region, fontsize, last_text_y, lines in text_layouts:
+        tr_x, tr_y = text_region_location(text_region, card_size, fontsize, last_text_y)
+        tr_w, tr_h = text_region_size(text_region, card_size)
+        rows = intersect_boxes((0, band_y, tr_w, band_y + band.height), (0, tr_y, tr_w, tr_y + tr_h))
+        if rows is None:
+            continue
+        # The rows of the region inside the band are painted on their own, then composited like a whole region is.
+        t_img = Image.new("RGBA", box_size(rows), (0, 0, 0, 0))
+        paint_text_lines(t_img, lines, fontsize, text_region.align, text_region.color, text_region.drop_shadows,
+                         top=rows[1] - tr_y)
+        alpha_composite_clipped(band, t_img, (tr_x, rows[1] - band_y))
+    return band
+
+
+def draw_set_symbol_band(band, ss_img, set_symbol, card_size, band_y):
+    ss_x, ss_y, ss_w, ss_h = scale_art_bounds(set_symbol, ss_img, card_size)
+    rows = intersect_boxes((0, band_y, ss_w, band_y + band.height), (0, ss_y, ss_w, ss_y + ss_h))
+    if rows is None:
+        return band
+    ss_part = scaled_part(ss_img, (ss_w, ss_h), (0, rows[1] - ss_y, ss_w, rows[3] - ss_y))
+    alpha_composite_clipped(band, ss_part, (ss_x, rows[1] - band_y))
+    return band
+
+
+"""
+Fits every text region of the card once, up front, so each band only paints the lines that cross it. Returns
+(text region, font size, y of the last line, lines) per region.
+"""
+def layout_text_regions(card, card_size, resource_path):
+    text_layouts = []
+    fit_stats = instrument.fit_stats()
+    for text_region in card.text_regions:
+        missing_field = text_region.missing_field()
+        if missing_field is not None:
+            raise InvalidTextRegion(text_region.name, missing_field)
+        tokens = parse(text_region.text, resource_path)
+        fontsize, last_text_y, lines, attempts = fit_text_region(card, text_region, card_size, resource_path, tokens)
+        if fit_stats is not None:
+            fit_stats[text_region.name] = {'size': fontsize, 'attempts': attempts, 'cached': False}
+        text_layouts.append((text_region, fontsize, last_text_y, lines))
+    return text_layouts
+
+
+def render_band(card, resource_path, band_y, band_h, art_img, text_layouts, ss_img):
+    card_size = (card.width, card.height)
+    band = Image.new("RGBA", (card.width, band_h), (0, 0, 0, 0))
+    instrument.canvas("band", band)
+
+    with instrument.stage("draw_art"):
+        if art_img is not None:
+            draw_art_band(band, art_img, card.art, card_size, band_y)
+    with instrument.stage("draw_frames"):
+        if len(card.frames) > 0:
+            # Frames go onto their own layer first, as they do through the template cache in a full render.
+            layer = Image.new("RGBA", band.size, (0, 0, 0, 0))
+            draw_frames(layer, card.frames, card_size, (0, band_y), load_scaled_part, load_scaled_alpha_bbox)
+            band.alpha_composite(layer)
+    with instrument.stage("draw_text"):
+        draw_text_band(band, card, text_layouts, card_size, band_y)
+    with instrument.stage("draw_set_symbol"):
+        if ss_img is not None:
+            draw_set_symbol_band(band, ss_img, card.set_symbol, card_size, band_y)
+    with instrument.stage("draw_bottom_region"):
+        draw_bottom_region(band, card, resource_path, card_size, (0, band_y))
+    return band
+
+
+"""
+Renders a resolved card to a PNG at output_path band_height rows at a time. Only PNG output can be written a band
+at a time, other formats raise a ValueError.
+"""
+def render_card_tiled(card, card_dir, resource_path, output_path, output_options=DEFAULT_OUTPUT,
+                      band_height=DEFAULT_BAND_HEIGHT):
+    if output_options.format != "png":
+        raise ValueError(f"tiled rendering writes png only, not '{output_options.format}'")
+
+    art_img = None
+    if card.art.src != '':
+        art_img = Image.open(os.path.join(card_dir, card.art.src))
+        art_img.load()
+    ss_img = None
+    if card.set_symbol is not None:
+        symbol_fn = f"{card.info_set}_{card.info_rarity}.png"
+        ss_img = Image.open(os.path.join(resource_path, "setSymbols", card.info_set, symbol_fn))
+        ss_img.load()
+    with instrument.stage("draw_text"):
+        text_layouts = layout_text_regions(card, (card.width, card.height), resource_path)
+
+    writer = PngBandWriter(output_path, (card.width, card.height), output_options.compress_level)
+    try:
+        for band_y in range(0, card.height, band_height):
+            band = render_band(card, resource_path, band_y, min(band_height, card.height - band_y),
+                               art_img, text_layouts, ss_img)
+            with instrument.stage("encode"):
+                writer.write_band(band)
+    except BaseException:
+        writer.abort()
+        raise
+    with instrument.stage("write"):
+        return writer.close()
@@ -1,25 +1,44 @@
+import copy
 import json
 import os.path
 
-"""
-Reads a cards json from the fn, and searches for the necessary frame packs to build up the full set of
-meta-data needed to render a frame. This means finding the right default group for a frame and copying
-over the defaults for the bounds, zooms, alignment, text fields, etc...
+from pycardcon.model import ResolvedCard
 
-TODO - Make Planeswalker text regions read defaults and overwrites correctly
-TODO - Make saga text regions read defaults and overwrites correctly 
+"""
+Reads a cards json from the fn, and resolves it into an immutable model.ResolvedCard with resolve_card.
 """
 def read_card(card_fn, resources_root):
     with open(card_fn, 'rb') as card_f:
         card = json.load(card_f)
+    return resolve_card(card, resources_root)
+
+
+"""
+Searches for the necessary frame packs to build up the full set of meta-data needed to render a card's frames.
+This means finding the right default group for a frame and copying over the defaults for the bounds, zooms,
+alignment, text fields, etc... The card object passed in is left untouched, the expansion happens on a copy
+which is then frozen into a ResolvedCard.
+
+TODO - Make Planeswalker text regions read defaults and overwrites correctly
+TODO - Make saga text regions read defaults and overwrites correctly 
+"""
+def resolve_card(card, resources_root):
+    card = copy.deepcopy(card)
+
+    # Every meta file the card is resolved from, so callers can tell which cards a pack edit affects.
+    meta_sources = []
+
+    def load_meta(frame_pack_path):
+        meta_sources.append(fp_meta_path_for(frame_pack_path, resources_root))
+        return load_fp_meta_file(frame_pack_path, resources_root)
 
     processed_frames = []  # Collecting frames as they are expanded or created
     loyalty_frames   = []  # These are the 'foreground' frames added by things like loyalty or chapter icons.
     for frame in card['data']['frames']:
-        frame_meta = load_fp_meta_file(frame['framePack'], resources_root)
+        frame_meta = load_meta(frame['framePack'])
         frame_dg = frame_meta["frames"][frame['frame']]["defaultGroup"]
         frame_defaults = frame_meta["defaultGroups"][frame_dg]
-        frame['bounds'] = frame_defaults['defaultBounds']
+        frame['bounds'] = dict(frame_defaults['defaultBounds'])
 
         # Resolve full path to the frame image file.
         frame['fn'] = f"{resources_root}/{frame['framePack']}/{frame_meta['frames'][frame['frame']]['path']}"
@@ -58,6 +77,10 @@ def read_card(card_fn, resources_root):
             pw_region_w = card['data']['pwRegion']['bounds']['width']
             pw_region_h = card['data']['pwRegion']['bounds']['height']
 
+            # TODO - Handle arbitary planeswalker packs/boundry packs
+            boundary_pack = "planeswalker"
+            bp_meta = load_meta(f"frames/{boundary_pack}")
+
             cur_region_y = pw_region_y
             for pw_region_name in frame['usingPWTexts']:
                 card['data']['textRegions'][pw_region_name]['pwRegion'] = True
@@ -67,12 +90,6 @@ def read_card(card_fn, resources_root):
 
                 pw_region_vshare = card['data']['textRegions'][pw_region_name]['verticalShare']
 
-                # TODO - Handle arbitary planeswalker packs/boundry packs
-                boundary_pack = "planeswalker"
-                bp_meta_fn = f"{resources_root}/frames/{boundary_pack}/frame_pack_meta.json"
-                with open(bp_meta_fn, 'rb') as meta_f:
-                    bp_meta = json.load(meta_f)
-
                 # TODO - Make these be read from a defaults file for a planeswalker pack.
                 if region_n % 2 == 0:
                     # Darker
@@ -96,7 +113,8 @@ def read_card(card_fn, resources_root):
                         "width": pw_region_w,
                         "height": pw_region_h * pw_region_vshare - 0.5*bf_height+one_px,
                     },
-                    "value": shade_rgba
+                    "value": shade_rgba,
+                    "group": "pwRegion"
                 }
                 processed_frames.insert(0, alpha_shade_frame)
 
@@ -133,7 +151,8 @@ def read_card(card_fn, resources_root):
                             'y': ls_y+0.025*LS_HEIGHT,
                             'width': LS_WIDTH,
                             'height': LS_HEIGHT
-                        }
+                        },
+                        'group': "pwLoyalty"
                     })
 
                     # Add text region for ability change text_region
@@ -162,7 +181,8 @@ def read_card(card_fn, resources_root):
                 # Ability Line
                 cur_region_y += pw_region_h * pw_region_vshare - 0.5*bf_height
                 if region_n < num_regions:
-                    b_frame = bp_meta['frames'][boundary_frame_name]
+                    # Copied, the pack meta is cached and shared with every other card.
+                    b_frame = dict(bp_meta['frames'][boundary_frame_name])
                     b_frame['bounds'] = {
                         'x': pw_region_x,
                         'y': cur_region_y,
@@ -170,6 +190,7 @@ def read_card(card_fn, resources_root):
                         'height': bf_height
                     }
                     b_frame['selfMask'] = True
+                    b_frame['group'] = "pwRegion"
                     b_frame['fn'] = f"{resources_root}/frames/{boundary_pack}/{b_frame['path']}"
                     processed_frames.append(b_frame)
                     cur_region_y += bf_height
@@ -182,6 +203,7 @@ def read_card(card_fn, resources_root):
             num_chapters = len(frame['saga']['chapters'])
             chapter_vertical_frac = 1.0/num_chapters
             cur_chapter_y = chapter_region['y']
+            chap_sym_meta = load_meta("frames/saga")
             for chapter_tr_name in frame['saga']['chapters']:
                 # Need to add the defaults for a text region to the text region,
                 # and calculate and place its x, y, width, etc..
@@ -195,8 +217,6 @@ def read_card(card_fn, resources_root):
                 chapter_tr['font'] = chapter_region['font']
                 chapter_tr['verticalAlign'] = chapter_region['verticalAlign']
 
-                chap_sym_meta = load_fp_meta_file("frames/saga", resources_root)
-
                 chap_bar_fn = f"{resources_root}/frames/saga/sagaDivider.png"
                 chap_bar_defaults = chap_sym_meta['defaultGroups']['sagaBar']
 
@@ -217,10 +237,9 @@ def read_card(card_fn, resources_root):
                     ]
 
                 }
-                mask_fp_meta = load_fp_meta_file("frames/saga", resources_root)
-                mask_meta_info = mask_fp_meta['masks']["saga Text Area Full"]
+                mask_meta_info = chap_sym_meta['masks']["saga Text Area Full"]
                 chapter_bar_frame['masks'][0]['fn'] = f"{resources_root}/frames/saga/{mask_meta_info['path']}"
-                mask_dg = mask_fp_meta['defaultGroups'][mask_meta_info['defaultGroup']]
+                mask_dg = chap_sym_meta['defaultGroups'][mask_meta_info['defaultGroup']]
                 copy_or_overwrite_defaults(chapter_bar_frame['masks'][0], mask_dg)
                 loyalty_frames.append(chapter_bar_frame)
 
@@ -271,15 +290,16 @@ def read_card(card_fn, resources_root):
         if 'masks' in frame:
             for mask in frame['masks']:
                 # Open mask meta file, read its default group, and copy/overwrite to the user mask obj
-                mask_fp_meta = load_fp_meta_file(mask['framePack'], resources_root)
+                mask_fp_meta = load_meta(mask['framePack'])
                 mask_meta_info = mask_fp_meta['masks'][mask['mask']]
                 mask['fn'] = f"{resources_root}/{mask['framePack']}/{mask_meta_info['path']}"
                 mask_dg = mask_fp_meta['defaultGroups'][mask_meta_info['defaultGroup']]
                 copy_or_overwrite_defaults(mask, mask_dg)
 
         if "defaultComplementary" in frame_defaults:
-            for comp_frame in frame_defaults['defaultComplementary']:
-                comp_frame_meta = load_fp_meta_file(f"frames/{comp_frame['framePack']}", resources_root)
+            for comp_frame_defaults in frame_defaults['defaultComplementary']:
+                comp_frame = dict(comp_frame_defaults)
+                comp_frame_meta = load_meta(f"frames/{comp_frame['framePack']}")
                 comp_frame_fn = comp_frame_meta['frames'][comp_frame['frame']]['path']
                 comp_frame['fn'] = f"{resources_root}/frames/{comp_frame['framePack']}/{comp_frame_fn}"
 
@@ -287,7 +307,7 @@ def read_card(card_fn, resources_root):
                 # Might require copy/overwriting defaults from files to fix.
                 comp_frame_dg = comp_frame_meta['defaultGroups'][comp_frame_meta['frames'][comp_frame['frame']]['defaultGroup']]
                 comp_frame_bounds = comp_frame_dg['defaultBounds']
-                comp_frame['bounds'] = comp_frame_bounds
+                comp_frame['bounds'] = dict(comp_frame_bounds)
 
                 processed_frames.append(comp_frame)
 
@@ -313,19 +333,111 @@ def read_card(card_fn, resources_root):
 
     # TODO - Add in set data, resolve fn from the set information here so we don't do it at render time.
 
-    return card
+    return ResolvedCard.from_dict(card['data'], sources=tuple(dict.fromkeys(meta_sources)))
 
 
 def copy_or_overwrite_defaults(user_obj, defaults_obj):
     for key in defaults_obj:
         val = defaults_obj[key]
         if key not in user_obj:
-            user_obj[key] = val
+            # Copied so the card never holds references into the cached frame pack meta.
+            user_obj[key] = copy.deepcopy(val)
+
+
+FP_META_FN = "frame_pack_meta.json"
+FP_INDEX_FN = "frame_pack_index.json"
+
+# Parsed frame pack meta files, keyed by absolute path to (mtime_ns, meta). The meta objects are shared by
+# every card that uses the pack, so nothing may write into them.
+fp_meta_cache = {}
+fp_index_loaded = set()
+
+
+def fp_meta_path_for(frame_pack_path, resource_dir):
+    return os.path.abspath(os.path.join(resource_dir, frame_pack_path, FP_META_FN))
 
 
 def load_fp_meta_file(frame_pack_path, resource_dir):
-    fp_meta_path = os.path.join(resource_dir, frame_pack_path, "frame_pack_meta.json")
-    # fp_meta_fn = f"{resource_dir}/{frame_pack_path}/frame_pack_meta.json"
+    fp_meta_path = fp_meta_path_for(frame_pack_path, resource_dir)
+    load_fp_meta_index(resource_dir)
+
+    mtime_ns = os.stat(fp_meta_path).st_mtime_ns
+    cached = fp_meta_cache.get(fp_meta_path)
+    if cached is not None and cached[0] == mtime_ns:
+        return cached[1]
+
     with open(fp_meta_path, 'rb') as meta_f:
         meta_obj = json.load(meta_f)
+    fp_meta_cache[fp_meta_path] = (mtime_ns, meta_obj)
     return meta_obj
+
+
+def find_fp_meta_files(resource_dir):
+    fp_meta_paths = []
+    for dir_path, dir_names, file_names in os.walk(resource_dir):
+        dir_names.sort()
+        if FP_META_FN in file_names:
+            fp_meta_paths.append(os.path.join(dir_path, FP_META_FN))
+    return fp_meta_paths
+
+
+"""
+Compiles every frame pack meta file under resource_dir into a single index file, so that a process can load all
+pack meta data with one read. Entries remember the mtime of the meta file they came from, and load_fp_meta_file
+re-reads any pack whose meta file has changed since the index was built.
+"""
+def build_fp_meta_index(resource_dir, index_path=None):
+    if index_path is None:
+        index_path = os.path.join(resource_dir, FP_INDEX_FN)
+
+    index = {}
+    for fp_meta_path in find_fp_meta_files(resource_dir):
+        with open(fp_meta_path, 'rb') as meta_f:
+            meta_obj = json.load(meta_f)
+        index[os.path.relpath(fp_meta_path, resource_dir)] = {
+            'mtime_ns': os.stat(fp_meta_path).st_mtime_ns,
+            'meta': meta_obj
+        }
+
+    tmp_path = f"{index_path}.tmp"
+    with open(tmp_path, 'w') as index_f:
+        json.dump(index, index_f)
+    os.replace(tmp_path, index_path)
+    return index_path
+
+
+def load_fp_meta_index(resource_dir, index_path=None):
+    resource_key = os.path.abspath(resource_dir)
+    if resource_key in fp_index_loaded:
+        return
+    fp_index_loaded.add(resource_key)
+
+    if index_path is None:
+        index_path = os.path.join(resource_dir, FP_INDEX_FN)
+    if not os.path.exists(index_path):
+        return
+
+    with open(index_path, 'rb') as index_f:
+        index = json.load(index_f)
+    for rel_path, entry in index.items():
+        fp_meta_path = os.path.abspath(os.path.join(resource_dir, rel_path))
+        if fp_meta_path not in fp_meta_cache:
+            fp_meta_cache[fp_meta_path] = (entry['mtime_ns'], entry['meta'])
+
+
+"""
+Loads the meta of every frame pack under resource_dir, from the index file when there is one, and returns the
+cache entries so they can be handed to worker processes with seed_fp_meta.
+"""
+def preload_fp_meta(resource_dir):
+    load_fp_meta_index(resource_dir)
+    for fp_meta_path in find_fp_meta_files(resource_dir):
+        load_fp_meta_file(os.path.relpath(os.path.dirname(fp_meta_path), resource_dir), resource_dir)
+    resource_key = os.path.abspath(resource_dir)
+    return {path: entry for path, entry in fp_meta_cache.items() if path.startswith(resource_key)}
+
+
+def seed_fp_meta(entries):
+    for fp_meta_path, entry in entries.items():
+        if fp_meta_path not in fp_meta_cache:
+            fp_meta_cache[fp_meta_path] = entry
@@ -0,0 +1,289 @@
+import argparse
+import json
+import os.path
+import threading
+import time
+from collections import deque
+
+from watchdog.observers import Observer
+from watchdog.events import FileSystemEventHandler
+
+from pycardcon import batch, output, render, svg, template, util
+from pycardcon.errors import InvalidTextRegion, UnknownLineBreak, UnknownSymbol
+
+"""
+Watches a workspace and re-renders cards as they are saved. Besides the card files themselves, the resource
+directory and the workspace's img directory are watched too, and a change to any file a card was rendered from
+(a frame, mask, pack meta file, font, symbol or art image) re-renders just the cards that use it.
+"""
+
+
+class DependencyIndex:
+    """ Maps each card to the files its last resolve read, and each of those files back to the cards using it. """
+    def __init__(self):
+        self.deps_by_card = {}
+        self.cards_by_dep = {}
+        self.lock = threading.Lock()
+
+    def update(self, card_path, deps):
+        with self.lock:
+            for dep in self.deps_by_card.get(card_path, ()):
+                self.cards_by_dep[dep].discard(card_path)
+            self.deps_by_card[card_path] = set(deps)
+            for dep in deps:
+                self.cards_by_dep.setdefault(dep, set()).add(card_path)
+
+    def cards_for(self, path):
+        with self.lock:
+            return sorted(self.cards_by_dep.get(path, ()))
+
+
+class RenderScheduler:
+    """
+    Debounces render requests per card and runs them on a fixed number of worker threads, off the observer thread.
+    A card is rendered once its requests have been quiet for debounce seconds (trailing edge). A request for a card
+    that is still waiting replaces it, and a request for a card that is being rendered queues exactly one more
+    render after it, so a burst of saves always ends with one render of the final content.
+    """
+    def __init__(self, render_fn, workers=2, debounce=0.3, on_rendered=None):
+        self.render_fn = render_fn
+        self.debounce = debounce
+        self.on_rendered = on_rendered
+        self.cond = threading.Condition()
+        self.deadlines = {}     # card -> time it becomes ready to render
+        self.requested = {}     # card -> time of the first request since its last render
+        self.running = set()
+        self.stopped = False
+
+        self.completed = 0
+        self.superseded = 0
+        self.latencies = deque(maxlen=100)
+        self.render_times = deque(maxlen=100)
+
+        self.workers = [threading.Thread(target=self.work, daemon=True) for _ in range(workers)]
+        for worker in self.workers:
+            worker.start()
+
+    def request(self, card):
+        with self.cond:
+            now = time.monotonic()
+            if card in self.deadlines:
+                self.superseded += 1
+            self.deadlines[card] = now + self.debounce
+            self.requested.setdefault(card, now)
+            self.cond.notify()
+
+    def next_card(self):
+        # Called holding the condition, blocks until some card is past its deadline and not already rendering.
+        while not self.stopped:
+            now = time.monotonic()
+            waiting = [(deadline, card) for card, deadline in self.deadlines.items() if card not in self.running]
+            if len(waiting) == 0:
+                self.cond.wait()
+                continue
+
+            deadline, card = min(waiting)
+            if deadline > now:
+                self.cond.wait(deadline - now)
+                continue
+
+            del self.deadlines[card]
+            self.running.add(card)
+            return card, self.requested.pop(card)
+        return None, None
+
+    def work(self):
+        while True:
+            with self.cond:
+                card, requested_at = self.next_card()
+            if card is None:
+                return
+
+            start = time.monotonic()
+            result = None
+            try:
+                result = self.render_fn(card)
+            except Exception as e:
+                # One bad card mustn't take a worker, and every card queued behind it, down with it.
+                print(f"render failed: {card} ({type(e).__name__}: {e})")
+            finally:
+                end = time.monotonic()
+                with self.cond:
+                    self.running.discard(card)
+                    self.completed += 1
+                    self.latencies.append(end - requested_at)
+                    self.render_times.append(end - start)
+                    self.cond.notify_all()
+            if self.on_rendered is not None:
+                self.on_rendered(card, result, end - start, end - requested_at)
+
+    def queue_depth(self):
+        with self.cond:
+            return len(self.deadlines)
+
+    def stats(self):
+        with self.cond:
+            return {
+                'queued': len(self.deadlines),
+                'running': len(self.running),
+                'completed': self.completed,
+                'superseded': self.superseded,
+                'mean_latency': sum(self.latencies) / len(self.latencies) if self.latencies else 0.0,
+                'mean_render_seconds': sum(self.render_times) / len(self.render_times) if self.render_times else 0.0
+            }
+
+    def shutdown(self):
+        with self.cond:
+            self.stopped = True
+            self.cond.notify_all()
+        for worker in self.workers:
+            worker.join()
+
+
+class CardRenderHandler(FileSystemEventHandler):
+
+    def __init__(self, dir_to_watch, dir_of_resources, dir_to_output_to, jobs=2, debounce=0.3,
+                 output_options=output.DEFAULT_OUTPUT, scale=1.0):
+        super().__init__()
+        self.dir = dir_to_watch
+        self.dir_resources = dir_of_resources
+        self.dir_output = dir_to_output_to
+        self.output_options = output_options
+        self.scale = scale
+
+        # One writer thread, so two saves of the same card are written in order.
+        self.writer = output.ImageWriter(workers=1, options=output_options)
+        self.index = DependencyIndex()
+        self.scheduler = RenderScheduler(self.render_card, workers=jobs, debounce=debounce,
+                                         on_rendered=self.report_render)
+
+    def build_index(self):
+        for card_path in batch.find_card_files(self.dir, exclude_dirs=[self.dir_resources, self.dir_output]):
+            if os.path.dirname(os.path.abspath(card_path)) != os.path.abspath(self.dir):
+                continue
+            try:
+                card = util.read_card(card_path, self.dir_resources)
+            except Exception as e:
+                print(f"not indexed: {os.path.basename(card_path)} ({type(e).__name__}: {e})")
+                continue
+            self.index.update(os.path.abspath(card_path), render.card_dependencies(card, self.dir, self.dir_resources))
+
+    def is_card_path(self, path):
+        return path.endswith(".json") and os.path.dirname(path) == os.path.abspath(self.dir)
+
+    def on_any_event(self, event):
+        if event.is_directory or event.event_type not in ('modified', 'created', 'moved'):
+            return
+
+        path = event.dest_path if event.event_type == 'moved' else event.src_path
+        path = os.path.abspath(path)
+        if '~' in path:
+            return
+
+        if self.is_card_path(path):
+            self.scheduler.request(path)
+        else:
+            affected = self.index.cards_for(path)
+            if len(affected) > 0:
+                print(f"changed:   {os.path.relpath(path)} ({len(affected)} cards)")
+            for card_path in affected:
+                self.scheduler.request(card_path)
+
+    def report_render(self, card_path, rendered, render_seconds, latency):
+        if rendered:
+            print(f"rendered:  {os.path.basename(card_path)} ({render_seconds:.2f}s render, {latency:.2f}s since change, "
+                  f"{self.scheduler.queue_depth()} queued)")
+
+    def report_write(self, card_fn, write):
+        if write.exception() is not None:
+            print(f"error writing {card_fn}.")
+            print(write.exception())
+
+    def render_card(self, card_path):
+        card_fn = os.path.basename(card_path)
+        print(f"rendering: {card_fn}")
+        try:
+            card = util.read_card(card_path, self.dir_resources)
+            self.index.update(card_path, render.card_dependencies(card, self.dir, self.dir_resources))
+            card = card.scaled(self.scale)
+            card_img = render.render_card_image(card, self.dir, self.dir_resources)
+            output_path = os.path.join(self.dir_output, render.card_output_fn(card, self.output_options))
+            write = self.writer.write(card_img, output_path, self.output_options)
+            write.add_done_callback(lambda future: self.report_write(card_fn, future))
+            return True
+        except json.decoder.JSONDecodeError as e_json:
+            print(f"error reading {card_fn}:")
+            print(e_json)
+        except InvalidTextRegion as e_invalidtr:
+            print(f"malformed text region in {card_fn}.")
+            print(e_invalidtr)
+        except UnknownSymbol as e_symbol:
+            print(f"unknown symbol in {card_fn}.")
+            print(e_symbol)
+        except UnknownLineBreak as e_linebreak:
+            print(f"unknown line break in {card_fn}.")
+            print(e_linebreak)
+        except FileNotFoundError as e_fnf:
+            # TODO - Custom error that includes what part of the pipeline had the error.
+            # TODO - Suggested fixes like the other custom exception
+            print(f"error loading resource while rendering {card_fn}.")
+            print(e_fnf)
+        except KeyError as e_ke:
+            # TODO - Custom error that include what part of the pipeline/json file had the error.
+            # TODO - Suggested fixes...
+            print(f"missing json key while rendering {card_fn}.")
+            print(e_ke)
+        return False
+
+    def shutdown(self):
+        self.scheduler.shutdown()
+        # Renders still being written are finished, failures were reported as they happened.
+        self.writer.close(raise_errors=False)
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser()
+    ap.add_argument('root_dir', type=str)
+    ap.add_argument('resource_dir', type=str)
+    ap.add_argument('output_dir', type=str)
+    ap.add_argument('--svg-cache', type=str, default=None, help="directory to keep rasterized svg symbols in between runs")
+    ap.add_argument('--template-cache', type=str, default=None,
+                    help="directory to keep composited frame stacks in between runs")
+    ap.add_argument('--jobs', '-j', type=int, default=2, help="number of cards rendered at the same time")
+    output.add_output_arguments(ap)
+    ap.add_argument('--scale', type=float, default=1.0,
+                    help="render at this fraction of the card size, e.g. 0.4 for quick previews while editing")
+    ap.add_argument('--debounce', type=float, default=0.3, help="seconds a card must go unchanged before it renders")
+    args = ap.parse_args(argv)
+
+    root_dir = args.root_dir
+    resource_dir = args.resource_dir
+    out_dir = args.output_dir
+    if args.svg_cache is not None:
+        svg.enable_disk_cache(args.svg_cache)
+    if args.template_cache is not None:
+        template.enable_disk_cache(args.template_cache)
+
+    event_handler = CardRenderHandler(root_dir, resource_dir, out_dir, jobs=args.jobs, debounce=args.debounce,
+                                      output_options=output.options_from_args(args), scale=args.scale)
+    event_handler.build_index()
+
+    observer = Observer()
+    print(f"watching: {root_dir}")
+    observer.schedule(event_handler, root_dir)
+    print(f"watching: {resource_dir}")
+    observer.schedule(event_handler, resource_dir, recursive=True)
+    img_dir = os.path.join(root_dir, "img")
+    if os.path.isdir(img_dir):
+        print(f"watching: {img_dir}")
+        observer.schedule(event_handler, img_dir, recursive=True)
+    observer.start()
+
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        observer.stop()
+
+    observer.join()
+    event_handler.shutdown()
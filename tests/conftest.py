@@ -0,0 +1,12 @@
+import pytest
+
+from benchmarks import synthetic
+
+
+@pytest.fixture
+def corpus(tmp_path):
+    # The benchmark corpus: a workspace, its resource dir and the card files by kind.
+    try:
+        return synthetic.generate(str(tmp_path / "corpus"))
+    except FileNotFoundError as e:
+        pytest.skip(str(e))
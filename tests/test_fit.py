@@ -0,0 +1,53 @@
+import os.path
+from dataclasses import replace
+
+import pytest
+
+from pycardcon import render, util
+from pycardcon.text import parse
+
+
+@pytest.fixture
+def rules_region(corpus):
+    workspace, resource_dir, card_fns = corpus
+    card = util.read_card(os.path.join(workspace, card_fns['long_rules'][0]), resource_dir)
+    (text_region,) = [text_region for text_region in card.text_regions if text_region.name == "rules"]
+    return card, text_region, resource_dir
+
+
+def largest_fitting_size(card, text_region, card_size, resource_dir):
+    # Every size from the largest down, the way regions used to be fitted.
+    tokens = parse(text_region.text, resource_dir)
+    tr_w, tr_h = int(text_region.width*card_size[0]), text_region.height*card_size[1]
+    for fontsize in range(max(1, int(text_region.size*card_size[1])), 0, -1):
+        if render.layout_text_tokens(tokens, card, text_region, fontsize, tr_w, tr_h, resource_dir)[0]:
+            return fontsize
+    return 1
+
+
+@pytest.mark.parametrize("height_ratio", [1.0, 0.6, 0.3, 0.1, 0.001])
+def test_fit_picks_the_largest_size_that_fits(rules_region, height_ratio):
+    card, text_region, resource_dir = rules_region
+    text_region = replace(text_region, height=text_region.height*height_ratio)
+    card_size = (card.width, card.height)
+
+    fontsize, _, _, attempts = render.fit_text_region(card, text_region, card_size, resource_dir)
+    assert fontsize == largest_fitting_size(card, text_region, card_size, resource_dir)
+    max_fontsize = int(text_region.size*card_size[1])
+    assert attempts <= 1 + max_fontsize.bit_length()
+
+
+def test_region_is_painted_once_at_the_fitted_size(rules_region, monkeypatch):
+    card, text_region, resource_dir = rules_region
+    text_region = replace(text_region, height=text_region.height*0.3)
+    painted = []
+    paint_text_lines = render.paint_text_lines
+
+    def recording_paint_text_lines(text_image, lines, fontsize, *args, **kwargs):
+        painted.append(fontsize)
+        return paint_text_lines(text_image, lines, fontsize, *args, **kwargs)
+
+    monkeypatch.setattr(render, "paint_text_lines", recording_paint_text_lines)
+    _, fontsize, _, attempts = render.render_text_bitmap(card, text_region, (card.width, card.height), resource_dir)
+    assert attempts > 1
+    assert painted == [fontsize]
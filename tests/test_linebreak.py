@@ -0,0 +1,53 @@
+import pytest
+
+from pycardcon.errors import UnknownLineBreak
+from pycardcon.linebreak import balanced_lines, break_lines, greedy_lines
+
+
+def words(*widths):
+    # Words as layout_text_tokens measures them, a float width and the whole pixels it advances the line by.
+    return [{'width': width, 'advance': int(width)} for width in widths]
+
+
+def line_lengths(lines):
+    return [len(line) for line in lines]
+
+
+def test_greedy_fills_each_line_before_breaking():
+    assert line_lengths(greedy_lines(words(40, 40, 40, 40, 40), 100)) == [2, 2, 1]
+
+
+def test_greedy_breaks_on_float_width_against_integer_advances():
+    # 3 advances of 33 leave the fourth word starting at 99, so 99 + 1.0 fits and 99 + 1.5 doesn't.
+    assert line_lengths(greedy_lines(words(33.9, 33.9, 33.9, 1.0), 100)) == [4]
+    assert line_lengths(greedy_lines(words(33.9, 33.9, 33.9, 1.5), 100)) == [3, 1]
+
+
+def test_greedy_gives_an_overlong_first_word_an_empty_line_before_it():
+    assert line_lengths(greedy_lines(words(150, 10), 100)) == [0, 1, 1]
+
+
+def test_greedy_empty_paragraph_is_one_empty_line():
+    assert greedy_lines([], 100) == [[]]
+
+
+def test_balanced_evens_the_rag_without_adding_lines():
+    # Greedy leaves 20 and 50 at the ends of its first two lines, balanced leaves 30 and 40.
+    items = words(20, 50, 10, 50, 60)
+    assert line_lengths(greedy_lines(items, 100)) == [3, 1, 1]
+    assert line_lengths(balanced_lines(items, 100)) == [2, 2, 1]
+
+
+def test_balanced_keeps_every_word_in_order():
+    items = words(30, 70, 10, 55, 45, 20, 90, 5)
+    assert [item for line in balanced_lines(items, 100) for item in line] == items
+
+
+def test_unknown_method_raises():
+    with pytest.raises(UnknownLineBreak):
+        break_lines(words(10), 100, "balance")
+
+
+def test_balanced_skips_greedys_empty_line_before_an_overlong_first_word():
+    items = words(150, 10)
+    assert line_lengths(balanced_lines(items, 100)) == [1, 1]
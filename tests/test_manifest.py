@@ -0,0 +1,94 @@
+import json
+import os
+import os.path
+
+from PIL import Image
+
+from pycardcon import batch, manifest, render, util
+
+
+def render_all(corpus, output_dir, **kwargs):
+    workspace, resource_dir, _ = corpus
+    results = batch.render_all(workspace, resource_dir, str(output_dir), jobs=1, **kwargs)
+    assert all(result['error'] is None for result in results)
+    return {os.path.basename(result['card']): result['skipped'] for result in results}
+
+
+def card_deps(corpus):
+    workspace, resource_dir, _ = corpus
+    deps = {}
+    for card_path in batch.find_card_files(workspace, exclude_dirs=[resource_dir]):
+        card = util.read_card(card_path, resource_dir)
+        deps[os.path.basename(card_path)] = render.card_dependencies(card, workspace, resource_dir)
+    return deps
+
+
+def touch_content(path):
+    # New pixels, and a later mtime so the change is seen whatever the file system's timestamp resolution.
+    with Image.open(path) as img:
+        img.load()
+        changed = img.convert("RGBA")
+    changed.putpixel((0, 0), (1, 2, 3, 255))
+    changed.save(path)
+    stat = os.stat(path)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+
+
+def test_unchanged_cards_are_skipped(corpus, tmp_path):
+    output_dir = tmp_path / "cards"
+    assert not any(render_all(corpus, output_dir).values())
+    assert all(render_all(corpus, output_dir).values())
+
+
+def test_changed_dependency_rerenders_only_the_cards_using_it(corpus, tmp_path):
+    output_dir = tmp_path / "cards"
+    render_all(corpus, output_dir)
+
+    deps = card_deps(corpus)
+    shared = [dep for dep in set().union(*deps.values())
+              if dep.endswith(".png") and 0 < sum(dep in card_deps for card_deps in deps.values()) < len(deps)]
+    assert len(shared) > 0
+    changed_dep = sorted(shared)[0]
+    touch_content(changed_dep)
+
+    skipped = render_all(corpus, output_dir)
+    assert {card_fn for card_fn, was_skipped in skipped.items() if not was_skipped} == \
+           {card_fn for card_fn, dep_paths in deps.items() if changed_dep in dep_paths}
+
+
+def test_missing_output_is_rerendered(corpus, tmp_path):
+    output_dir = tmp_path / "cards"
+    render_all(corpus, output_dir)
+    workspace, resource_dir, card_fns = corpus
+    card = util.read_card(os.path.join(workspace, card_fns['vanilla'][0]), resource_dir)
+    os.remove(os.path.join(output_dir, render.card_output_fn(card)))
+
+    skipped = render_all(corpus, output_dir)
+    assert [card_fn for card_fn, was_skipped in skipped.items() if not was_skipped] == [card_fns['vanilla'][0]]
+
+
+def test_force_rerenders_everything(corpus, tmp_path):
+    output_dir = tmp_path / "cards"
+    render_all(corpus, output_dir)
+    assert not any(render_all(corpus, output_dir, force=True).values())
+
+
+def test_entries_of_deleted_and_renamed_cards_are_pruned(corpus, tmp_path):
+    output_dir = tmp_path / "cards"
+    render_all(corpus, output_dir)
+    workspace, resource_dir, card_fns = corpus
+
+    os.remove(os.path.join(workspace, card_fns['saga'][0]))
+    renamed_path = os.path.join(workspace, card_fns['vanilla'][0])
+    with open(renamed_path, 'rb') as card_f:
+        card = json.load(card_f)
+    card['data']['textRegions']['display-title']['text'] = "Renamed Bear"
+    with open(renamed_path, 'w') as card_f:
+        json.dump(card, card_f)
+    render_all(corpus, output_dir)
+
+    outputs = manifest.BuildManifest.for_output_dir(str(output_dir)).outputs
+    cards = [entry['card'] for entry in outputs.values()]
+    assert sorted(cards) == sorted(set(cards))
+    assert os.path.abspath(os.path.join(workspace, card_fns['saga'][0])) not in cards
+    assert os.path.abspath(os.path.join(output_dir, "Renamed Bear.png")) in outputs
@@ -0,0 +1,31 @@
+import os
+import stat
+
+from PIL import Image
+
+from pycardcon import output
+
+
+def file_mode(path):
+    return stat.S_IMODE(os.stat(path).st_mode)
+
+
+def test_written_images_get_the_umask_mode(tmp_path):
+    path = str(tmp_path / "card.png")
+    output.write_image(Image.new("RGBA", (8, 8), (255, 0, 0, 255)), path)
+    assert file_mode(path) == 0o666 & ~output.UMASK
+    assert os.listdir(tmp_path) == ["card.png"]
+
+
+def test_band_written_png_matches_and_gets_the_umask_mode(tmp_path):
+    img = Image.new("RGBA", (6, 5), (0, 0, 0, 0))
+    img.putpixel((2, 3), (10, 200, 30, 128))
+    path = str(tmp_path / "card.png")
+    writer = output.PngBandWriter(path, img.size)
+    writer.write_band(img.crop((0, 0, 6, 2)))
+    writer.write_band(img.crop((0, 2, 6, 5)))
+    writer.close()
+
+    with Image.open(path) as written:
+        assert written.tobytes() == img.tobytes()
+    assert file_mode(path) == 0o666 & ~output.UMASK
@@ -0,0 +1,21 @@
+import os.path
+
+import pytest
+from PIL import Image
+
+from pycardcon import pipeline, render, util
+
+
+@pytest.mark.parametrize("scale", [1.0, 0.5])
+def test_stream_renders_the_same_cards_as_render_card_image(corpus, tmp_path, scale):
+    workspace, resource_dir, card_fns = corpus
+    card_paths = [os.path.join(workspace, fns[0]) for fns in card_fns.values()]
+
+    results = list(pipeline.render_stream(card_paths, resource_dir, str(tmp_path), scale=scale))
+    assert [result['card'] for result in results] == card_paths
+    for result in results:
+        assert result['error'] is None
+        card = util.read_card(result['card'], resource_dir).scaled(scale)
+        assert os.path.basename(result['output']) == render.card_output_fn(card)
+        with Image.open(result['output']) as streamed:
+            assert streamed.tobytes() == render.render_card_image(card, workspace, resource_dir).tobytes()
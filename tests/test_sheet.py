@@ -0,0 +1,19 @@
+import os
+import stat
+
+import pytest
+from PIL import Image
+
+from pycardcon import output, sheet
+
+
+@pytest.mark.parametrize("sheet_fn", ["sheets.pdf", "sheets.tiff"])
+def test_sheet_files_get_the_umask_mode(tmp_path, sheet_fn):
+    path = str(tmp_path / sheet_fn)
+    writer = sheet.PdfSheetWriter(path, 72) if sheet_fn.endswith(".pdf") else sheet.TiffSheetWriter(path, 72)
+    writer.add_page(Image.new("RGB", (20, 30), (255, 255, 255)))
+    writer.add_page(Image.new("RGB", (20, 30), (0, 0, 0)))
+    writer.close()
+
+    assert stat.S_IMODE(os.stat(path).st_mode) == 0o666 & ~output.UMASK
+    assert os.listdir(tmp_path) == [sheet_fn]
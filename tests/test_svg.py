@@ -0,0 +1,43 @@
+import pytest
+
+from pycardcon import render, svg
+from pycardcon.cache import load_image_asset
+
+
+def write_svg(tmp_path, attributes, fn="test.svg"):
+    path = tmp_path / fn
+    path.write_text(f'<svg xmlns="http://www.w3.org/2000/svg" {attributes}>'
+                    '<rect width="100%" height="100%" fill="#000000"/></svg>')
+    return str(path)
+
+
+@pytest.mark.parametrize("attributes, size", [
+    ('width="60" height="32"', (60, 32)),
+    ('width="60px" height="32.7px" viewBox="0 0 10 10"', (60, 32)),
+    ('viewBox="0 0 48 24"', (48, 24)),
+    ('width="96" viewBox="0,0,48,24"', (96, 48)),
+    ('width="1in" height="72pt"', (96, 96)),
+    ('width="100%" height="100%" viewBox="0 0 30 40"', (30, 40)),
+])
+def test_svg_size_reads_the_svgs_own_size(tmp_path, attributes, size):
+    assert svg.svg_size(write_svg(tmp_path, attributes)) == size
+
+
+def test_svg_size_without_any_size_raises(tmp_path):
+    with pytest.raises(ValueError):
+        svg.svg_size(write_svg(tmp_path, ''))
+
+
+def test_svg_masks_are_rasterized_at_the_size_they_are_drawn_at(tmp_path, monkeypatch):
+    output_sizes = []
+    svg2png = svg.svg2png
+
+    def recording_svg2png(**kwargs):
+        output_sizes.append((kwargs.get('output_width'), kwargs.get('output_height')))
+        return svg2png(**kwargs)
+
+    monkeypatch.setattr(svg, "svg2png", recording_svg2png)
+    mask_fn = write_svg(tmp_path, 'width="60" height="32"', fn="mask.svg")
+    mask = load_image_asset(mask_fn, size=(150, 80), mode="RGBA", opener=render.read_maybe_svg_file)
+    assert mask.size == (150, 80)
+    assert output_sizes == [(150, 80)]
@@ -0,0 +1,92 @@
+import json
+import os
+
+import pytest
+
+from pycardcon.errors import UnknownSymbol
+from pycardcon.text import parse
+
+
+@pytest.fixture
+def resource_root(tmp_path):
+    os.makedirs(tmp_path / "manaSymbols")
+    return str(tmp_path)
+
+
+def symbol_path(resource_root, file_name):
+    return f"{resource_root}/manaSymbols/{file_name}"
+
+
+def shape(tokens):
+    # What the dict tokens of the old parse carried: the type, a str's text, the whitespace after it, and a
+    # symbol's sub type and svg.
+    return [(token.token_type, token.content if token.token_type == "str" else "", token.whitespace, token.sub_type,
+             token.path_to_img) for token in tokens]
+
+
+def test_parse_splits_text_like_the_old_parse(resource_root):
+    tokens = parse("{T}: Add {G}{G}.\nDraw a card.", resource_root)
+    assert shape(tokens) == [
+        ("symbol", "", "", "tap", symbol_path(resource_root, "t.svg")),
+        ("str", ":", " ", None, None),
+        ("str", "Add", " ", None, None),
+        ("symbol", "", "", "mana", symbol_path(resource_root, "g.svg")),
+        ("symbol", "", "", "mana", symbol_path(resource_root, "g.svg")),
+        ("str", ".", "", None, None),
+        ("newline", "", "", None, None),
+        ("str", "Draw", " ", None, None),
+        ("str", "a", " ", None, None),
+        ("str", "card.", " ", None, None),
+    ]
+
+
+def test_parse_commands_and_trailing_symbols(resource_root):
+    tokens = parse("When {cardname} dies, pay {X} {i}(reminder){/i}", resource_root)
+    assert [(token.token_type, token.content, token.whitespace, token.value) for token in tokens] == [
+        ("str", "When", " ", None),
+        ("card_meta", "display-title", " ", None),
+        ("str", "dies,", " ", None),
+        ("str", "pay", " ", None),
+        ("symbol", "X", " ", 0),
+        ("font_change", "italics", "", 1),
+        ("str", "(reminder)", "", None),
+        ("font_change", "italics", " ", 0),
+    ]
+
+
+def test_generic_numbers_map_to_their_svg(resource_root):
+    (token,) = parse("{10}", resource_root)
+    assert (token.sub_type, token.value, token.path_to_img) == ("numeral", 10, symbol_path(resource_root, "10.svg"))
+
+
+def test_hybrids_map_to_the_joined_svg(resource_root):
+    (token,) = parse("{W/U}", resource_root)
+    assert (token.sub_type, token.value, token.path_to_img) == ("hybrid", "W/U", symbol_path(resource_root, "wu.svg"))
+
+
+def test_any_word_with_an_svg_is_a_symbol(resource_root):
+    open(symbol_path(resource_root, "chaos.svg"), 'w').close()
+    (token,) = parse("{CHAOS}", resource_root)
+    assert token.path_to_img == symbol_path(resource_root, "chaos.svg")
+
+
+def test_manifest_symbols_aliases_and_reload(resource_root):
+    manifest_path = os.path.join(resource_root, "symbols.json")
+    with open(manifest_path, 'w') as manifest_f:
+        json.dump({"E": {"file": "energy.svg", "sub_type": "energy", "aliases": ["e"]}}, manifest_f)
+    for word in ("E", "e"):
+        (token,) = parse(f"{{{word}}}", resource_root)
+        assert (token.sub_type, token.path_to_img) == ("energy", symbol_path(resource_root, "energy.svg"))
+
+    with open(manifest_path, 'w') as manifest_f:
+        json.dump({"E": {"file": "e2.svg", "sub_type": "energy"}}, manifest_f)
+    stat = os.stat(manifest_path)
+    os.utime(manifest_path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+    (token,) = parse("{E}", resource_root)
+    assert token.path_to_img == symbol_path(resource_root, "e2.svg")
+
+
+def test_unknown_symbol_raises(resource_root):
+    with pytest.raises(UnknownSymbol) as raised:
+        parse("Pay {NOPE}.", resource_root)
+    assert raised.value.word == "NOPE"
@@ -0,0 +1,63 @@
+import json
+import os.path
+import threading
+
+from pycardcon.watch import CardRenderHandler, RenderScheduler
+
+
+def test_scheduler_keeps_rendering_after_render_fn_raises():
+    rendered = []
+    done = threading.Event()
+
+    def render_fn(card):
+        if card == "bad.json":
+            raise OSError("truncated art file")
+        rendered.append(card)
+        done.set()
+        return True
+
+    scheduler = RenderScheduler(render_fn, workers=1, debounce=0)
+    try:
+        scheduler.request("bad.json")
+        scheduler.request("good.json")
+        assert done.wait(5)
+    finally:
+        scheduler.shutdown()
+
+    assert rendered == ["good.json"]
+    assert scheduler.stats()['completed'] == 2
+    assert scheduler.queue_depth() == 0
+
+
+def test_handler_reports_unknown_line_break(corpus, tmp_path, capsys):
+    workspace, resource_dir, card_fns = corpus
+    card_path = os.path.join(workspace, card_fns['long_rules'][0])
+    with open(card_path, 'rb') as card_f:
+        card = json.load(card_f)
+    card['data']['textRegions']['rules']['lineBreak'] = "balance"
+    with open(card_path, 'w') as card_f:
+        json.dump(card, card_f)
+
+    output_dir = tmp_path / "cards"
+    output_dir.mkdir()
+    handler = CardRenderHandler(workspace, resource_dir, str(output_dir), jobs=1)
+    try:
+        assert handler.render_card(os.path.abspath(card_path)) is False
+    finally:
+        handler.shutdown()
+    assert "unknown line break" in capsys.readouterr().out
+
+
+def test_handler_writes_scaled_previews_beside_full_size_output(corpus, tmp_path):
+    workspace, resource_dir, card_fns = corpus
+    card_path = os.path.abspath(os.path.join(workspace, card_fns['vanilla'][0]))
+
+    output_dir = tmp_path / "cards"
+    output_dir.mkdir()
+    handler = CardRenderHandler(workspace, resource_dir, str(output_dir), jobs=1, scale=0.4)
+    try:
+        assert handler.render_card(card_path) is True
+    finally:
+        handler.shutdown()
+    written = os.listdir(output_dir)
+    assert len(written) == 1 and written[0].endswith("@0.4x.png")